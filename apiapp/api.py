@@ -1,24 +1,50 @@
-from ninja import NinjaAPI
-from .endpoints.recipes import router as recipe_router
-from .endpoints.ingredients import router as ingredient_router
-from .endpoints.images import router as image_router
+from django.http import HttpResponse
+from ninja import NinjaAPI, Router
+from . import metrics, response_cache
+from .endpoints import async_images, async_ingredients, async_recipes, images, ingredients, recipes
 from .utils.exceptions import global_exception_handler
+from .utils.renderers import ORJSONRenderer
 
-api = NinjaAPI(
-    title="Recipe API",
-    version="1.0.0",
-    description="Backend API for the Recipe app",
-)
 #    exception_handlers={Exception: global_exception_handler},
 #Global is working fine 
 # Register global exception handler
 #api.add_exception_handler(Exception, global_exception_handler)
 
-api.add_router("/recipes/", recipe_router, tags=["Recipes"])
-api.add_router("/ingredients/", ingredient_router, tags=["Ingredients"])
-api.add_router("/images/", image_router, tags=["Images"])
+system_router = Router(tags=["System"])
 
 # Optional: Add a health check route
-@api.get("/health", tags=["System"])
+@system_router.get("/health")
 def health_check(request):
-    return {"status": "ok", "message": "API running"}
\ No newline at end of file
+    return {"status": "ok", "message": "API running"}
+
+@system_router.get("/cache/stats")
+def cache_stats(request):
+    """Response cache hit/miss counters and local LRU usage for this process"""
+    return response_cache.stats()
+
+@system_router.get("/metrics", include_in_schema=False)
+def prometheus_metrics(request):
+    """Prometheus scrape target: request, database and thumbnail metrics (all workers in multiprocess mode)"""
+    return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+def create_api(recipe_router, ingredient_router, image_router, **kwargs) -> NinjaAPI:
+    api = NinjaAPI(
+        title="Recipe API",
+        version="1.0.0",
+        description="Backend API for the Recipe app",
+        renderer=ORJSONRenderer(),
+        **kwargs,
+    )
+    api.add_router("/recipes/", recipe_router, tags=["Recipes"])
+    api.add_router("/ingredients/", ingredient_router, tags=["Ingredients"])
+    api.add_router("/images/", image_router, tags=["Images"])
+    api.add_router("", system_router)
+    return api
+
+
+# Served by mainapp/urls.py (WSGI)
+api = create_api(recipes.router, ingredients.router, images.router)
+# Served by mainapp/urls_async.py (ASGI): the same endpoints with async handlers
+async_api = create_api(async_recipes.router, async_ingredients.router, async_images.router,
+                       urls_namespace="async-api-1.0.0")
@@ -0,0 +1,210 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.shortcuts import aget_object_or_404
+from ninja import Query, Router, File, UploadedFile
+from typing import List
+from ..models import Image, Recipe
+from ..schemas.Image import ImageUpdate
+from ..utils.utils import success, error
+from ..utils.batch import BatchError, in_request_order, parse_ids
+from ..schemas.responses import APISuccess, APIError
+from ..serializers import absolute_url_builder
+from .. import thumbnails, variants
+from ..signals import in_transaction
+from ..utils import uploads
+from ..utils.imaging import UnsupportedImage, offload, sniff_image
+from ..utils.http import IMMUTABLE, REVALIDATE, aread, not_modified, ranged_response
+from .images import (
+    base64_etag, base64_response, blob_validators, image_queryset, image_to_schema, new_image, release_uploaded_blobs,
+    save_uploaded_image, too_large, upload_error, variant_error, variant_response,
+)
+
+# Async twin of images.py, served under ASGI (see api.async_api); same paths and responses.
+# Validation and response building are images.py's helpers; only the reads here are async.
+router = Router()
+
+
+# List all images
+@router.get("/", response={200: APISuccess, 400: APIError})
+async def list_images(request):
+    images = image_queryset()
+    base_url = absolute_url_builder(request)
+    try:
+        schemas = [image_to_schema(request, i, base_url).dict() async for i in images]
+    except Exception as e:
+        return error("Error generating image schemas", 500, details=str(e))
+
+    return success(schemas, 200)
+
+
+# List images by recipe
+@router.get("/recipes/{recipe_id}/images/", response={200: APISuccess, 404: APIError})
+async def list_recipe_images(request, recipe_id: int):
+    imgs = image_queryset(recipe_id)
+    base_url = absolute_url_builder(request)
+    try:
+        schemas = [image_to_schema(request, i, base_url).dict() async for i in imgs]
+    except Exception as e:
+        return error("Error generating image schemas", 500, details=str(e))
+
+    return success(schemas, 200)
+
+
+# Get metadata of several images by id (see images.batch_images)
+@router.get("/batch", response={200: APISuccess, 400: APIError})
+async def batch_images(request, ids: List[str] = Query(...)):
+    try:
+        ids = parse_ids(ids)
+    except BatchError as e:
+        return error(str(e), 400)
+    base_url = absolute_url_builder(request)
+    try:
+        found = {i.id: image_to_schema(request, i, base_url).dict()
+                 async for i in Image.objects.metadata().filter(id__in=ids)}
+    except Exception as e:
+        return error("Error generating image schemas", 500, details=str(e))
+
+    return success(in_request_order(ids, found), 200)
+
+
+# Get image metadata by id
+@router.get("/{image_id}", response={200: APISuccess, 404: APIError})
+async def get_image_metadata(request, image_id: int):
+    img = await aget_object_or_404(Image.objects.metadata(), id=image_id)
+    try:
+        schema = image_to_schema(request, img)
+    except Exception as e:
+        return error("Error generating image schema", 500, details=str(e))
+
+    return success(schema.dict(), 200)
+
+
+async def blob_response(request, img: Image, kind: str, content_type: str):
+    """
+    images.blob_response() with the body as an async iterator: a slow client holds a coroutine,
+    not a thread, and filesystem chunks are read off the event loop.
+    """
+    etag, cached = blob_validators(request, img, kind)
+    if cached is not None:
+        return cached
+    fh = await img.aopen_blob(kind)
+    return ranged_response(request, fh, content_type, etag, img.created_at,
+                           IMMUTABLE if etag else REVALIDATE, asynchronous=True)
+
+
+# Serve raw image bytes
+@router.get("/{image_id}/raw/")
+async def get_image_raw(request, image_id: int):
+    img = await aget_object_or_404(Image.objects.metadata(), id=image_id)
+    if not img.has_data:
+        return HttpResponse(status=404)
+    return await blob_response(request, img, "data", img.content_type)
+
+
+# Serve thumbnail bytes
+@router.get("/{image_id}/thumb/")
+async def get_image_thumbnail(request, image_id: int):
+    img = await aget_object_or_404(Image.objects.metadata(), id=image_id)
+    if img.has_thumbnail:
+        return await blob_response(request, img, "thumbnail", img.thumbnail_content_type)
+    return HttpResponse(status=404)
+
+
+# Serve a resized/re-encoded variant, rendered on first request and then persisted + cached
+@router.get("/{image_id}/v/{width}.{fmt}")
+async def get_image_variant(request, image_id: int, width: int, fmt: str):
+    refused = variant_error(width, fmt)
+    if refused is not None:
+        return refused
+
+    try:
+        variant = await variants.aget_variant(image_id, width, fmt)
+    except Exception as e:
+        return error("Error rendering image variant", 500, details=str(e))
+    return variant_response(request, variant)
+
+
+# Return base64 (optional, mostly for testing or quick frontend previews)
+@router.get("/{image_id}/base64/", response={200: APISuccess, 400: APIError})
+async def get_image_base64(request, image_id: int):
+    img = await aget_object_or_404(Image.objects.metadata(), id=image_id)
+    etag = base64_etag(img)
+    cached = not_modified(request, etag)
+    if cached is not None:
+        return cached
+
+    try:
+        with await img.aopen_blob("data") as fh:
+            data = await aread(fh)
+    except Exception as e:
+        return error("Error encoding image to base64", 500, details=str(e))
+
+    return base64_response(img, data, etag)
+
+
+# Upload image
+@router.post("/recipes/{recipe_id}/images/", response={200: APISuccess, 400: APIError, 413: APIError})
+async def upload_image(request, recipe_id: int, file: UploadedFile = File(...)):
+    recipe = await aget_object_or_404(Recipe, pk=recipe_id)
+    refused = upload_error(request, file)
+    if refused is not None:
+        return refused
+
+    # Only the header is read here; bombs and non-images are refused before any decode
+    try:
+        content_type, width, height = await offload(sniff_image, file.file)
+    except UnsupportedImage as e:
+        return error(str(e), 400)
+
+    img = new_image(recipe, file, content_type, width, height)
+    try:
+        # Hashed and written to the blob store chunk by chunk, off the event loop
+        img.size = await asyncio.to_thread(img.set_blob_stream, "data", uploads.bounded_chunks(file))
+    except ValueError:
+        return too_large()
+
+    if not thumbnails.queue_enabled():
+        await offload(thumbnails.attach_thumbnail, img)
+    try:
+        await sync_to_async(save_uploaded_image)(img)
+    except Exception as e:
+        await sync_to_async(release_uploaded_blobs)(img)
+        return error("Database error while saving image", 500, details=str(e))
+
+    schema = image_to_schema(request, img)
+    return success(schema.dict(), 201)
+
+
+# Update image metadata
+@router.put("/{image_id}", response={200: APISuccess, 400: APIError, 404: APIError})
+async def update_image(request, image_id: int, data: ImageUpdate):
+    # Deferred blobs are left out of the UPDATE as well as the SELECT
+    img = await aget_object_or_404(Image.objects.metadata(), id=image_id)
+
+    if data.filename is not None:
+        img.filename = data.filename
+
+    if data.recipe_id is not None:
+        img.recipe = await aget_object_or_404(Recipe, id=data.recipe_id)
+
+    try:
+        await sync_to_async(in_transaction)(img.save)
+        schema = image_to_schema(request, img)
+    except Exception as e:
+        return error("Database error while updating image", 500, details=str(e))
+
+    return success(schema.dict(), 200)
+
+
+# Delete image
+@router.delete("/{image_id}", response={200: APISuccess, 404: APIError, 500: APIError})
+async def delete_image(request, image_id: int):
+    img = await aget_object_or_404(Image.objects.metadata(), id=image_id)
+    try:
+        await img.adelete()
+    except Exception as e:
+        return error("Database error while deleting image", 500, details=str(e))
+
+    return success({"message": "Image deleted"}, 200)
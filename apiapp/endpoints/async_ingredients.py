@@ -0,0 +1,76 @@
+from asgiref.sync import sync_to_async
+from django.shortcuts import aget_object_or_404
+from ninja import Query, Router
+from typing import List
+from ..models import Ingredient, Recipe
+from ..schemas.Ingredient import IngredientCreate
+from ..utils.utils import success, error
+from ..utils.batch import BatchError, in_request_order, parse_ids
+from ..schemas.responses import APISuccess, APIError
+from ..signals import in_transaction
+from .ingredients import ingredient_queryset, ingredient_to_schemas, update_fields
+
+# Async twin of ingredients.py, served under ASGI (see api.async_api)
+router = Router()
+
+# Get several ingredients by id (see ingredients.batch_ingredients)
+@router.get("/batch", response={200: APISuccess, 400: APIError})
+async def batch_ingredients(request, ids: List[str] = Query(...)):
+    try:
+        ids = parse_ids(ids)
+    except BatchError as e:
+        return error(str(e), 400)
+    found = {i.id: ingredient_to_schemas(request, i).dict() async for i in Ingredient.objects.filter(id__in=ids)}
+    return success(in_request_order(ids, found), 200)
+
+# Get a single ingredient
+@router.get("/{ingredient_id}", response={200: APISuccess, 404: APIError})
+async def get_ingredient(request, ingredient_id: int):
+    try:
+        ingredient = await aget_object_or_404(Ingredient, id=ingredient_id)
+        schema = ingredient_to_schemas(request, ingredient)
+        return success(schema.dict(), 200)
+    except Exception as e:
+        return error("Ingredient not found", 404, details=str(e))
+
+# List all ingredients or filter by recipe
+@router.get("/", response={200: APISuccess, 400: APIError})
+async def list_ingredients(request, recipe_id: int = None):
+    try:
+        schemas = [ingredient_to_schemas(request, i).dict() async for i in ingredient_queryset(recipe_id)]
+        return success(schemas, 200)
+    except Exception as e:
+        return error("Error retrieving ingredients", 500, details=str(e))
+
+# Create a new ingredient for a recipe
+@router.post("/recipes/{recipe_id}", response={201: APISuccess, 400: APIError, 500: APIError})
+async def create_ingredient(request, recipe_id: int, data: IngredientCreate):
+    recipe = await aget_object_or_404(Recipe, id=recipe_id)
+    try:
+        ingredient = await sync_to_async(in_transaction)(Ingredient.objects.create, recipe=recipe, **data.dict())
+        schema = ingredient_to_schemas(request, ingredient)
+        return success(schema.dict(), 201)
+    except Exception as e:
+        return error("Error creating ingredient", 500, details=str(e))
+
+# Update an existing ingredient
+@router.put("/{ingredient_id}", response={200: APISuccess, 400: APIError, 404: APIError, 500: APIError})
+async def update_ingredient(request, ingredient_id: int, data: IngredientCreate):
+    ingredient = await aget_object_or_404(Ingredient, id=ingredient_id)
+    try:
+        update_fields(ingredient, data)
+        await sync_to_async(in_transaction)(ingredient.save)
+        schema = ingredient_to_schemas(request, ingredient)
+        return success(schema.dict(), 200)
+    except Exception as e:
+        return error("Error updating ingredient", 500, details=str(e))
+
+# Delete an ingredient
+@router.delete("/{ingredient_id}", response={200: APISuccess, 404: APIError, 500: APIError})
+async def delete_ingredient(request, ingredient_id: int):
+    ingredient = await aget_object_or_404(Ingredient, id=ingredient_id)
+    try:
+        await ingredient.adelete()
+        return success({"message": "Ingredient deleted"}, 200)
+    except Exception as e:
+        return error("Error deleting ingredient", 500, details=str(e))
@@ -0,0 +1,299 @@
+import asyncio
+import zlib
+
+from asgiref.sync import sync_to_async
+from django.http import Http404
+from django.shortcuts import aget_object_or_404
+from ninja import Query, Router
+from typing import List, Optional
+
+from ..schemas.Image import ImageCreate
+from ..schemas.Ingredient import IngredientCreate
+from ..schemas.Recipe import RecipeCreate, RecipeFilters
+from ..schemas.ShoppingList import ShoppingListRequest
+from ..utils.utils import success, error
+from ..utils.batch import BatchError, in_request_order
+from ..utils.pagination import PaginationError, akeyset_page, aoffset_page
+from ..utils.http import not_modified, set_cache_headers
+from ..schemas.responses import APISuccess, APIError
+from .images import image_to_schema
+from .ingredients import ingredient_to_schemas
+from .recipes import (
+    EXPORT_CHUNK_SIZE, RECIPE_SORT_KEYS, batch_request, detail_query, export_line, export_request, export_response,
+    import_format, import_response, list_request, page_etag, pantry_match, pantry_page, pantry_rows, pantry_window,
+    recipe_etag, recipe_queryset, recipe_to_schema, search_request, update_fields, with_extra,
+)
+from ..models import Image, Ingredient, Recipe
+from ..serializers import FieldsetError, absolute_url_builder, arecipe_documents, parse_fieldset
+from ..read_model import astored_documents, astored_documents_by_id
+from ..response_cache import alist_version, cached_response, list_versions, recipe_versions
+from .. import importer, search, shopping
+from ..filters import afacet_counts
+from ..signals import in_transaction
+from ..importer import DEFAULT_BATCH_SIZE, create_recipes
+
+# Async twin of recipes.py, served under ASGI (see api.async_api); same paths, responses and headers.
+# Request parsing, ETags and response building are recipes.py's own helpers; only the reads differ,
+# going through the async ORM. Multi-statement writes keep their transaction and run on a thread.
+router = Router()
+
+async def apage_documents(request, rows, fieldset, extra=()):
+    """recipes.page_documents() with the async ORM"""
+    if fieldset is None:
+        return await astored_documents(request, rows, extra)
+    return with_extra(await arecipe_documents(request, rows, fieldset), rows, extra)
+
+async def adocuments_by_id(request, rows, fieldset) -> dict:
+    """recipes.documents_by_id() with the async ORM"""
+    rows = [row async for row in rows]
+    if fieldset is None:
+        return await astored_documents_by_id(request, rows)
+    return {document["id"]: document for document in await arecipe_documents(request, rows, fieldset)}
+
+#------------ Recipe CRUD --------------------
+@router.post("/", response={201: APISuccess, 400: APIError, 500: APIError})
+async def create_recipe(request, data: RecipeCreate):
+    try:
+        [(recipe, ingredients, images)] = await sync_to_async(create_recipes)([data])
+        schema = recipe_to_schema(request, recipe, ingredients, images)
+        return success(schema.dict(), 201)
+    except Exception as e:
+        return error("Error creating recipe", 500, details=str(e))
+
+@router.post("/import", response={200: APISuccess, 400: APIError, 500: APIError})
+async def import_recipes(request, format: Optional[str] = None, batch_size: int = DEFAULT_BATCH_SIZE):
+    """Bulk import (see recipes.import_recipes); parsing and the batched INSERTs run on a thread"""
+    try:
+        fmt = import_format(request, format, batch_size)
+    except ValueError as e:
+        return error(str(e), 400)
+    return import_response(await sync_to_async(importer.import_recipes)(request, fmt, batch_size))
+
+@router.get("/", response={200: APISuccess, 400: APIError})
+@cached_response("list", list_versions)
+async def list_recipes(request, filters: Query[RecipeFilters], page: int = 1, page_size: int = 10, sort: str = "id",
+                       mode: str = "offset", cursor: Optional[str] = None, include_total: Optional[bool] = None,
+                       facets: bool = False, fields: Optional[str] = None, include: Optional[str] = None):
+    """Offset or cursor pages of recipes, with optional facet counts (see recipes.list_recipes)"""
+    try:
+        fieldset, recipes, keyset = list_request(filters, sort, mode, cursor, fields, include)
+        if keyset:
+            result = await akeyset_page(recipes, sort, RECIPE_SORT_KEYS, page_size, cursor,
+                                        include_total=bool(include_total))
+        else:
+            result = await aoffset_page(recipes, page, page_size, include_total=include_total is not False)
+    except (FieldsetError, PaginationError) as e:
+        return error(str(e), 400)
+
+    rows = result.pop("rows")
+    if facets:
+        result["facets"] = await afacet_counts(Recipe.objects.all(), filters)
+    etag = page_etag(request, rows, await alist_version())
+    cached = not_modified(request, etag)
+    if cached is not None:
+        return cached
+
+    try:
+        result["items"] = await apage_documents(request, rows, fieldset)
+    except Exception as e:
+        return error("Error generating recipe schemas", 500, details=str(e))
+
+    return set_cache_headers(success(result, status_code=200), etag)
+
+async def buffered(lines, size=64 * 1024):
+    """Group small lines into ~64 KiB writes"""
+    block = []
+    pending = 0
+    async for line in lines:
+        block.append(line)
+        pending += len(line)
+        if pending >= size:
+            yield b"".join(block)
+            block, pending = [], 0
+    if block:
+        yield b"".join(block)
+
+async def gzip_stream(lines):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31: gzip container
+    async for block in buffered(lines):
+        # zlib releases the GIL; compressing 64 KiB takes long enough to be worth moving off the loop
+        out = await asyncio.to_thread(compressor.compress, block)
+        if out:
+            yield out
+    yield compressor.flush()
+
+@router.get("/export")
+async def export_recipes(request, filters: Query[RecipeFilters], sort: str = "id", gzip: bool = False,
+                         chunk_size: int = EXPORT_CHUNK_SIZE, fields: Optional[str] = None,
+                         include: Optional[str] = None):
+    """
+    Stream the whole catalog as NDJSON (see recipes.export_recipes). The body is an async
+    iterator, so a slow client ties up no thread while it drains the export.
+    """
+    try:
+        fieldset, recipes, chunk_size = export_request(filters, sort, chunk_size, fields, include)
+    except (FieldsetError, PaginationError) as e:
+        return error(str(e), 400)
+    rows = recipes.aiterator(chunk_size=chunk_size)
+
+    async def chunk_lines(chunk):
+        return [export_line(document, fieldset) for document in await apage_documents(request, chunk, fieldset)]
+
+    async def lines():
+        chunk = []
+        async for row in rows:
+            chunk.append(row)
+            if len(chunk) == chunk_size:
+                for line in await chunk_lines(chunk):
+                    yield line
+                chunk = []
+        for line in await chunk_lines(chunk):
+            yield line
+
+    return export_response(gzip_stream(lines()) if gzip else buffered(lines()), gzip)
+
+@router.get("/search", response={200: APISuccess, 400: APIError, 501: APIError})
+@cached_response("search", list_versions)
+async def search_recipes(request, q: str, filters: Query[RecipeFilters], page: int = 1, page_size: int = 10,
+                         include_total: bool = False, fields: Optional[str] = None, include: Optional[str] = None):
+    """Ranked full-text search (see recipes.search_recipes)"""
+    if not search.tokenize(q):
+        return error("q must contain at least one word", 400)
+    try:
+        fieldset, recipes = search_request(q, filters, fields, include)
+        result = await aoffset_page(recipes, page, page_size, include_total=include_total)
+    except (FieldsetError, PaginationError) as e:
+        return error(str(e), 400)
+    except search.SearchUnavailable as e:
+        return error(str(e), 501)
+
+    rows = result.pop("rows")
+    etag = page_etag(request, rows, await alist_version())
+    cached = not_modified(request, etag)
+    if cached is not None:
+        return cached
+
+    try:
+        result["items"] = await apage_documents(request, rows, fieldset, extra=("rank",))
+    except Exception as e:
+        return error("Error generating recipe schemas", 500, details=str(e))
+
+    return set_cache_headers(success(result, status_code=200), etag)
+
+@router.get("/pantry", response={200: APISuccess, 400: APIError})
+async def pantry_recipes(request, have: List[str] = Query(...), max_missing: int = 2,
+                         page: int = 1, page_size: int = 10):
+    """"Cook with what I have" (see recipes.pantry_recipes); matching runs on a thread, off the loop"""
+    try:
+        page_size, offset = pantry_window(have, max_missing, page, page_size)
+    except PaginationError as e:
+        return error(str(e), 400)
+
+    result = await sync_to_async(pantry_match)(have, max_missing, offset, page_size)
+    rows = [row async for row in pantry_rows(result, page_size)]
+    documents = {document["id"]: document for document in await arecipe_documents(request, rows)}
+    return success(pantry_page(have, result, documents, page, page_size), 200)
+
+@router.post("/shopping-list", response={200: APISuccess})
+async def shopping_list(request, data: ShoppingListRequest):
+    """Consolidated shopping list for a meal plan (see recipes.shopping_list)"""
+    return success(await sync_to_async(shopping.shopping_list)(data.recipes), 200)
+
+@router.get("/batch", response={200: APISuccess, 400: APIError})
+async def batch_recipes(request, ids: List[str] = Query(...), fields: Optional[str] = None,
+                        include: Optional[str] = None):
+    """Several recipes by id, in request order (see recipes.batch_recipes)"""
+    try:
+        ids, fieldset, rows = batch_request(ids, fields, include)
+    except (BatchError, FieldsetError) as e:
+        return error(str(e), 400)
+    try:
+        found = await adocuments_by_id(request, rows, fieldset)
+    except Exception as e:
+        return error("Error generating recipe schemas", 500, details=str(e))
+    return success(in_request_order(ids, found), 200)
+
+@router.get("/{recipe_id}", response={200: APISuccess, 404: APIError})
+@cached_response("recipe", recipe_versions)
+async def get_recipe(request, recipe_id: int, fields: Optional[str] = None, include: Optional[str] = None):
+    try:
+        fieldset = parse_fieldset(fields, include)
+    except FieldsetError as e:
+        return error(str(e), 400)
+    row = await detail_query(recipe_id, fieldset).afirst()
+    if row is None:
+        raise Http404("No Recipe matches the given query.")
+    updated_at = row["updated_at"]
+    etag = recipe_etag(request, row["id"], updated_at.timestamp())
+    cached = not_modified(request, etag, updated_at)
+    if cached is not None:
+        return cached
+
+    try:
+        documents = await apage_documents(request, [row], fieldset)
+    except Exception as e:
+        return error("Error generating recipe schema", 500, details=str(e))
+    if not documents:
+        raise Http404("No Recipe matches the given query.")
+    return set_cache_headers(success(documents[0], 200), etag, updated_at)
+
+@router.put("/{recipe_id}", response={200: APISuccess, 400: APIError, 404: APIError, 500: APIError})
+async def update_recipe(request, recipe_id: int, data: RecipeCreate):
+    recipe = await aget_object_or_404(recipe_queryset(), id=recipe_id)
+    try:
+        update_fields(recipe, data)
+        await sync_to_async(in_transaction)(recipe.save)
+        schema = recipe_to_schema(request, recipe)
+        return success(schema.dict(), 200)
+    except Exception as e:
+        return error("Error updating recipe", 500, details=str(e))
+
+@router.delete("/{recipe_id}", response={200: APISuccess, 404: APIError, 500: APIError})
+async def delete_recipe(request, recipe_id: int):
+    recipe = await aget_object_or_404(Recipe, id=recipe_id)
+    try:
+        await recipe.adelete()
+    except Exception as e:
+        return error("Error deleting recipe", 500, details=str(e))
+    return success({"success": True}, 200)
+
+#related images
+@router.post("/{recipe_id}/images", response={201: APISuccess, 400: APIError, 500: APIError})
+async def add_image(request, recipe_id: int, image: ImageCreate):
+    recipe = await aget_object_or_404(Recipe, id=recipe_id)
+    try:
+        img = await sync_to_async(in_transaction)(Image.objects.create, recipe=recipe, **image.dict())
+        schema = image_to_schema(request, img)
+        return success(schema.dict(), 201)
+    except Exception as e:
+        return error("Error adding image", 500, details=str(e))
+
+@router.get("/{recipe_id}/images", response={200: APISuccess, 404: APIError})
+async def list_images_for_recipe(request, recipe_id: int):
+    recipe = await aget_object_or_404(Recipe, id=recipe_id)
+    try:
+        base_url = absolute_url_builder(request)
+        schemas = [image_to_schema(request, img, base_url).dict() async for img in recipe.images.metadata()]
+        return success(schemas, 200)
+    except Exception as e:
+        return error("Error retrieving images", 500, details=str(e))
+
+#related ingredients
+@router.post("/{recipe_id}/ingredients", response={201: APISuccess, 400: APIError, 500: APIError})
+async def add_ingredient(request, recipe_id: int, ingredient: IngredientCreate):
+    recipe = await aget_object_or_404(Recipe, id=recipe_id)
+    try:
+        ing = await sync_to_async(in_transaction)(Ingredient.objects.create, recipe=recipe, **ingredient.dict())
+        schema = ingredient_to_schemas(request, ing)
+        return success(schema.dict(), 201)
+    except Exception as e:
+        return error("Error adding ingredient", 500, details=str(e))
+
+@router.get("/{recipe_id}/ingredients",response={200: APISuccess, 404: APIError})
+async def list_ingredients_for_recipe(request, recipe_id: int):
+    recipe = await aget_object_or_404(Recipe, id=recipe_id)
+    try:
+        schemas = [ingredient_to_schemas(request, ing).dict() async for ing in recipe.ingredients.all()]
+        return success(schemas, 200)
+    except Exception as e:
+        return error("Error retrieving ingredients", 500, details=str(e))
@@ -1,48 +1,127 @@
-import io
+from django.db import transaction
 from django.shortcuts import get_object_or_404
-from ninja import Router, File, UploadedFile
+from ninja import Query, Router, File, UploadedFile
 from typing import List, Optional
-from ..models import Image, Recipe
+from ..models import THUMBNAIL_PENDING, Image, Recipe
 from ..schemas.Image import ImageRead, ImageUpdate
-from PIL import Image as PILImage
 from ..utils.utils import success, error
+from ..utils.batch import BatchError, in_request_order, parse_ids
 from ..schemas.responses import APISuccess, APIError
+from ..serializers import absolute_url_builder
 from django.http import HttpResponse
+from .. import storage, thumbnails, variants
+from ..signals import in_transaction, release_blob
+from ..utils import uploads
+from ..utils.imaging import UnsupportedImage, sniff_image
+from ..utils.http import IMMUTABLE, REVALIDATE, not_modified, ranged_response, set_cache_headers, strong_etag
 import base64
+import hashlib
 
 router = Router()
 
-MAX_UPLOAD_BYTES = 2 * 1024 * 1024  # 10 MB max file size
+# Enforced while the body is parsed by MaxSizeUploadHandler (settings.FILE_UPLOAD_HANDLERS)
+MAX_UPLOAD_BYTES = uploads.MAX_UPLOAD_BYTES
 
 
-def make_thumbnail(image_bytes, size=(300, 300), fmt="JPEG"):
-    """Return thumbnail bytes and content_type"""
-    img = PILImage.open(io.BytesIO(image_bytes))
-    img.thumbnail(size)
-    out = io.BytesIO()
-    img.save(out, fmt)
-    return out.getvalue(), f"image/{fmt.lower()}"
-
-
-def image_to_schema(request, img: Image) -> ImageRead:
-    """Helper to convert Image model to Pydantic schema with URLs"""
-    base_url = request.build_absolute_uri
+def image_to_schema(request, img: Image, base_url=None) -> ImageRead:
+    """
+    Helper to convert Image model to Pydantic schema with URLs.
+    Callers rendering many images pass one absolute_url_builder(request) for all of them.
+    """
+    base_url = base_url or absolute_url_builder(request)
     return ImageRead(
         id=img.id,
         filename=img.filename,
         size=img.size,
         content_type=img.content_type, 
-        url=base_url(f"/api/images/{img.id}/raw/") if img.data else None,
-        thumbnail_url=base_url(f"/api/images/{img.id}/thumb/") if img.thumbnail else None,
+        url=base_url(f"/api/images/{img.id}/raw/") if img.has_data else None,
+        thumbnail_url=base_url(f"/api/images/{img.id}/thumb/") if img.has_thumbnail else None,
+        thumbnail_status=img.thumbnail_status,
+        srcset=variants.srcset(base_url, img.id, img.width) if img.has_data else None,
+    )
+
+
+# Queries, validators and response building shared with the async twins in async_images.py,
+# which differ only in how they read rows and blobs
+
+def image_queryset(recipe_id=None):
+    """Image metadata (no blobs), newest first, optionally of one recipe"""
+    images = Image.objects.metadata()
+    if recipe_id is not None:
+        images = images.filter(recipe_id=recipe_id)
+    return images.order_by("-created_at")
+
+
+def blob_validators(request, img: Image, kind: str):
+    """(ETag, 304 response or None) for a blob: its content digest is a strong ETag"""
+    digest = img.sha256 if kind == "data" else img.thumbnail_sha256
+    etag = strong_etag(digest) if digest else None
+    return etag, not_modified(request, etag, img.created_at, IMMUTABLE)
+
+
+def variant_error(width: int, fmt: str):
+    """404 response for a variant that is never rendered, else None"""
+    if not variants.is_allowed(width, fmt):
+        return error(f"Unsupported variant; widths {list(variants.VARIANT_WIDTHS)}, formats webp/jpeg/png", 404)
+    return None
+
+
+def variant_response(request, variant):
+    """Response for variants.get_variant()'s (payload, content type, digest), or None"""
+    if variant is None:
+        return HttpResponse(status=404)
+    payload, content_type, digest = variant
+    etag = strong_etag(digest)
+    cached = not_modified(request, etag, cache_control=IMMUTABLE)
+    if cached is not None:
+        return cached
+    return set_cache_headers(HttpResponse(payload, content_type=content_type), etag, cache_control=IMMUTABLE)
+
+
+def base64_etag(img: Image):
+    # The filename is part of the payload and can be renamed, so it goes into the validator too
+    return strong_etag(f"{img.sha256}-{hashlib.md5(img.filename.encode()).hexdigest()[:8]}") if img.sha256 else None
+
+
+def base64_response(img: Image, data: bytes, etag):
+    b64 = base64.b64encode(data).decode("ascii")
+    response = success({"id": img.id, "filename": img.filename, "data": f"data:{img.content_type};base64,{b64}", }, 200)
+    return set_cache_headers(response, etag)
+
+
+def too_large():
+    return error("File too large", 413, details={"max_bytes": MAX_UPLOAD_BYTES})
+
+
+def upload_error(request, file: UploadedFile):
+    """Error response for an upload refused before its header is even sniffed, else None"""
+    # Oversized bodies were already discarded chunk by chunk while parsing
+    if uploads.is_too_large(request, file):
+        return too_large()
+    if not file.size:
+        return error("Empty file", 400)
+    return None
+
+
+def new_image(recipe: Recipe, file: UploadedFile, content_type: str, width: int, height: int) -> Image:
+    """The unsaved Image for an upload whose header sniff_image() accepted"""
+    return Image(
+        recipe=recipe,
+        filename=file.name,
+        content_type=content_type,
+        width=width,
+        height=height,
+        storage=storage.default_backend(),
     )
 
 
 # List all images
 @router.get("/", response={200: APISuccess, 400: APIError})
 def list_images(request):
-    images = Image.objects.all().order_by("-created_at")
+    images = image_queryset()
+    base_url = absolute_url_builder(request)
     try:
-        schemas = [image_to_schema(request, i).dict() for i in images]
+        schemas = [image_to_schema(request, i, base_url).dict() for i in images]
     except Exception as e:
         return error("Error generating image schemas", 500, details=str(e))
     
@@ -52,19 +131,37 @@ def list_images(request):
 # List images by recipe
 @router.get("/recipes/{recipe_id}/images/", response={200: APISuccess, 404: APIError})
 def list_recipe_images(request, recipe_id: int):
-    imgs = Image.objects.filter(recipe_id=recipe_id).order_by("-created_at")
+    imgs = image_queryset(recipe_id)
+    base_url = absolute_url_builder(request)
     try:
-        schemas = [image_to_schema(request, i).dict() for i in imgs]
+        schemas = [image_to_schema(request, i, base_url).dict() for i in imgs]
     except Exception as e:
         return error("Error generating image schemas", 500, details=str(e))
     
     return success(schemas, 200)
 
 
+# Get metadata of several images by id, in request order, with a marker for the ones not found
+@router.get("/batch", response={200: APISuccess, 400: APIError})
+def batch_images(request, ids: List[str] = Query(...)):
+    try:
+        ids = parse_ids(ids)
+    except BatchError as e:
+        return error(str(e), 400)
+    base_url = absolute_url_builder(request)
+    try:
+        found = {i.id: image_to_schema(request, i, base_url).dict()
+                 for i in Image.objects.metadata().filter(id__in=ids)}
+    except Exception as e:
+        return error("Error generating image schemas", 500, details=str(e))
+
+    return success(in_request_order(ids, found), 200)
+
+
 # Get image metadata by id
 @router.get("/{image_id}", response={200: APISuccess, 404: APIError})
 def get_image_metadata(request, image_id: int):
-    img = get_object_or_404(Image, id=image_id)
+    img = get_object_or_404(Image.objects.metadata(), id=image_id)
     try:
         schema = image_to_schema(request, img)
     except Exception as e:
@@ -73,64 +170,122 @@ def get_image_metadata(request, image_id: int):
     return success(schema.dict(), 200)
 
 
+def blob_response(request, img: Image, kind: str, content_type: str):
+    """
+    Stream a blob; filesystem blobs go out via the server's file wrapper (sendfile) without buffering,
+    and Range requests seek in the underlying file.
+    The content digest is a strong ETag, checked before any bytes are touched.
+    """
+    etag, cached = blob_validators(request, img, kind)
+    if cached is not None:
+        return cached
+    return ranged_response(request, img.open_blob(kind), content_type, etag, img.created_at,
+                           IMMUTABLE if etag else REVALIDATE)
+
+
 # Serve raw image bytes
 @router.get("/{image_id}/raw/")
 def get_image_raw(request, image_id: int):
-    img = get_object_or_404(Image, id=image_id)
-    return HttpResponse(img.data, content_type=img.content_type)
+    img = get_object_or_404(Image.objects.metadata(), id=image_id)
+    if not img.has_data:
+        return HttpResponse(status=404)
+    return blob_response(request, img, "data", img.content_type)
 
 
 # Serve thumbnail bytes
 @router.get("/{image_id}/thumb/")
 def get_image_thumbnail(request, image_id: int):
-    img = get_object_or_404(Image, id=image_id)
-    if img.thumbnail:
-        return HttpResponse(img.thumbnail, content_type=img.thumbnail_content_type)
+    img = get_object_or_404(Image.objects.metadata(), id=image_id)
+    if img.has_thumbnail:
+        return blob_response(request, img, "thumbnail", img.thumbnail_content_type)
     return HttpResponse(status=404)
 
 
+# Serve a resized/re-encoded variant, rendered on first request and then persisted + cached
+@router.get("/{image_id}/v/{width}.{fmt}")
+def get_image_variant(request, image_id: int, width: int, fmt: str):
+    refused = variant_error(width, fmt)
+    if refused is not None:
+        return refused
+
+    try:
+        variant = variants.get_variant(image_id, width, fmt)
+    except Exception as e:
+        return error("Error rendering image variant", 500, details=str(e))
+    return variant_response(request, variant)
+
+
 # Return base64 (optional, mostly for testing or quick frontend previews)
 @router.get("/{image_id}/base64/",response={200: APISuccess, 400: APIError})
 def get_image_base64(request, image_id: int):
-    img = get_object_or_404(Image, id=image_id)
-    
+    img = get_object_or_404(Image.objects.metadata(), id=image_id)
+    etag = base64_etag(img)
+    cached = not_modified(request, etag)
+    if cached is not None:
+        return cached
+
     try:
-        b64 = base64.b64encode(img.data).decode("ascii")
+        with img.open_blob("data") as fh:
+            data = fh.read()
     except Exception as e:
         return error("Error encoding image to base64", 500, details=str(e))
     
-    return success({"id": img.id, "filename": img.filename, "data": f"data:{img.content_type};base64,{b64}", }, 200)
+    return base64_response(img, data, etag)
+
+
+def save_uploaded_image(img: Image) -> None:
+    """
+    INSERT a new image, together with its thumbnail job when the queue is on. Its blobs may
+    already have existed and lost their last other reference since being written, so they are
+    put back under the blob lock, which is held until the row is committed.
+    """
+    with storage.blob_lock(*img.blob_digests()), transaction.atomic():
+        img.publish_blobs()
+        if thumbnails.queue_enabled():
+            # Rendered by `manage.py run_thumbnail_worker`; thumbnail_url shows up once it is done
+            img.thumbnail_status = THUMBNAIL_PENDING
+            img.save()
+            thumbnails.enqueue_thumbnail(img)
+        else:
+            img.save()
+
+
+def release_uploaded_blobs(img: Image) -> None:
+    """The row was never saved; drop the blob references the upload took"""
+    img.discard_blobs()
+    if img.storage == storage.FILESYSTEM:
+        release_blob(img.sha256)
+        release_blob(img.thumbnail_sha256)
 
 
 # Upload image
 @router.post("/recipes/{recipe_id}/images/", response={200: APISuccess, 400: APIError, 413: APIError})
 def upload_image(request, recipe_id: int, file: UploadedFile = File(...)):
     recipe = get_object_or_404(Recipe, pk=recipe_id)
-    
-    file_bytes = file.file.read()
-    size = len(file_bytes)
+    refused = upload_error(request, file)
+    if refused is not None:
+        return refused
 
-    if size == 0:
-        return error({"error": "Empty file"}, 400)
-    if size > MAX_UPLOAD_BYTES:
-        return error({"error": "File too large"}, 413)
+    # Only the header is read here; bombs and non-images are refused before any decode
+    try:
+        content_type, width, height = sniff_image(file.file)
+    except UnsupportedImage as e:
+        return error(str(e), 400)
 
+    img = new_image(recipe, file, content_type, width, height)
     try:
-        thumb_bytes, thumb_ct = make_thumbnail(file_bytes, size=(400, 400))
-    except Exception:
-        thumb_bytes, thumb_ct = None, None
+        # Hashed and written to the blob store chunk by chunk
+        img.size = img.set_blob_stream("data", uploads.bounded_chunks(file))
+    except ValueError:
+        return too_large()
 
+    if not thumbnails.queue_enabled():
+        # Rendered before the transaction, so no locks are held while PIL runs
+        thumbnails.attach_thumbnail(img)
     try:
-        img = Image.objects.create(
-            recipe=recipe,
-            filename=file.name,
-            content_type=file.content_type or "application/octet-stream",
-            size=size,
-            data=file_bytes,
-            thumbnail=thumb_bytes,
-            thumbnail_content_type=thumb_ct,
-        )
+        save_uploaded_image(img)
     except Exception as e:
+        release_uploaded_blobs(img)
         return error("Database error while saving image", 500, details=str(e))
     
     schema = image_to_schema(request, img)
@@ -140,7 +295,8 @@ def upload_image(request, recipe_id: int, file: UploadedFile = File(...)):
 # Update image metadata
 @router.put("/{image_id}", response={200: APISuccess, 400: APIError, 404: APIError})
 def update_image(request, image_id: int, data: ImageUpdate):
-    img = get_object_or_404(Image, id=image_id)
+    # Deferred blobs are left out of the UPDATE as well as the SELECT
+    img = get_object_or_404(Image.objects.metadata(), id=image_id)
 
     if data.filename is not None:
         img.filename = data.filename
@@ -149,7 +305,7 @@ def update_image(request, image_id: int, data: ImageUpdate):
         img.recipe = get_object_or_404(Recipe, id=data.recipe_id)
     
     try:
-        img.save()
+        in_transaction(img.save)
         schema = image_to_schema(request, img)
     except Exception as e:
         return error("Database error while updating image", 500, details=str(e))
@@ -160,7 +316,7 @@ def update_image(request, image_id: int, data: ImageUpdate):
 # Delete image
 @router.delete("/{image_id}", response={200: APISuccess, 404: APIError, 500: APIError})
 def delete_image(request, image_id: int):
-    img = get_object_or_404(Image, id=image_id)
+    img = get_object_or_404(Image.objects.metadata(), id=image_id)
     try:
         img.delete()
     except Exception as e:
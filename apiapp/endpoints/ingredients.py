@@ -1,10 +1,12 @@
 from django.shortcuts import get_object_or_404
-from ninja import Router
+from ninja import Query, Router
 from typing import List
 from ..models import Ingredient, Recipe
 from ..schemas.Ingredient import IngredientCreate, IngredientRead
 from ..utils.utils import success, error
+from ..utils.batch import BatchError, in_request_order, parse_ids
 from ..schemas.responses import APISuccess, APIError
+from ..signals import in_transaction
 from django.http import HttpResponse
 
 router = Router()
@@ -13,6 +15,28 @@ def ingredient_to_schemas(request, ing: Ingredient) ->  IngredientRead:
     """Helper to convert related ingredients to list of schemas"""
     return IngredientRead.from_orm(ing) 
 
+# Shared with the async twins in async_ingredients.py, which differ only in how they read
+
+def ingredient_queryset(recipe_id=None):
+    """Every ingredient, or those of one recipe"""
+    if recipe_id:
+        return Ingredient.objects.filter(recipe_id=recipe_id)
+    return Ingredient.objects.all()
+
+def update_fields(ingredient: Ingredient, data: IngredientCreate) -> None:
+    for field, value in data.dict().items():
+        setattr(ingredient, field, value)
+
+# Get several ingredients by id, in request order, with a marker for the ones not found
+@router.get("/batch", response={200: APISuccess, 400: APIError})
+def batch_ingredients(request, ids: List[str] = Query(...)):
+    try:
+        ids = parse_ids(ids)
+    except BatchError as e:
+        return error(str(e), 400)
+    found = {i.id: ingredient_to_schemas(request, i).dict() for i in Ingredient.objects.filter(id__in=ids)}
+    return success(in_request_order(ids, found), 200)
+
 # Get a single ingredient
 @router.get("/{ingredient_id}", response={200: APISuccess, 404: APIError})
 def get_ingredient(request, ingredient_id: int):
@@ -28,11 +52,7 @@ def get_ingredient(request, ingredient_id: int):
 @router.get("/", response={200: APISuccess, 400: APIError})
 def list_ingredients(request, recipe_id: int = None):
     try:
-        if recipe_id:
-            ingredients = Ingredient.objects.filter(recipe_id=recipe_id)
-        else:
-            ingredients = Ingredient.objects.all()
-        schemas = [ingredient_to_schemas(request, i).dict() for i in ingredients]
+        schemas = [ingredient_to_schemas(request, i).dict() for i in ingredient_queryset(recipe_id)]
         return success(schemas, 200)
     except Exception as e:
         return error("Error retrieving ingredients", 500, details=str(e))
@@ -42,7 +62,7 @@ def list_ingredients(request, recipe_id: int = None):
 def create_ingredient(request, recipe_id: int, data: IngredientCreate):
     recipe = get_object_or_404(Recipe, id=recipe_id)
     try:
-        ingredient = Ingredient.objects.create(recipe=recipe, **data.dict())
+        ingredient = in_transaction(Ingredient.objects.create, recipe=recipe, **data.dict())
         schema = ingredient_to_schemas(request, ingredient)
         return success(schema.dict(), 201)
     except Exception as e:
@@ -53,9 +73,8 @@ def create_ingredient(request, recipe_id: int, data: IngredientCreate):
 def update_ingredient(request, ingredient_id: int, data: IngredientCreate):
     ingredient = get_object_or_404(Ingredient, id=ingredient_id)
     try:
-        for field, value in data.dict().items():
-            setattr(ingredient, field, value)
-        ingredient.save()
+        update_fields(ingredient, data)
+        in_transaction(ingredient.save)
         schema = ingredient_to_schemas(request, ingredient)
         return success(schema.dict(), 200)
     except Exception as e:
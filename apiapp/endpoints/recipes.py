@@ -1,20 +1,176 @@
+import zlib
+from itertools import islice
+
+from django.db.models import Prefetch
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from ninja.pagination import paginate, PageNumberPagination
-from ninja import Router, Schema
-from typing import List, TypeVar, Generic
+from ninja import Query, Router, Schema
+from typing import List, Optional, TypeVar, Generic
 
 from ..schemas.Image import ImageCreate, ImageRead
 from ..schemas.Ingredient import IngredientCreate, IngredientRead
-from ..schemas.Recipe import RecipeCreate, RecipeRead
+from ..schemas.Recipe import RecipeCreate, RecipeFilters, RecipeRead
+from ..schemas.ShoppingList import ShoppingListRequest
 from ..utils.utils import success, error
+from ..utils.renderers import dumps
+from ..utils.batch import BatchError, in_request_order, parse_ids
+from ..utils.pagination import MAX_OFFSET, PaginationError, clamp_page_size, keyset_page, offset_page, parse_sort
+from ..utils.http import not_modified, set_cache_headers, weak_etag
 from ..schemas.responses import APISuccess, APIError
 from .images import image_to_schema
 from .ingredients import ingredient_to_schemas
-from ..models import Recipe
+from ..models import Image, Recipe
+from ..serializers import RECIPE_FIELDS, FieldsetError, absolute_url_builder, parse_fieldset, recipe_documents
+from ..read_model import DOCUMENT, stored_documents, stored_documents_by_id
+from ..response_cache import cached_response, list_version, list_versions, recipe_versions
+from .. import importer, search, shopping
+from ..filters import facet_counts, filter_recipes
+from ..signals import in_transaction
+from ..pantry import MAX_MISSING, MAX_PANTRY_ITEMS, normalize_name, pantry_index
+from ..importer import DEFAULT_BATCH_SIZE, create_recipes
 
 router = Router()
 
-def recipe_to_schema(request, recipe):
+# Rows per server-side cursor fetch (and per prefetch batch) when exporting
+EXPORT_CHUNK_SIZE = 2000
+
+# Sort keys usable for ordering/keyset pagination, each backed by a (key, id) index
+RECIPE_SORT_KEYS = {"id", "name", "rating", "preparation_time", "cooking_time"}
+
+# Columns of a page query: sort keys (for cursors), updated_at (for ETags) and the stored document
+PAGE_KEYS = ("id", "name", "rating", "preparation_time", "cooking_time", "updated_at")
+PAGE_VALUES = PAGE_KEYS + (DOCUMENT,)
+
+def page_values(fieldset):
+    """PAGE_VALUES, or for a sparse fieldset the page keys and just the requested columns"""
+    if fieldset is None:
+        return PAGE_VALUES
+    return PAGE_KEYS + tuple(field for field in fieldset[0] if field not in PAGE_KEYS)
+
+def page_documents(request, rows, fieldset, extra=()):
+    """Stored documents for full responses; sparse ones are built from the rows' own columns"""
+    if fieldset is None:
+        return stored_documents(request, rows, extra)
+    return with_extra(recipe_documents(request, rows, fieldset), rows, extra)
+
+def documents_by_id(request, rows, fieldset) -> dict:
+    """page_documents() keyed by recipe id"""
+    if fieldset is None:
+        return stored_documents_by_id(request, rows)
+    return {document["id"]: document for document in recipe_documents(request, rows, fieldset)}
+
+def with_extra(documents, rows, extra):
+    for document, row in zip(documents, rows):
+        document.update((key, row[key]) for key in extra)
+    return documents
+
+# Request parsing and response building shared with the async twins in async_recipes.py; the
+# handlers on each side only do the database reads, so the two stay answer-for-answer identical.
+
+def document_columns(fieldset):
+    """Columns read per recipe: the stored document, or the requested ones for a sparse fieldset"""
+    return ("id", DOCUMENT) if fieldset is None else fieldset[0]
+
+def list_request(filters, sort, mode, cursor, fields, include):
+    """
+    (fieldset, values queryset, keyset?) for a list request; FieldsetError or PaginationError
+    for anything the client got wrong. Offset pages come ordered; keyset pages order themselves.
+    """
+    fieldset = parse_fieldset(fields, include)
+    recipes = filter_recipes(Recipe.objects.all(), filters).values(*page_values(fieldset))
+    if mode == "cursor" or cursor:
+        return fieldset, recipes, True
+    if mode != "offset":
+        raise PaginationError("mode must be 'offset' or 'cursor'")
+    return fieldset, order_recipes(recipes, sort), False
+
+def search_request(q, filters, fields, include):
+    """(fieldset, values queryset with "rank") for a search; raises like list_request()"""
+    fieldset = parse_fieldset(fields, include)
+    return fieldset, filter_recipes(search.search_recipes(q), filters).values(*page_values(fieldset), "rank")
+
+def export_request(filters, sort, chunk_size, fields, include):
+    """(fieldset, values queryset, chunk size) for an export; raises like list_request()"""
+    fieldset = parse_fieldset(fields, include)
+    recipes = order_recipes(filter_recipes(Recipe.objects.all(), filters), sort)
+    return fieldset, recipes.values(*document_columns(fieldset)), max(1, min(chunk_size, EXPORT_CHUNK_SIZE))
+
+def export_line(document, fieldset) -> bytes:
+    return (document if fieldset is None else dumps(document)) + b"\n"
+
+def export_response(body, gzip: bool):
+    response = StreamingHttpResponse(body, content_type="application/x-ndjson")
+    if gzip:
+        response["Content-Encoding"] = "gzip"
+    response["Content-Disposition"] = 'attachment; filename="recipes.ndjson"'
+    response["Cache-Control"] = "no-store"
+    return response
+
+def detail_query(recipe_id, fieldset):
+    """One indexed read: the recipe's updated_at and its stored document (or the requested columns)"""
+    return Recipe.objects.filter(id=recipe_id).values("updated_at", *document_columns(fieldset))
+
+def batch_request(ids, fields, include):
+    """(ids, fieldset, values queryset) for a batch lookup; BatchError or FieldsetError"""
+    ids = parse_ids(ids)
+    fieldset = parse_fieldset(fields, include)
+    return ids, fieldset, Recipe.objects.filter(pk__in=ids).values(*document_columns(fieldset))
+
+def import_format(request, format, batch_size) -> str:
+    """"ndjson" or "json" for an import; ValueError for a bad format or batch size"""
+    fmt = format or ("json" if request.content_type == "application/json" else "ndjson")
+    if fmt not in ("ndjson", "json"):
+        raise ValueError("format must be 'ndjson' or 'json'")
+    if batch_size < 1:
+        raise ValueError("batch_size must be >= 1")
+    return fmt
+
+def import_response(report: dict):
+    # Batches committed before a failure stay committed, so the report is returned either way
+    if "aborted" in report:
+        return error("Error importing recipes", 500, details=report)
+    return success(report, 200)
+
+def update_fields(recipe, data) -> None:
+    for field, value in data.dict(exclude={"ingredients", "images"}).items():
+        # Blank text columns are "" rather than NULL, as on creation
+        setattr(recipe, field, (value or "") if field in importer.RECIPE_TEXT_FIELDS else value)
+
+def recipe_prefetches():
+    """Children needed by recipe_to_schema; image blobs are never loaded"""
+    return ["ingredients", Prefetch("images", queryset=Image.objects.metadata())]
+
+def recipe_queryset():
+    return Recipe.objects.prefetch_related(*recipe_prefetches())
+
+def order_recipes(queryset, sort):
+    """Order by a whitelisted sort key with id as tie-breaker, as the (key, id) indexes expect"""
+    field, descending = parse_sort(sort, RECIPE_SORT_KEYS)
+    return queryset.order_by(*([f"-{field}", "-id"] if descending else [field, "id"]))
+
+def recipe_etag(request, *parts):
+    """Weak validator; updated_at moves whenever the recipe or one of its children changes"""
+    return weak_etag(request.get_host(), request.get_full_path(), *parts)
+
+def page_etag(request, rows, version) -> str:
+    """
+    ETag of a list or search page: each row's (id, updated_at) and the list version counter.
+    Not the total or facets, which come from COUNT_CACHE_SECONDS-old cached counts and so can
+    change without any write (or stay put after one).
+    """
+    return recipe_etag(request, version, *[(r["id"], r["updated_at"].timestamp()) for r in rows])
+
+def recipe_to_schema(request, recipe, ingredients=None, images=None):
+    """
+    ingredients/images may be passed in when the caller already holds them (e.g. just created);
+    otherwise `recipe` must come from recipe_queryset() so reading them costs no extra queries.
+    """
+    if ingredients is None:
+        ingredients = recipe.ingredients.all()
+    if images is None:
+        images = recipe.images.all()
+    base_url = absolute_url_builder(request)
     return RecipeRead(
         id=recipe.id,
         name=recipe.name,
@@ -31,10 +187,10 @@ def recipe_to_schema(request, recipe):
         number_of_servings=recipe.number_of_servings,
         ingredients=[
             IngredientRead.from_orm(i)
-            for i in recipe.ingredients.all()
+            for i in ingredients
         ],
         images=[ 
-            image_to_schema(request, i) for i in recipe.images.all() 
+            image_to_schema(request, i, base_url) for i in images
             ]
     )
         #     ImageRead(
@@ -52,67 +208,270 @@ def recipe_to_schema(request, recipe):
 @router.post("/", response={201: APISuccess, 400: APIError, 500: APIError})
 def create_recipe(request, data: RecipeCreate):
     try:
-        recipe = Recipe.objects.create(**data.dict(exclude={"ingredients", "images"}))
-
-        # Add ingredients
-        for ing in data.ingredients:
-            recipe.ingredients.create(**ing.dict())
-
-        # Add images
-        for img in data.images:
-            recipe.images.create(**img.dict())
-
-        # Convert nested objects for response
-        recipe.ingredients.all()
-        recipe.images.all()
-        schema = recipe_to_schema(request, recipe)
+        # One transaction, one INSERT per table; the response is built from the saved objects
+        [(recipe, ingredients, images)] = create_recipes([data])
+        schema = recipe_to_schema(request, recipe, ingredients, images)
         return success(schema.dict(), 201)
     except Exception as e:
         return error("Error creating recipe", 500, details=str(e))
 
+@router.post("/import", response={200: APISuccess, 400: APIError, 500: APIError})
+def import_recipes(request, format: Optional[str] = None, batch_size: int = DEFAULT_BATCH_SIZE):
+    """
+    Bulk import: the body is NDJSON (one RecipeCreate per line, streamed) or a JSON array.
+    Valid rows are committed in batches; invalid rows are reported and skipped.
+    """
+    try:
+        fmt = import_format(request, format, batch_size)
+    except ValueError as e:
+        return error(str(e), 400)
+    return import_response(importer.import_recipes(request, fmt, batch_size))
+
 @router.get("/", response={200: APISuccess, 400: APIError})
-def list_recipes(request, page: int = 1, page_size: int = 10):
-    try:
-        recipes = Recipe.objects.all().prefetch_related("ingredients", "images")
-        schemas = [recipe_to_schema(request, r).dict() for r in recipes]
-
-        # Manual pagination
-        total = len(schemas)
-        start = (page - 1) * page_size
-        end = start + page_size
-        paginated_schemas = schemas[start:end]
-
-        return success(
-            {
-                "items": paginated_schemas,  # the current page of items
-                "total": total,              # total items
-                "page": page,
-                "page_size": page_size,
-                "total_pages": (total + page_size - 1) // page_size
-            },
-            status_code=200
-        )
+@cached_response("list", list_versions)
+def list_recipes(request, filters: Query[RecipeFilters], page: int = 1, page_size: int = 10, sort: str = "id",
+                 mode: str = "offset", cursor: Optional[str] = None, include_total: Optional[bool] = None,
+                 facets: bool = False, fields: Optional[str] = None, include: Optional[str] = None):
+    """
+    Offset mode (default): ?page=&page_size=, bounded by API_MAX_OFFSET.
+    Cursor mode: ?mode=cursor or ?cursor=<next/prev from the previous page>, keyset over (sort, id).
+    Filters: ?diet_type=0&diet_type=2&min_rating=4&max_cooking_time=30 ...; ?facets=true adds
+    per-value counts for every enum column.
+    Sparse items: ?fields=id,name,rating and/or ?include=ingredients,images (see parse_fieldset).
+    """
+    try:
+        fieldset, recipes, keyset = list_request(filters, sort, mode, cursor, fields, include)
+        if keyset:
+            result = keyset_page(recipes, sort, RECIPE_SORT_KEYS, page_size, cursor,
+                                 include_total=bool(include_total))
+        else:
+            result = offset_page(recipes, page, page_size, include_total=include_total is not False)
+    except (FieldsetError, PaginationError) as e:
+        return error(str(e), 400)
+
+    rows = result.pop("rows")
+    if facets:
+        result["facets"] = facet_counts(Recipe.objects.all(), filters)
+    etag = page_etag(request, rows, list_version())
+    cached = not_modified(request, etag)
+    if cached is not None:
+        return cached
 
+    try:
+        # Only the rows of the requested page are fetched, and their children read as plain values
+        result["items"] = page_documents(request, rows, fieldset)
     except Exception as e:
         return error("Error generating recipe schemas", 500, details=str(e))
 
+    return set_cache_headers(success(result, status_code=200), etag)
+
+def buffered(lines, size=64 * 1024):
+    """Group small lines into ~64 KiB writes"""
+    block = []
+    pending = 0
+    for line in lines:
+        block.append(line)
+        pending += len(line)
+        if pending >= size:
+            yield b"".join(block)
+            block, pending = [], 0
+    if block:
+        yield b"".join(block)
+
+def gzip_stream(lines):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31: gzip container
+    for block in buffered(lines):
+        out = compressor.compress(block)
+        if out:
+            yield out
+    yield compressor.flush()
+
+@router.get("/export")
+def export_recipes(request, filters: Query[RecipeFilters], sort: str = "id", gzip: bool = False,
+                   chunk_size: int = EXPORT_CHUNK_SIZE, fields: Optional[str] = None, include: Optional[str] = None):
+    """
+    Stream the whole catalog as NDJSON, one RecipeRead per line (optionally gzip-encoded), or
+    only the ?fields= / ?include= asked for. Rows come through a server-side cursor in chunks,
+    each chunk with its own child queries, so memory stays flat however many recipes there are.
+    Those queries run while the body streams, after the view has returned; the middleware
+    re-enter the request's replica, query timer and request id for them (stream_in_context).
+    """
+    try:
+        fieldset, recipes, chunk_size = export_request(filters, sort, chunk_size, fields, include)
+    except (FieldsetError, PaginationError) as e:
+        return error(str(e), 400)
+    rows = recipes.iterator(chunk_size=chunk_size)
+
+    lines = (
+        export_line(document, fieldset)
+        for chunk in iter(lambda: list(islice(rows, chunk_size)), [])
+        for document in page_documents(request, chunk, fieldset)
+    )
+    return export_response(gzip_stream(lines) if gzip else buffered(lines), gzip)
+
+@router.get("/search", response={200: APISuccess, 400: APIError, 501: APIError})
+@cached_response("search", list_versions)
+def search_recipes(request, q: str, filters: Query[RecipeFilters], page: int = 1, page_size: int = 10,
+                   include_total: bool = False, fields: Optional[str] = None, include: Optional[str] = None):
+    """
+    Ranked full-text search over name, ingredient names, description and instructions
+    (weighted in that order). Every word must match; each word also matches as a prefix.
+    """
+    if not search.tokenize(q):
+        return error("q must contain at least one word", 400)
+    try:
+        fieldset, recipes = search_request(q, filters, fields, include)
+        result = offset_page(recipes, page, page_size, include_total=include_total)
+    except (FieldsetError, PaginationError) as e:
+        return error(str(e), 400)
+    except search.SearchUnavailable as e:
+        return error(str(e), 501)
+
+    rows = result.pop("rows")
+    etag = page_etag(request, rows, list_version())
+    cached = not_modified(request, etag)
+    if cached is not None:
+        return cached
+
+    try:
+        result["items"] = page_documents(request, rows, fieldset, extra=("rank",))
+    except Exception as e:
+        return error("Error generating recipe schemas", 500, details=str(e))
+
+    return set_cache_headers(success(result, status_code=200), etag)
+
+def pantry_window(have: List[str], max_missing: int, page: int, page_size: int) -> tuple[int, int]:
+    """(page size, offset) of a pantry request; PaginationError if anything is out of bounds"""
+    if len(have) > MAX_PANTRY_ITEMS:
+        raise PaginationError(f"At most {MAX_PANTRY_ITEMS} pantry items per request")
+    if not 0 <= max_missing <= MAX_MISSING:
+        raise PaginationError(f"max_missing must be between 0 and {MAX_MISSING}")
+    page_size = clamp_page_size(page_size)
+    if page < 1:
+        raise PaginationError("page must be >= 1")
+    offset = (page - 1) * page_size
+    if offset > MAX_OFFSET:
+        raise PaginationError(f"Offset too large (max {MAX_OFFSET})")
+    return page_size, offset
+
+def pantry_match(have: List[str], max_missing: int, offset: int, page_size: int) -> dict:
+    """
+    Catch the index up with other processes' writes and match one page of it (plus one hit, for
+    has_next). Set operations over every indexed recipe, so async handlers run it on a thread.
+    """
+    pantry_index.sync()
+    return pantry_index.match(have, max_missing, offset, page_size + 1)
+
+def pantry_rows(result: dict, page_size: int):
+    """Recipe rows for the hits on the page"""
+    ids = [recipe_id for recipe_id, _, _ in result["ids"][:page_size]]
+    return Recipe.objects.filter(pk__in=ids).values(*RECIPE_FIELDS)
+
+def pantry_page(have: List[str], result: dict, documents: dict, page: int, page_size: int) -> dict:
+    """The response for one page of pantry_index.match() hits, given their documents by id"""
+    hits = result["ids"][:page_size]
+    for recipe_id, _, _ in hits:
+        if recipe_id not in documents:
+            # Deleted by another process since the last sync
+            pantry_index.remove_recipe(recipe_id)
+
+    pantry = {normalize_name(name) for name in have}
+    items = []
+    for recipe_id, matched, missing in hits:
+        document = documents.get(recipe_id)
+        if document is None:
+            continue
+        items.append({
+            **document,
+            "matched": matched,
+            "missing": missing,
+            "missing_ingredients": sorted({
+                i["name"] for i in document["ingredients"] if normalize_name(i["name"]) not in pantry
+            }),
+        })
+
+    return {
+        "items": items,
+        "total": result["total"],
+        "counts": result["counts"],
+        "page": page,
+        "page_size": page_size,
+        "has_next": len(result["ids"]) > page_size,
+    }
+
+@router.get("/pantry", response={200: APISuccess, 400: APIError})
+def pantry_recipes(request, have: List[str] = Query(...), max_missing: int = 2,
+                   page: int = 1, page_size: int = 10):
+    """
+    "Cook with what I have": ?have=egg&have=milk&... returns recipes using those ingredients,
+    those needing nothing else first, then those missing one, and so on up to max_missing.
+    Answered from the in-memory inverted index in pantry.py, not from the Ingredient table.
+    """
+    try:
+        page_size, offset = pantry_window(have, max_missing, page, page_size)
+    except PaginationError as e:
+        return error(str(e), 400)
+
+    result = pantry_match(have, max_missing, offset, page_size)
+    rows = pantry_rows(result, page_size)
+    documents = {document["id"]: document for document in recipe_documents(request, rows)}
+    return success(pantry_page(have, result, documents, page, page_size), 200)
+
+@router.post("/shopping-list", response={200: APISuccess})
+def shopping_list(request, data: ShoppingListRequest):
+    """
+    Consolidated shopping list for a meal plan: [{recipe_id, servings}, ...] in, one line per
+    ingredient out, scaled to the servings and summed across recipes in a common unit.
+    """
+    return success(shopping.shopping_list(data.recipes), 200)
+
+@router.get("/batch", response={200: APISuccess, 400: APIError})
+def batch_recipes(request, ids: List[str] = Query(...), fields: Optional[str] = None, include: Optional[str] = None):
+    """
+    Several recipes by id (?ids=3,1,2, at most API_MAX_BATCH_SIZE) from one id__in read of their
+    stored documents, in request order; ids that do not exist get a not-found marker, not a 404.
+    """
+    try:
+        ids, fieldset, rows = batch_request(ids, fields, include)
+    except (BatchError, FieldsetError) as e:
+        return error(str(e), 400)
+    try:
+        found = documents_by_id(request, rows, fieldset)
+    except Exception as e:
+        return error("Error generating recipe schemas", 500, details=str(e))
+    return success(in_request_order(ids, found), 200)
+
 @router.get("/{recipe_id}", response={200: APISuccess, 404: APIError})
-def get_recipe(request, recipe_id: int):
-    recipe = get_object_or_404(Recipe, id=recipe_id)
+@cached_response("recipe", recipe_versions)
+def get_recipe(request, recipe_id: int, fields: Optional[str] = None, include: Optional[str] = None):
     try:
-        schema = recipe_to_schema(request, recipe)
+        fieldset = parse_fieldset(fields, include)
+    except FieldsetError as e:
+        return error(str(e), 400)
+    row = detail_query(recipe_id, fieldset).first()
+    if row is None:
+        raise Http404("No Recipe matches the given query.")
+    updated_at = row["updated_at"]
+    etag = recipe_etag(request, row["id"], updated_at.timestamp())
+    cached = not_modified(request, etag, updated_at)
+    if cached is not None:
+        return cached
+
+    try:
+        documents = page_documents(request, [row], fieldset)
     except Exception as e:
         return error("Error generating recipe schema", 500, details=str(e))
-    return success(schema.dict(), 200)
+    if not documents:
+        raise Http404("No Recipe matches the given query.")
+    return set_cache_headers(success(documents[0], 200), etag, updated_at)
 
 # why the DTO is the Create and update
 @router.put("/{recipe_id}", response={200: APISuccess, 400: APIError, 404: APIError, 500: APIError})
 def update_recipe(request, recipe_id: int, data: RecipeCreate):
-    recipe = get_object_or_404(Recipe, id=recipe_id)
+    recipe = get_object_or_404(recipe_queryset(), id=recipe_id)
     try:
-        for field, value in data.dict(exlude={"ingredients","images"}).items():
-            setattr(recipe, field, value)
-        recipe.save()
+        update_fields(recipe, data)
+        in_transaction(recipe.save)
         schema = recipe_to_schema(request, recipe)
         return success(schema.dict(), 200)
     except Exception as e:
@@ -132,7 +491,7 @@ def delete_recipe(request, recipe_id: int):
 def add_image(request, recipe_id: int, image: ImageCreate):
     recipe = get_object_or_404(Recipe, id=recipe_id)
     try:
-        img = recipe.images.create(**image.dict())
+        img = in_transaction(recipe.images.create, **image.dict())
         schema = image_to_schema(request, img)
         return success(schema.dict(), 201)
     except Exception as e:
@@ -142,7 +501,8 @@ def add_image(request, recipe_id: int, image: ImageCreate):
 def list_images_for_recipe(request, recipe_id: int):
     recipe = get_object_or_404(Recipe, id=recipe_id)
     try:
-        schemas = [image_to_schema(request, img).dict() for img in recipe.images.all()]
+        base_url = absolute_url_builder(request)
+        schemas = [image_to_schema(request, img, base_url).dict() for img in recipe.images.metadata()]
         return success(schemas, 200)
     except Exception as e:
         return error("Error retrieving images", 500, details=str(e))
@@ -152,7 +512,7 @@ def list_images_for_recipe(request, recipe_id: int):
 def add_ingredient(request, recipe_id: int, ingredient: IngredientCreate):
     recipe = get_object_or_404(Recipe, id=recipe_id)
     try:
-        ing = recipe.ingredients.create(**ingredient.dict())
+        ing = in_transaction(recipe.ingredients.create, **ingredient.dict())
         schema = ingredient_to_schemas(request, ing)
         return success(schema.dict(), 201)
     except Exception as e:
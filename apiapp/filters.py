@@ -0,0 +1,95 @@
+import hashlib
+
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+from .constants import DietType, DifficultyLevel, MealCategory, MealType
+from .models import enum_choices
+from .schemas.Recipe import RecipeFilters
+from .utils.pagination import COUNT_CACHE_SECONDS
+
+# Enum columns that can be filtered on and faceted
+FACETS = {
+    "diet_type": DietType,
+    "meal_type": MealType,
+    "meal_category": MealCategory,
+    "difficulty_level": DifficultyLevel,
+}
+
+# Query parameter -> ORM lookup for the range filters
+RANGE_LOOKUPS = {
+    "min_preparation_time": "preparation_time__gte",
+    "max_preparation_time": "preparation_time__lte",
+    "min_cooking_time": "cooking_time__gte",
+    "max_cooking_time": "cooking_time__lte",
+    "min_rating": "rating__gte",
+    "min_servings": "number_of_servings__gte",
+    "max_servings": "number_of_servings__lte",
+}
+
+
+def range_filter(filters: RecipeFilters) -> Q:
+    return Q(**{
+        lookup: getattr(filters, param)
+        for param, lookup in RANGE_LOOKUPS.items()
+        if getattr(filters, param) is not None
+    })
+
+
+def enum_filter(filters: RecipeFilters, exclude: str | None = None) -> Q:
+    """Membership test per enum column (values OR'ed, columns AND'ed); `exclude` leaves one column out"""
+    q = Q()
+    for field in FACETS:
+        values = getattr(filters, field)
+        if field != exclude and values:
+            q &= Q(**{f"{field}__in": [int(v) for v in values]})
+    return q
+
+
+def filter_recipes(queryset, filters: RecipeFilters | None):
+    if filters is None:
+        return queryset
+    return queryset.filter(range_filter(filters) & enum_filter(filters))
+
+
+def facet_query(queryset, filters: RecipeFilters):
+    """
+    (cache key, base queryset, aggregates) for the counts per value of every enum column.
+    Counts are disjunctive: a column's counts apply all filters except that column's own,
+    so they say how many results picking (or adding) that value would give.
+    """
+    base = queryset.filter(range_filter(filters))
+    aggregates = {}
+    for field, enum_cls in FACETS.items():
+        others = enum_filter(filters, exclude=field)
+        for member in enum_cls:
+            aggregates[f"{field}_{member.value}"] = Count("id", filter=others & Q(**{field: member.value}))
+
+    # Cached like list totals; the counts only depend on the base query and the enum filters
+    key = "facets:" + hashlib.md5(f"{base.query}|{filters.model_dump_json()}".encode()).hexdigest()
+    return key, base.order_by(), aggregates
+
+
+def facet_document(row: dict) -> dict:
+    return {
+        field: [
+            {"value": member.value, "label": label, "count": row[f"{field}_{member.value}"]}
+            for member, (_, label) in zip(enum_cls, enum_choices(enum_cls))
+        ]
+        for field, enum_cls in FACETS.items()
+    }
+
+
+def facet_counts(queryset, filters: RecipeFilters) -> dict:
+    """Count per value of every enum column, in a single aggregate query"""
+    key, base, aggregates = facet_query(queryset, filters)
+    return facet_document(cache.get_or_set(key, lambda: base.aggregate(**aggregates), COUNT_CACHE_SECONDS))
+
+
+async def afacet_counts(queryset, filters: RecipeFilters) -> dict:
+    key, base, aggregates = facet_query(queryset, filters)
+    row = await cache.aget(key)
+    if row is None:
+        row = await base.aaggregate(**aggregates)
+        await cache.aset(key, row, COUNT_CACHE_SECONDS)
+    return facet_document(row)
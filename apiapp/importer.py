@@ -0,0 +1,204 @@
+import json
+import logging
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.utils import timezone
+from pydantic import ValidationError
+
+from .models import Image, Ingredient, Recipe
+from .schemas.Recipe import RecipeCreate
+from .signals import recipes_bulk_changed
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = getattr(settings, "RECIPE_IMPORT_BATCH_SIZE", 1000)
+# Per-row errors kept in the report; the counts stay exact beyond this
+MAX_REPORTED_ERRORS = 1000
+
+# Nullable in the schema but NOT NULL (blank) in the table
+RECIPE_TEXT_FIELDS = ("description",)
+INGREDIENT_TEXT_FIELDS = ("category",)
+
+
+def build_recipe(data: RecipeCreate, **extra) -> Recipe:
+    fields = data.dict(exclude={"ingredients", "images"})
+    for name in RECIPE_TEXT_FIELDS:
+        fields[name] = fields[name] or ""
+    return Recipe(**fields, **extra)
+
+
+def build_children(data: RecipeCreate, recipe: Recipe) -> tuple[list[Ingredient], list[Image]]:
+    ingredients = []
+    for ing in data.ingredients:
+        fields = ing.dict()
+        for name in INGREDIENT_TEXT_FIELDS:
+            fields[name] = fields[name] or ""
+        ingredients.append(Ingredient(recipe=recipe, **fields))
+    images = [Image(recipe=recipe, **img.dict()) for img in data.images]
+    return ingredients, images
+
+
+def create_recipes(documents: list[RecipeCreate]) -> list[tuple[Recipe, list[Ingredient], list[Image]]]:
+    """
+    Insert recipes and their children with one bulk INSERT per table, in one transaction.
+    Returns the saved objects so callers can render them without re-querying.
+    """
+    with transaction.atomic():
+        recipes = Recipe.objects.bulk_create([build_recipe(doc) for doc in documents])
+        rows = [(recipe, *build_children(doc, recipe)) for recipe, doc in zip(recipes, documents)]
+        Ingredient.objects.bulk_create([ing for _, ings, _ in rows for ing in ings])
+        Image.objects.bulk_create([img for _, _, imgs in rows for img in imgs])
+        # bulk_create skips post_save, so listeners are told explicitly
+        recipes_bulk_changed.send(sender=Recipe, recipe_ids=[r.pk for r in recipes])
+    return rows
+
+
+def can_copy() -> bool:
+    """COPY FROM STDIN is used with psycopg 3 on PostgreSQL"""
+    if connection.vendor != "postgresql":
+        return False
+    with connection.cursor() as cursor:
+        return hasattr(cursor.cursor, "copy")
+
+
+def copy_recipes(documents: list[RecipeCreate]) -> list[int]:
+    """
+    PostgreSQL fast path: reserve ids from the sequences, then stream rows with COPY.
+    Much cheaper than INSERT ... RETURNING for large batches.
+    """
+    now = timezone.now()
+    ingredient_count = sum(len(doc.ingredients) for doc in documents)
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        recipe_ids = reserve_ids(cursor, Recipe, len(documents))
+        ingredient_ids = iter(reserve_ids(cursor, Ingredient, ingredient_count))
+
+        recipes, ingredients = [], []
+        for pk, doc in zip(recipe_ids, documents):
+            recipe = build_recipe(doc, id=pk, updated_at=now)
+            recipes.append(recipe)
+            for ing in build_children(doc, recipe)[0]:
+                ing.id = next(ingredient_ids)
+                ingredients.append(ing)
+
+        copy_rows(cursor, Recipe, recipes)
+        copy_rows(cursor, Ingredient, ingredients)
+        # Images carry no bytes on import; a plain bulk INSERT is fine for them
+        Image.objects.bulk_create([
+            img for recipe, doc in zip(recipes, documents) for img in build_children(doc, recipe)[1]
+        ])
+        recipes_bulk_changed.send(sender=Recipe, recipe_ids=recipe_ids)
+    return recipe_ids
+
+
+def reserve_ids(cursor, model, count: int) -> list[int]:
+    if not count:
+        return []
+    table = model._meta.db_table
+    cursor.execute(
+        "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)", [table, count]
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+
+def copy_rows(cursor, model, objects) -> None:
+    if not objects:
+        return
+    fields = model._meta.concrete_fields
+    quote = connection.ops.quote_name
+    sql = f'COPY {quote(model._meta.db_table)} ({", ".join(quote(f.column) for f in fields)}) FROM STDIN'
+    with cursor.cursor.copy(sql) as copy:
+        for obj in objects:
+            copy.write_row([field.get_db_prep_save(getattr(obj, field.attname), connection) for field in fields])
+
+
+def iter_documents(stream, fmt: str = "ndjson"):
+    """
+    Yield (row_number, parsed_json_or_exception) from NDJSON (one document per line, streamed)
+    or a JSON array (loaded at once).
+    """
+    if fmt == "json":
+        try:
+            documents = json.load(stream)
+        except ValueError as e:
+            yield 1, e
+            return
+        if not isinstance(documents, list):
+            yield 1, ValueError("Expected a JSON array of recipes")
+            return
+        yield from enumerate(documents, start=1)
+        return
+
+    for number, line in enumerate(stream, start=1):
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        if not line.strip():
+            continue
+        try:
+            yield number, json.loads(line)
+        except ValueError as e:
+            yield number, e
+
+
+def import_recipes(stream, fmt: str = "ndjson", batch_size: int = DEFAULT_BATCH_SIZE, use_copy=None) -> dict:
+    """
+    Validate every document against RecipeCreate and commit valid ones in batches.
+    Invalid rows are reported (row number + errors) and skipped; they never abort a batch.
+    Rows the database refuses (e.g. a CHECK constraint) are found by retrying their batch row
+    by row and reported the same way. If the import stops on anything else, the report of what
+    was committed so far is returned with an "aborted" message.
+    """
+    if use_copy is None:
+        use_copy = can_copy()
+    report = {"created": 0, "failed": 0, "batches": 0, "method": "copy" if use_copy else "bulk_create", "errors": []}
+    batch = []  # (row number, RecipeCreate)
+
+    def save(documents):
+        # Each call is its own atomic block, a savepoint when an outer transaction is open
+        if use_copy:
+            copy_recipes(documents)
+        else:
+            create_recipes(documents)
+
+    def fail(number, details):
+        report["failed"] += 1
+        if len(report["errors"]) < MAX_REPORTED_ERRORS:
+            report["errors"].append({"row": number, "errors": details})
+
+    def flush():
+        if not batch:
+            return
+        try:
+            save([document for _, document in batch])
+            report["created"] += len(batch)
+        except DatabaseError:
+            # The batch was rolled back as a whole; keep the rows the database accepts
+            for number, document in batch:
+                try:
+                    save([document])
+                    report["created"] += 1
+                except DatabaseError as e:
+                    fail(number, str(e))
+        report["batches"] += 1
+        batch.clear()
+
+    try:
+        for number, document in iter_documents(stream, fmt):
+            try:
+                if isinstance(document, Exception):
+                    raise document
+                batch.append((number, RecipeCreate.model_validate(document)))
+            except (ValidationError, ValueError) as e:
+                fail(number, e.errors(include_url=False, include_context=False, include_input=False)
+                     if isinstance(e, ValidationError) else str(e))
+                continue
+            if len(batch) >= batch_size:
+                flush()
+        flush()
+    except Exception as e:
+        logger.exception("Import aborted after %s recipe(s)", report["created"])
+        report["aborted"] = str(e)
+
+    logger.info("Imported %s recipe(s), %s invalid row(s)", report["created"], report["failed"])
+    return report
@@ -0,0 +1,37 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apiapp import importer
+
+
+class Command(BaseCommand):
+    help = "Bulk import recipes from NDJSON (one RecipeCreate document per line) or a JSON array"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="File to read, or - for stdin")
+        parser.add_argument("--format", choices=["ndjson", "json"], default=None,
+                            help="Defaults to json for *.json files, ndjson otherwise")
+        parser.add_argument("--batch-size", type=int, default=importer.DEFAULT_BATCH_SIZE)
+        parser.add_argument("--no-copy", action="store_true", help="Use bulk_create even on PostgreSQL")
+        parser.add_argument("--errors", type=int, default=20, help="Print at most this many row errors")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        fmt = options["format"] or ("json" if path.endswith(".json") else "ndjson")
+        use_copy = False if options["no_copy"] else None
+
+        try:
+            stream = sys.stdin if path == "-" else open(path, encoding="utf-8")
+        except OSError as e:
+            raise CommandError(str(e))
+        with stream:
+            report = importer.import_recipes(stream, fmt, options["batch_size"], use_copy=use_copy)
+
+        for row in report["errors"][:options["errors"]]:
+            self.stderr.write(f"row {row['row']}: {json.dumps(row['errors'], default=str)}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {report['created']} recipe(s) in {report['batches']} batch(es) via {report['method']}; "
+            f"{report['failed']} invalid row(s)"
+        ))
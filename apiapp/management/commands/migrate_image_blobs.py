@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+
+from apiapp import storage
+from apiapp.models import Image
+from apiapp.signals import release_blob
+
+
+class Command(BaseCommand):
+    help = "Move image blobs between the database and the content-addressed filesystem store"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--to", choices=[storage.FILESYSTEM, storage.DATABASE], default=storage.FILESYSTEM)
+        parser.add_argument("--batch-size", type=int, default=100)
+
+    def handle(self, *args, **options):
+        target = options["to"]
+        ids = list(Image.objects.exclude(storage=target).values_list("id", flat=True))
+        self.stdout.write(f"Migrating {len(ids)} image(s) to {target}")
+
+        moved = 0
+        for start in range(0, len(ids), options["batch_size"]):
+            # One row at a time inside the batch, so at most one image is held in memory
+            for pk in ids[start:start + options["batch_size"]]:
+                self.move(Image.objects.metadata().get(pk=pk), target)
+                moved += 1
+            self.stdout.write(f"  {moved}/{len(ids)}")
+
+        self.stdout.write(self.style.SUCCESS(f"Migrated {moved} image(s)"))
+
+    def move(self, img, target):
+        old_digests = (img.sha256, img.thumbnail_sha256) if img.storage == storage.FILESYSTEM else ()
+        blobs = {}
+        for kind in Image.BLOB_FIELDS:
+            if getattr(img, "has_data" if kind == "data" else "has_thumbnail"):
+                with img.open_blob(kind) as fh:
+                    blobs[kind] = fh.read()
+
+        img.storage = target
+        for kind, content in blobs.items():
+            img.set_blob(kind, content)
+        if target == storage.FILESYSTEM:
+            img.data = img.thumbnail = None
+        img.save()
+
+        # Filesystem blobs left behind are cleaned up once nothing references them
+        for digest in old_digests:
+            release_blob(digest)
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from apiapp import read_model, response_cache
+
+
+class Command(BaseCommand):
+    help = (
+        "Build (or rebuild) the stored recipe documents served by the recipe read endpoints; run after "
+        "migrating, restoring a dump or changing IMAGE_VARIANT_WIDTHS"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=read_model.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        count = read_model.rebuild_all(options["batch_size"])
+        # Cached responses may have been rendered from the old documents
+        response_cache.invalidate_recipes()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} recipe document(s)"))
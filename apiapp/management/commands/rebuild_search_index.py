@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from apiapp import response_cache, search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the recipe full-text search index (tsvector column or FTS5 table) from the current rows"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        if search.backend() is None:
+            self.stderr.write("Full-text search is not supported on this database backend")
+            return
+        count = search.rebuild_index(options["batch_size"])
+        # Cached search pages were ranked against the old index
+        response_cache.invalidate_recipes()
+        self.stdout.write(self.style.SUCCESS(f"Reindexed {count} recipe(s)"))
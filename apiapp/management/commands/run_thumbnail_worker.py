@@ -0,0 +1,67 @@
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from apiapp import metrics, thumbnails
+from apiapp.utils.imaging import THUMBNAIL_SIZE, timed_thumbnail
+
+
+class Command(BaseCommand):
+    help = "Render queued thumbnails in a process pool, off the request path"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=None, help="Pool size (default: CPU count)")
+        parser.add_argument("--batch-size", type=int, default=16, help="Jobs claimed per poll")
+        parser.add_argument("--poll-interval", type=float, default=1.0, help="Seconds to sleep when idle")
+        parser.add_argument("--stale-after", type=int, default=300, help="Requeue jobs running longer than this")
+        parser.add_argument("--requeue-interval", type=float, default=60.0,
+                            help="Seconds between checks for stale jobs while running")
+        parser.add_argument("--once", action="store_true", help="Drain the queue and exit")
+
+    def handle(self, *args, **options):
+        # spawn: pool processes only run PIL and must not inherit Django's DB connections
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=options["workers"], mp_context=context) as pool:
+            # Checked at startup and then periodically: another worker may crash while this one runs
+            next_requeue = 0.0
+            while True:
+                close_old_connections()
+                if time.monotonic() >= next_requeue:
+                    requeued = thumbnails.requeue_stale(timedelta(seconds=options["stale_after"]))
+                    if requeued:
+                        self.stdout.write(f"Requeued {requeued} stale job(s)")
+                    next_requeue = time.monotonic() + options["requeue_interval"]
+                processed = self.run_batch(pool, options["batch_size"])
+                if processed:
+                    self.stdout.write(f"Processed {processed} job(s)")
+                elif options["once"]:
+                    break
+                else:
+                    time.sleep(options["poll_interval"])
+
+    def run_batch(self, pool, batch_size):
+        jobs = thumbnails.claim_jobs(batch_size)
+        futures = []
+        for job in jobs:
+            source = thumbnails.load_source(job)
+            if source is None:
+                thumbnails.skip_job(job)
+                continue
+            futures.append((job, time.perf_counter(), pool.submit(timed_thumbnail, source, THUMBNAIL_SIZE)))
+
+        for job, submitted, future in futures:
+            try:
+                thumb_bytes, content_type, elapsed = future.result()
+            except Exception as e:
+                # The render time stays in the pool process; time since submission is the best there is
+                metrics.observe_thumbnail(time.perf_counter() - submitted, "error")
+                thumbnails.fail_job(job, e)
+                continue
+            metrics.observe_thumbnail(elapsed)
+            thumbnails.complete_job(job, thumb_bytes, content_type)
+            thumbnails.logger.info("Thumbnail for image %s rendered in %.1f ms", job.image_id, elapsed * 1000)
+        return len(jobs)
@@ -0,0 +1,305 @@
+import atexit
+import contextvars
+import json
+import os
+import threading
+import time
+import weakref
+from bisect import bisect_left
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+# name -> (type, help, histogram bucket bounds)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (128, 512, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+QUERY_BUCKETS = (0, 1, 2, 3, 4, 5, 8, 13, 21, 34, 55, 100)
+FAMILIES = {
+    "mealmaster_http_requests_total": ("counter", "HTTP requests by route, method and status", None),
+    "mealmaster_http_request_duration_seconds": ("histogram", "Time spent handling a request", LATENCY_BUCKETS),
+    "mealmaster_http_response_size_bytes": ("histogram", "Response body size (when known up front)", SIZE_BUCKETS),
+    "mealmaster_db_queries_per_request": ("histogram", "Database queries run while handling a request", QUERY_BUCKETS),
+    "mealmaster_db_query_seconds_total": ("counter", "Time spent in database queries", None),
+    "mealmaster_thumbnail_duration_seconds": ("histogram", "Time to render a thumbnail", LATENCY_BUCKETS),
+    "mealmaster_db_alias_queries_total": ("counter", "Database queries by connection alias", None),
+    "mealmaster_db_alias_query_seconds_total": ("counter", "Time spent in database queries by connection alias", None),
+    "mealmaster_db_connects_total": ("counter", "Connections opened (or taken from the pool) by alias", None),
+    "mealmaster_db_pool_connections": ("gauge", "psycopg pool connections by alias and state", None),
+}
+
+# Multiprocess mode: each process writes its totals to <dir>/<pid>-<start>.json at most every
+# FLUSH_SECONDS, and a scrape in any process adds up every file in the directory
+MULTIPROC_DIR = getattr(settings, "METRICS_MULTIPROC_DIR", None)
+FLUSH_SECONDS = getattr(settings, "METRICS_FLUSH_SECONDS", 2.0)
+
+
+def enabled() -> bool:
+    return getattr(settings, "METRICS_ENABLED", True)
+
+
+class Shard:
+    """
+    One thread's share of the metrics. Only its own thread writes to it, so recording takes
+    no lock; readers copy it, which is safe under the GIL (values are at worst one update old).
+    """
+    __slots__ = ("counters", "histograms", "__weakref__")
+
+    def __init__(self):
+        self.counters = {}    # (name, labels) -> float
+        self.histograms = {}  # (name, labels) -> [per-bucket counts..., +Inf count, sum, count]
+
+    def inc(self, name: str, labels: tuple, amount: float = 1) -> None:
+        key = (name, labels)
+        self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name: str, labels: tuple, value: float) -> None:
+        key = (name, labels)
+        bounds = FAMILIES[name][2]
+        hist = self.histograms.get(key)
+        if hist is None:
+            hist = self.histograms[key] = [0] * (len(bounds) + 3)
+        hist[bisect_left(bounds, value)] += 1
+        hist[-2] += value
+        hist[-1] += 1
+
+    def merge(self, counters, histograms) -> None:
+        for key, value in counters:
+            self.counters[key] = self.counters.get(key, 0) + value
+        for key, values in histograms:
+            hist = self.histograms.get(key)
+            if hist is None:
+                self.histograms[key] = list(values)
+            else:
+                for i, v in enumerate(values):
+                    hist[i] += v
+
+    def items(self):
+        # list() of a dict's items runs without releasing the GIL, so a concurrent insert cannot break it
+        return list(self.counters.items()), [(k, list(v)) for k, v in list(self.histograms.items())]
+
+
+class Registry:
+    def __init__(self):
+        # Re-entrant: a shard can be finalized (and retired) while a snapshot holds the lock
+        self.lock = threading.RLock()
+        self.local = threading.local()
+        self.shards = weakref.WeakSet()
+        # Totals of threads that have exited, so counters never go backwards
+        self.retired = Shard()
+        self.next_flush = 0.0
+        self.flush_lock = threading.Lock()
+        self.path = None
+
+    def shard(self) -> Shard:
+        try:
+            return self.local.shard
+        except AttributeError:
+            shard = self.local.shard = Shard()
+            with self.lock:
+                self.shards.add(shard)
+            # The thread-local goes away with the thread; its numbers move to `retired`
+            weakref.finalize(shard, self.retire, shard.counters, shard.histograms)
+            return shard
+
+    def retire(self, counters, histograms) -> None:
+        with self.lock:
+            self.retired.merge(list(counters.items()), list(histograms.items()))
+
+    def snapshot(self) -> Shard:
+        total = Shard()
+        with self.lock:
+            total.merge(*self.retired.items())
+            for shard in list(self.shards):
+                total.merge(*shard.items())
+        # Gauges are read when collected; across processes they add up like the counters
+        total.merge(pool_gauges(), ())
+        return total
+
+    # -- multiprocess ---------------------------------------------------------------------------
+
+    def maybe_flush(self) -> None:
+        if MULTIPROC_DIR and time.monotonic() >= self.next_flush:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write this process's totals for other processes to read; atomic via rename"""
+        if not self.flush_lock.acquire(blocking=False):
+            return  # another thread is writing the same file right now
+        try:
+            self.write_file()
+        finally:
+            self.flush_lock.release()
+
+    def write_file(self) -> None:
+        self.next_flush = time.monotonic() + FLUSH_SECONDS
+        if self.path is None:
+            Path(MULTIPROC_DIR).mkdir(parents=True, exist_ok=True)
+            # Start time in the name: a recycled pid must not overwrite a dead process's totals
+            self.path = Path(MULTIPROC_DIR) / f"{os.getpid()}-{time.time_ns()}.json"
+        counters, histograms = self.snapshot().items()
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps({
+            "counters": [[name, list(labels), value] for (name, labels), value in counters],
+            "histograms": [[name, list(labels), values] for (name, labels), values in histograms],
+        }))
+        os.replace(tmp, self.path)
+
+    def collect(self) -> Shard:
+        """Totals for this process, or for every process sharing MULTIPROC_DIR"""
+        if not MULTIPROC_DIR:
+            return self.snapshot()
+        self.flush()
+        total = Shard()
+        for path in Path(MULTIPROC_DIR).glob("*.json"):
+            try:
+                data = json.loads(path.read_text())
+            except (OSError, ValueError):
+                continue
+            total.merge(
+                [((name, tuple(labels)), value) for name, labels, value in data["counters"]],
+                [((name, tuple(labels)), values) for name, labels, values in data["histograms"]],
+            )
+        return total
+
+
+registry = Registry()
+if MULTIPROC_DIR:
+    atexit.register(registry.flush)
+
+
+# -- recording ----------------------------------------------------------------------------------
+
+def observe_request(route: str, method: str, status: int, seconds: float, size: int | None,
+                    queries: int, query_seconds: float) -> None:
+    shard = registry.shard()
+    labels = (route, method)
+    shard.inc("mealmaster_http_requests_total", (route, method, str(status)))
+    shard.observe("mealmaster_http_request_duration_seconds", labels, seconds)
+    if size is not None:
+        shard.observe("mealmaster_http_response_size_bytes", labels, size)
+    shard.observe("mealmaster_db_queries_per_request", labels, queries)
+    if query_seconds:
+        shard.inc("mealmaster_db_query_seconds_total", labels, query_seconds)
+    registry.maybe_flush()
+
+
+def observe_thumbnail(seconds: float, outcome: str = "ok") -> None:
+    if enabled():
+        registry.shard().observe("mealmaster_thumbnail_duration_seconds", (outcome,), seconds)
+        registry.maybe_flush()
+
+
+class QueryTimer:
+    """Counts the queries (and their time) of one request; see timed_execute"""
+    __slots__ = ("count", "seconds")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+
+# The timer of the request being handled. A context variable rather than a per-request
+# execute_wrapper: under ASGI the ORM runs on a sync_to_async thread with its own connection
+# objects, which inherit the request's context but not wrappers installed from the event loop.
+query_timer = contextvars.ContextVar("query_timer", default=None)
+
+
+def timed_execute(execute, sql, params, many, context):
+    if not enabled():
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        alias = (context["connection"].alias,)
+        shard = registry.shard()
+        shard.inc("mealmaster_db_alias_queries_total", alias)
+        shard.inc("mealmaster_db_alias_query_seconds_total", alias, elapsed)
+        timer = query_timer.get()
+        if timer is not None:
+            timer.seconds += elapsed
+            timer.count += 1
+
+
+@receiver(connection_created)
+def install_query_timer(sender, connection, **kwargs):
+    if enabled():
+        registry.shard().inc("mealmaster_db_connects_total", (connection.alias,))
+    # Sent again on every reconnect of the same connection object
+    if timed_execute not in connection.execute_wrappers:
+        connection.execute_wrappers.append(timed_execute)
+
+
+POOL_STATES = ("pool_size", "pool_available", "requests_waiting")
+
+
+def pool_gauges() -> list:
+    """Sizes of the psycopg pools this process has opened (DB_POOL=1 in settings)"""
+    gauges = []
+    for alias in connections:
+        # Django keeps one pool per alias on the backend class; absent for other backends
+        pool = getattr(connections[alias], "_connection_pools", {}).get(alias)
+        if pool is None:
+            continue
+        stats = pool.get_stats()
+        for state in POOL_STATES:
+            gauges.append((("mealmaster_db_pool_connections", (alias, state)), stats.get(state, 0)))
+    return gauges
+
+
+# -- exposition ---------------------------------------------------------------------------------
+
+LABEL_NAMES = {
+    "mealmaster_http_requests_total": ("route", "method", "status"),
+    "mealmaster_thumbnail_duration_seconds": ("outcome",),
+    "mealmaster_db_alias_queries_total": ("alias",),
+    "mealmaster_db_alias_query_seconds_total": ("alias",),
+    "mealmaster_db_connects_total": ("alias",),
+    "mealmaster_db_pool_connections": ("alias", "state"),
+}
+DEFAULT_LABEL_NAMES = ("route", "method")
+
+
+def escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names, values, extra: str = "") -> str:
+    pairs = [f'{n}="{escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def format_value(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render() -> str:
+    """Prometheus text exposition format (version 0.0.4)"""
+    totals = registry.collect()
+    lines = []
+    for name, (kind, help_text, bounds) in FAMILIES.items():
+        names = LABEL_NAMES.get(name, DEFAULT_LABEL_NAMES)
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        if kind in ("counter", "gauge"):
+            for (metric, labels), value in sorted(totals.counters.items()):
+                if metric == name:
+                    lines.append(f"{name}{format_labels(names, labels)} {format_value(value)}")
+            continue
+        for (metric, labels), hist in sorted(totals.histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, count in zip((*bounds, "+Inf"), hist):
+                cumulative += count
+                le = 'le="%s"' % (bound if bound == "+Inf" else format_value(bound))
+                lines.append(f"{name}_bucket{format_labels(names, labels, le)} {cumulative}")
+            lines.append(f"{name}_sum{format_labels(names, labels)} {format_value(hist[-2])}")
+            lines.append(f"{name}_count{format_labels(names, labels)} {hist[-1]}")
+    return "\n".join(lines) + "\n"
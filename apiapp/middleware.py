@@ -0,0 +1,228 @@
+import re
+import time
+import uuid
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from mainapp import db_router
+from . import metrics
+from .utils import log
+
+
+def stream_in_context(response, values: dict, done=None):
+    """
+    A streamed body is produced after the middleware have returned and reset their context
+    variables, so without this the export's queries would run on the primary, uncounted and
+    unlogged. Each chunk is produced with `values` ({ContextVar: value}) set again, and
+    `done(bytes sent)` is called once the stream is exhausted or closed.
+    """
+    if getattr(response, "file_to_stream", None) is not None:
+        # File bodies run no queries, and re-wrapping them would lose wsgi.file_wrapper
+        if done is not None:
+            done(None)
+        return response
+    if response.is_async:
+        response.streaming_content = abound_chunks(response.streaming_content, values, done)
+    else:
+        response.streaming_content = bound_chunks(response.streaming_content, values, done)
+    return response
+
+
+def bound_chunks(chunks, values: dict, done):
+    sent = 0
+    try:
+        while True:
+            tokens = [(var, var.set(value)) for var, value in values.items()]
+            try:
+                chunk = next(chunks, None)
+            finally:
+                for var, token in reversed(tokens):
+                    var.reset(token)
+            if chunk is None:
+                return
+            sent += len(chunk)
+            yield chunk
+    finally:
+        if done is not None:
+            done(sent)
+
+
+async def abound_chunks(chunks, values: dict, done):
+    sent = 0
+    try:
+        while True:
+            tokens = [(var, var.set(value)) for var, value in values.items()]
+            try:
+                chunk = await anext(chunks, None)
+            finally:
+                for var, token in reversed(tokens):
+                    var.reset(token)
+            if chunk is None:
+                return
+            sent += len(chunk)
+            yield chunk
+    finally:
+        if done is not None:
+            done(sent)
+
+
+class MetricsMiddleware:
+    """
+    Records per-route request counts, statuses, latency, response size and database queries/time
+    (see metrics.py). The route label is the matched URL pattern, e.g. "api/recipes/<recipe_id>",
+    which together with the method identifies the Ninja operation and keeps label values bounded.
+    Async-capable, so it never pushes an ASGI request onto a thread by itself.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not metrics.enabled():
+            return self.get_response(request)
+
+        timer = metrics.QueryTimer()
+        token = metrics.query_timer.set(timer)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.query_timer.reset(token)
+        return self.finish(request, response, started, timer)
+
+    async def __acall__(self, request):
+        if not metrics.enabled():
+            return await self.get_response(request)
+
+        timer = metrics.QueryTimer()
+        token = metrics.query_timer.set(timer)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.query_timer.reset(token)
+        return self.finish(request, response, started, timer)
+
+    def finish(self, request, response, started: float, timer: "metrics.QueryTimer"):
+        if not response.streaming:
+            self.record(request, response, time.perf_counter() - started, timer)
+            return response
+        # Recorded once the body is sent, with the queries run while producing it
+        return stream_in_context(
+            response, {metrics.query_timer: timer},
+            lambda sent: self.record(request, response, time.perf_counter() - started, timer, sent),
+        )
+
+    def record(self, request, response, elapsed: float, timer: "metrics.QueryTimer", sent=None) -> None:
+        match = request.resolver_match
+        if response.has_header("Content-Length"):
+            size = int(response["Content-Length"])
+        else:
+            size = sent if response.streaming else len(response.content)
+        metrics.observe_request(match.route if match else "unmatched", request.method, response.status_code,
+                                elapsed, size, timer.count, timer.seconds)
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Picks the database for a request's reads (see mainapp/db_router.py): GET and HEAD go to a
+    replica, except from a client that wrote within REPLICA_PIN_SECONDS, which the pin cookie set
+    on every other method's response sends to the primary so it reads its own writes.
+    """
+    sync_capable = True
+    async_capable = True
+    COOKIE = "mm_read_primary"
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        alias = self.read_alias(request)
+        token = db_router.read_alias.set(alias)
+        try:
+            response = self.get_response(request)
+        finally:
+            db_router.read_alias.reset(token)
+        return self.pin(request, response, alias)
+
+    async def __acall__(self, request):
+        alias = self.read_alias(request)
+        token = db_router.read_alias.set(alias)
+        try:
+            response = await self.get_response(request)
+        finally:
+            db_router.read_alias.reset(token)
+        return self.pin(request, response, alias)
+
+    def read_alias(self, request) -> str | None:
+        if request.method not in ("GET", "HEAD") or self.COOKIE in request.COOKIES:
+            return None
+        return db_router.choose_replica()
+
+    def pin(self, request, response, alias):
+        if request.method not in ("GET", "HEAD", "OPTIONS") and db_router.replicas():
+            response.set_cookie(self.COOKIE, "1", max_age=getattr(settings, "REPLICA_PIN_SECONDS", 10),
+                                httponly=True, samesite="Lax")
+        if response.streaming and alias is not None:
+            # The export reads the rest of its rows while streaming, from the same replica
+            stream_in_context(response, {db_router.read_alias: alias})
+        return response
+
+
+class RequestIdMiddleware:
+    """
+    Tags the request's log records with an id (see utils/log.py): the caller's X-Request-ID when it
+    is a sane token, else a new one. Echoed in the response so clients can quote it.
+    """
+    sync_capable = True
+    async_capable = True
+    HEADER = "X-Request-ID"
+    VALID = re.compile(r"[A-Za-z0-9._:-]{1,64}")
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        request_id = self.request_id(request)
+        token = log.request_id.set(request_id)
+        try:
+            response = self.get_response(request)
+        finally:
+            log.request_id.reset(token)
+        return self.tag(response, request_id)
+
+    async def __acall__(self, request):
+        request_id = self.request_id(request)
+        token = log.request_id.set(request_id)
+        try:
+            response = await self.get_response(request)
+        finally:
+            log.request_id.reset(token)
+        return self.tag(response, request_id)
+
+    def tag(self, response, request_id: str):
+        response[self.HEADER] = request_id
+        if response.streaming:
+            stream_in_context(response, {log.request_id: request_id})
+        return response
+
+    def request_id(self, request) -> str:
+        supplied = request.headers.get(self.HEADER, "")
+        # Also kept on the request, for records logged after the middleware returns
+        request.request_id = supplied if self.VALID.fullmatch(supplied) else uuid.uuid4().hex
+        return request.request_id
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:58
+
+from django.db import migrations, models
+
+
+def backfill_flags(apps, schema_editor):
+    Image = apps.get_model("apiapp", "Image")
+    Image.objects.filter(data__isnull=False).update(has_data=True)
+    Image.objects.filter(thumbnail__isnull=False).update(has_thumbnail=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apiapp', '0004_recipe_sort_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='has_data',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='has_thumbnail',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(backfill_flags, migrations.RunPython.noop),
+    ]
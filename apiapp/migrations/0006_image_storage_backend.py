@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apiapp', '0005_image_blob_flags'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='sha256',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='storage',
+            field=models.CharField(choices=[('database', 'Database'), ('filesystem', 'Filesystem')], default='database', max_length=16),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='thumbnail_sha256',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=64),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:01
+
+import hashlib
+
+from django.db import migrations, models
+
+
+def backfill_image_digests(apps, schema_editor):
+    """Database-stored images uploaded before digests existed get one, so they can carry ETags"""
+    Image = apps.get_model("apiapp", "Image")
+    pending = Image.objects.filter(storage="database", sha256="").values_list("id", flat=True)
+    for pk in list(pending):
+        data, thumbnail = Image.objects.filter(pk=pk).values_list("data", "thumbnail").get()
+        Image.objects.filter(pk=pk).update(
+            sha256=hashlib.sha256(data).hexdigest() if data else "",
+            thumbnail_sha256=hashlib.sha256(thumbnail).hexdigest() if thumbnail else "",
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apiapp', '0006_image_storage_backend'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(backfill_image_digests, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:03
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def mark_existing_thumbnails(apps, schema_editor):
+    Image = apps.get_model("apiapp", "Image")
+    Image.objects.filter(has_thumbnail=True).update(thumbnail_status="ready")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apiapp', '0007_recipe_updated_at_and_digests'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='thumbnail_status',
+            field=models.CharField(choices=[('none', 'None'), ('pending', 'Pending'), ('ready', 'Ready'), ('failed', 'Failed')], default='none', max_length=16),
+        ),
+        migrations.CreateModel(
+            name='ThumbnailJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='queued', max_length=16)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('image', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='thumbnail_jobs', to='apiapp.image')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'created_at'], name='thumbjob_status_created_idx')],
+            },
+        ),
+        migrations.RunPython(mark_existing_thumbnails, migrations.RunPython.noop),
+    ]
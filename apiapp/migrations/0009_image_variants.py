@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:04
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apiapp', '0008_thumbnail_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageVariant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('width', models.PositiveIntegerField()),
+                ('format', models.CharField(max_length=8)),
+                ('content_type', models.CharField(max_length=100)),
+                ('size', models.PositiveIntegerField(default=0)),
+                ('storage', models.CharField(choices=[('database', 'Database'), ('filesystem', 'Filesystem')], default='database', max_length=16)),
+                ('sha256', models.CharField(db_index=True, max_length=64)),
+                ('data', models.BinaryField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('image', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='variants', to='apiapp.image')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('image', 'width', 'format'), name='unique_image_variant')],
+            },
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:10
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+PG_BACKFILL = """
+    UPDATE apiapp_recipe r SET search_vector =
+        setweight(to_tsvector('english', coalesce(r.name, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(
+            (SELECT string_agg(i.name, ' ') FROM apiapp_ingredient i WHERE i.recipe_id = r.id), ''
+        )), 'B') ||
+        setweight(to_tsvector('english', coalesce(r.description, '')), 'C') ||
+        setweight(to_tsvector('english', coalesce(r.instructions, '')), 'D')
+"""
+
+FTS_BACKFILL = """
+    INSERT INTO apiapp_recipe_fts (rowid, name, ingredients, description, instructions)
+    SELECT r.id, r.name,
+           coalesce((SELECT group_concat(i.name, ' ') FROM apiapp_ingredient i WHERE i.recipe_id = r.id), ''),
+           r.description, r.instructions
+    FROM apiapp_recipe r
+"""
+
+
+def create_search_index(apps, schema_editor):
+    """GIN index on the tsvector column for PostgreSQL, an FTS5 table for SQLite; other backends get nothing"""
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        schema_editor.execute(PG_BACKFILL)
+        schema_editor.execute("CREATE INDEX recipe_search_vector_gin ON apiapp_recipe USING gin (search_vector)")
+    elif vendor == "sqlite":
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE apiapp_recipe_fts USING fts5("
+            "name, ingredients, description, instructions, tokenize = 'porter unicode61')"
+        )
+        schema_editor.execute(FTS_BACKFILL)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        schema_editor.execute("DROP INDEX IF EXISTS recipe_search_vector_gin")
+    elif vendor == "sqlite":
+        schema_editor.execute("DROP TABLE IF EXISTS apiapp_recipe_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apiapp', '0010_image_dimensions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apiapp', '0011_recipe_search'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['meal_type', 'diet_type', 'preparation_time'], name='recipe_meal_diet_prep_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['meal_category', 'diet_type', 'cooking_time'], name='recipe_cat_diet_cook_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['difficulty_level', 'preparation_time'], name='recipe_difficulty_prep_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apiapp', '0013_recipe_updated_at_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeDocument',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='document', serialize=False, to='apiapp.recipe')),
+                ('body', models.TextField()),
+            ],
+        ),
+    ]
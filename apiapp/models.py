@@ -1,11 +1,22 @@
+import asyncio
+import io
+
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from .constants import DietType, MealType, MealCategory, DifficultyLevel, MeasurementUnit
 from django.utils import timezone
+from . import storage
 
 def enum_choices(enum_cls):
     return [(member.value, member.name.capitalize().replace("_", " ")) for member in enum_cls]
 
 # Recipe 
+class RecipeManager(models.Manager):
+    def get_queryset(self):
+        # The search document is only ever read by the database itself
+        return super().get_queryset().defer("search_vector")
+
+
 class Recipe(models.Model):
     name = models.CharField(max_length=255)
     description = models.TextField(blank=True)
@@ -19,6 +30,28 @@ class Recipe(models.Model):
     video_url = models.URLField(blank=True, null=True)
     rating = models.FloatField(default=0)
     number_of_servings = models.PositiveIntegerField(default=1)
+    # Bumped on every write to the recipe or its ingredients/images (see signals.py); drives ETags
+    updated_at = models.DateTimeField(auto_now=True)
+    # Weighted tsvector over name, ingredient names, description and instructions (see search.py).
+    # PostgreSQL only; SQLite keeps its search index in an FTS5 table instead.
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = RecipeManager()
+
+    class Meta:
+        # (sort key, id) pairs back keyset pagination on the list endpoint
+        indexes = [
+            models.Index(fields=["name", "id"], name="recipe_name_id_idx"),
+            models.Index(fields=["rating", "id"], name="recipe_rating_id_idx"),
+            models.Index(fields=["preparation_time", "id"], name="recipe_prep_id_idx"),
+            models.Index(fields=["cooking_time", "id"], name="recipe_cook_id_idx"),
+            # Browse filters: enum equality first, then a range column the same scan can narrow
+            models.Index(fields=["meal_type", "diet_type", "preparation_time"], name="recipe_meal_diet_prep_idx"),
+            models.Index(fields=["meal_category", "diet_type", "cooking_time"], name="recipe_cat_diet_cook_idx"),
+            models.Index(fields=["difficulty_level", "preparation_time"], name="recipe_difficulty_prep_idx"),
+            # Lets in-memory indexes (pantry.py) pick up recently changed recipes
+            models.Index(fields=["updated_at"], name="recipe_updated_at_idx"),
+        ]
 
     def __str__(self):
         return self.name
@@ -35,12 +68,6 @@ class Recipe(models.Model):
             category=category,
         )
 
-    def __eq__(self, other):
-        return isinstance(other, Recipe) and self.name == other.name
-
-    def __hash__(self):
-        return hash((self.name, self.instructions, self.preparation_time))
-    
 
 #Ingredients
 class Ingredient(models.Model):
@@ -55,15 +82,32 @@ class Ingredient(models.Model):
     def __str__(self):
         return f"{self.quantity} {self.get_measurement_unit_display()} of {self.name}"
 
-    def __eq__(self, other):
-        if not isinstance(other, Ingredient):
-            return False
-        return self.name == other.name
-
-    def __hash__(self):
-        return hash((self.name, self.quantity, self.recipe_id, self.category))
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remembered so a move to another recipe can touch both recipes
+        instance._loaded_recipe_id = instance.__dict__.get("recipe_id")
+        return instance
 
 # Images
+THUMBNAIL_NONE = "none"
+THUMBNAIL_PENDING = "pending"
+THUMBNAIL_READY = "ready"
+THUMBNAIL_FAILED = "failed"
+THUMBNAIL_STATUS_CHOICES = [
+    (THUMBNAIL_NONE, "None"),
+    (THUMBNAIL_PENDING, "Pending"),
+    (THUMBNAIL_READY, "Ready"),
+    (THUMBNAIL_FAILED, "Failed"),
+]
+
+
+class ImageQuerySet(models.QuerySet):
+    def metadata(self):
+        """Everything except the blob columns, for listings and URL building"""
+        return self.defer("data", "thumbnail")
+
+
 class Image(models.Model):
     recipe = models.ForeignKey(Recipe, related_name="images", on_delete=models.CASCADE)
     filename = models.CharField(max_length=255)
@@ -73,13 +117,196 @@ class Image(models.Model):
     thumbnail = models.BinaryField(null=True, blank=True)
     thumbnail_content_type = models.CharField(max_length=100, null=True, default=None)
     created_at = models.DateTimeField(default=timezone.now)
+    # Mirrors of "data/thumbnail is set" so metadata queries never need the blobs
+    has_data = models.BooleanField(default=False)
+    has_thumbnail = models.BooleanField(default=False)
+    # Where the bytes live; "filesystem" rows keep data/thumbnail NULL and address blobs by digest
+    storage = models.CharField(max_length=16, choices=storage.STORAGE_CHOICES, default=storage.DATABASE)
+    sha256 = models.CharField(max_length=64, blank=True, default="", db_index=True)
+    thumbnail_sha256 = models.CharField(max_length=64, blank=True, default="", db_index=True)
+    # Thumbnails are rendered by the background worker (see thumbnails.py)
+    thumbnail_status = models.CharField(max_length=16, choices=THUMBNAIL_STATUS_CHOICES, default=THUMBNAIL_NONE)
+    # Pixel dimensions read from the header at upload time
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+
+    objects = ImageQuerySet.as_manager()
+
+    # blob kind -> (bytes column, digest column)
+    BLOB_FIELDS = {"data": ("data", "sha256"), "thumbnail": ("thumbnail", "thumbnail_sha256")}
+
+    def save(self, *args, **kwargs):
+        if self.storage == storage.DATABASE:
+            deferred = self.get_deferred_fields()
+            if "data" not in deferred:
+                self.has_data = bool(self.data)
+            if "thumbnail" not in deferred:
+                self.has_thumbnail = bool(self.thumbnail)
+        super().save(*args, **kwargs)
+
+    def set_blob(self, kind, content):
+        """Store bytes for "data" or "thumbnail" in this row's backend (does not save the row)"""
+        column, digest_column = self.BLOB_FIELDS[kind]
+        if self.storage == storage.FILESYSTEM:
+            digest = storage.get_blob_store().put(content)
+            self.pending_blobs[digest] = content
+            setattr(self, digest_column, digest)
+            setattr(self, column, None)
+        else:
+            setattr(self, digest_column, storage.sha256_hex(content))
+            setattr(self, column, content)
+        setattr(self, "has_data" if kind == "data" else "has_thumbnail", True)
+
+    def set_blob_stream(self, kind, chunks) -> int:
+        """set_blob() for an iterable of chunks; filesystem rows never hold the whole blob. Returns the size"""
+        column, digest_column = self.BLOB_FIELDS[kind]
+        if self.storage != storage.FILESYSTEM:
+            content = b"".join(chunks)
+            self.set_blob(kind, content)
+            return len(content)
+        digest, size, staged = storage.get_blob_store().stage_stream(chunks)
+        self.pending_blobs[digest] = staged
+        setattr(self, digest_column, digest)
+        setattr(self, column, None)
+        setattr(self, "has_data" if kind == "data" else "has_thumbnail", True)
+        return size
+
+    @property
+    def pending_blobs(self) -> dict:
+        """Filesystem blobs written for this row since it was loaded: digest -> bytes or staged path"""
+        if "_pending_blobs" not in self.__dict__:
+            self._pending_blobs = {}
+        return self._pending_blobs
+
+    def blob_digests(self) -> tuple:
+        """Digests to hold storage.blob_lock() on while saving this row"""
+        return (self.sha256, self.thumbnail_sha256) if self.storage == storage.FILESYSTEM else ()
+
+    def publish_blobs(self) -> None:
+        """
+        Put back any pending blob that was released since it was written; call under
+        storage.blob_lock(*self.blob_digests()), before the INSERT/UPDATE that references it
+        """
+        store = storage.get_blob_store()
+        for digest, source in self.pending_blobs.items():
+            if isinstance(source, bytes):
+                store.put(source)
+            else:
+                store.publish(digest, source)
+        self.pending_blobs.clear()
+
+    def discard_blobs(self) -> None:
+        """Drop the private links of staged blobs the row will not be saved with"""
+        store = storage.get_blob_store()
+        for source in self.pending_blobs.values():
+            if not isinstance(source, bytes):
+                store.discard(source)
+        self.pending_blobs.clear()
+
+    def blob_source(self, kind):
+        """Filesystem path of the blob, or its bytes for database rows; what the imaging helpers accept"""
+        column, digest_column = self.BLOB_FIELDS[kind]
+        if self.storage == storage.FILESYSTEM:
+            return str(storage.get_blob_store().path(getattr(self, digest_column)))
+        with self.open_blob(kind) as fh:
+            return fh.read()
+
+    def open_blob(self, kind):
+        """Readable binary file object for the blob; filesystem blobs are never read into memory here"""
+        column, digest_column = self.BLOB_FIELDS[kind]
+        if self.storage == storage.FILESYSTEM:
+            return storage.get_blob_store().open(getattr(self, digest_column))
+        if column in self.get_deferred_fields():
+            self.refresh_from_db(fields=[column])
+        return io.BytesIO(getattr(self, column) or b"")
+
+    async def aopen_blob(self, kind):
+        """open_blob() for async views; a deferred bytes column is loaded through the async ORM"""
+        column = self.BLOB_FIELDS[kind][0]
+        if self.storage != storage.FILESYSTEM and column in self.get_deferred_fields():
+            await self.arefresh_from_db(fields=[column])
+        return self.open_blob(kind)
 
     def __str__(self):
         return f"{self.filename} ({self.size} bytes)"
-    def __eq__(self, other):
-        if not isinstance(other, Image):
-            return False
-        return self.image_name == other.image_name and self.image_url == other.image_url
 
-    def __hash__(self):
-        return hash((self.image_name, self.image_url, self.recipe_id))
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_recipe_id = instance.__dict__.get("recipe_id")
+        return instance
+
+
+# Background thumbnail jobs, claimed by `manage.py run_thumbnail_worker`
+class ThumbnailJob(models.Model):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [(QUEUED, "Queued"), (RUNNING, "Running"), (DONE, "Done"), (FAILED, "Failed")]
+
+    image = models.ForeignKey(Image, related_name="thumbnail_jobs", on_delete=models.CASCADE)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "created_at"], name="thumbjob_status_created_idx")]
+
+    def __str__(self):
+        return f"thumbnail job {self.id} for image {self.image_id} ({self.status})"
+
+
+# Resized/re-encoded renditions of an Image, rendered lazily by /images/{id}/v/{width}.{fmt}
+class ImageVariant(models.Model):
+    image = models.ForeignKey(Image, related_name="variants", on_delete=models.CASCADE)
+    width = models.PositiveIntegerField()
+    format = models.CharField(max_length=8)
+    content_type = models.CharField(max_length=100)
+    size = models.PositiveIntegerField(default=0)
+    storage = models.CharField(max_length=16, choices=storage.STORAGE_CHOICES, default=storage.DATABASE)
+    sha256 = models.CharField(max_length=64, db_index=True)
+    data = models.BinaryField(null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["image", "width", "format"], name="unique_image_variant"),
+        ]
+
+    def __str__(self):
+        return f"{self.image_id} @ {self.width}w {self.format}"
+
+    def set_blob(self, content):
+        self.size = len(content)
+        if self.storage == storage.FILESYSTEM:
+            self.sha256 = storage.get_blob_store().put(content)
+            self.data = None
+        else:
+            self.sha256 = storage.sha256_hex(content)
+            self.data = content
+
+    def read_blob(self) -> bytes:
+        if self.storage == storage.FILESYSTEM:
+            with storage.get_blob_store().open(self.sha256) as fh:
+                return fh.read()
+        if "data" in self.get_deferred_fields():
+            self.refresh_from_db(fields=["data"])
+        return bytes(self.data or b"")
+
+    async def aread_blob(self) -> bytes:
+        if self.storage == storage.FILESYSTEM:
+            return await asyncio.to_thread(self.read_blob)
+        if "data" in self.get_deferred_fields():
+            await self.arefresh_from_db(fields=["data"])
+        return bytes(self.data or b"")
+
+
+# Rendered RecipeRead payload of a recipe, rebuilt with every write to it (see read_model.py)
+class RecipeDocument(models.Model):
+    recipe = models.OneToOneField(Recipe, primary_key=True, related_name="document", on_delete=models.CASCADE)
+    # JSON text; URLs are stored without scheme and host, which come from the request
+    body = models.TextField()
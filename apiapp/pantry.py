@@ -0,0 +1,267 @@
+import logging
+import re
+import threading
+import time
+from array import array
+from datetime import timedelta
+from functools import lru_cache
+from itertools import groupby
+from operator import itemgetter
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Ingredient, Recipe
+
+logger = logging.getLogger(__name__)
+
+# Changes committed by other processes are picked up through Recipe.updated_at; the overlap
+# re-reads a few seconds back so transactions that committed late are not missed
+SYNC_OVERLAP = timedelta(seconds=getattr(settings, "PANTRY_SYNC_OVERLAP_SECONDS", 5))
+# Rows per fetch while building the index
+LOAD_CHUNK_SIZE = 20_000
+# A posting switches from a set of ids to a bitmap once it holds more than max_id / DENSE_RATIO ids
+DENSE_RATIO = 512
+MAX_PANTRY_ITEMS = 50
+MAX_MISSING = 10
+
+
+@lru_cache(maxsize=65536)
+def normalize_name(name: str) -> str:
+    """'Tomatoes ', 'tomato' and 'TOMATO!' index under the same key"""
+    words = re.findall(r"[a-z0-9]+", name.lower())
+    return " ".join(singular(w) for w in words)
+
+
+def singular(word: str) -> str:
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("oes"):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us")):
+        return word[:-1]
+    return word
+
+
+def bitmap_from_ids(ids) -> int:
+    if not ids:
+        return 0
+    buf = bytearray(max(ids) // 8 + 1)
+    for pk in ids:
+        buf[pk >> 3] |= 1 << (pk & 7)
+    return int.from_bytes(buf, "little")
+
+
+def iter_bits(bitmap: int):
+    """Set bit positions in ascending order"""
+    bits = bin(bitmap)[:1:-1]
+    pos = bits.find("1")
+    while pos != -1:
+        yield pos
+        pos = bits.find("1", pos + 1)
+
+
+class PantryIndex:
+    """
+    Normalized ingredient name -> recipe ids, held in memory.
+
+    Postings are Python ints used as bitmaps (bit n = recipe id n) for common names and plain
+    sets for rare ones. A pantry query adds the pantry's postings together with a bit-sliced
+    counter, so "how many pantry items does each recipe use" is a handful of big-int
+    operations rather than a pass over Ingredient rows. `sizes` groups recipes by their number
+    of distinct ingredients, which turns "missing k" into a few ANDs.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.reset()
+
+    def reset(self) -> None:
+        self.loaded = False
+        self.synced_at = None
+        self.terms = {}          # normalized name -> term id
+        self.postings = []       # term id -> int bitmap | set of recipe ids
+        self.recipe_terms = {}   # recipe id -> packed array of term ids
+        self.sizes = {}          # distinct ingredient count -> bitmap of recipe ids
+        self.max_id = 0
+
+    # -- building ---------------------------------------------------------------------------
+
+    def load(self) -> None:
+        """
+        Full build from one ordered pass over Ingredient. Postings are collected as id lists
+        and turned into bitmaps once at the end; setting bits one by one in a big int would
+        copy it on every insert.
+        """
+        started = time.monotonic()
+        with self.lock:
+            self.reset()
+            synced_at = timezone.now()
+            collected, sizes = [], {}
+            rows = (
+                Ingredient.objects.order_by("recipe_id")
+                .values_list("recipe_id", "name")
+                .iterator(chunk_size=LOAD_CHUNK_SIZE)
+            )
+            for recipe_id, names in groupby(rows, key=itemgetter(0)):
+                tids = {self.term_id(n) for n in {normalize_name(name) for _, name in names} if n}
+                if not tids:
+                    continue
+                collected.extend([] for _ in range(len(self.postings) - len(collected)))
+                for tid in tids:
+                    collected[tid].append(recipe_id)
+                self.recipe_terms[recipe_id] = array("I", sorted(tids)).tobytes()
+                sizes.setdefault(len(tids), []).append(recipe_id)
+                self.max_id = recipe_id
+
+            threshold = self.max_id // DENSE_RATIO + 1
+            self.postings = [bitmap_from_ids(ids) if len(ids) > threshold else set(ids) for ids in collected]
+            self.sizes = {size: bitmap_from_ids(ids) for size, ids in sizes.items()}
+            self.synced_at = synced_at
+            self.loaded = True
+        logger.info("Pantry index built: %s recipes, %s names in %.2fs",
+                    len(self.recipe_terms), len(self.terms), time.monotonic() - started)
+
+    def term_id(self, name: str) -> int:
+        tid = self.terms.get(name)
+        if tid is None:
+            tid = self.terms[name] = len(self.postings)
+            self.postings.append(set())
+        return tid
+
+    def set_recipe(self, recipe_id: int, names) -> None:
+        """Replace the indexed ingredient names of one recipe"""
+        new = {self.term_id(n) for n in map(normalize_name, names) if n}
+        old = set(array("I", self.recipe_terms.get(recipe_id, b"")))
+        if new == old and recipe_id in self.recipe_terms:
+            return
+        bit = 1 << recipe_id
+        self.max_id = max(self.max_id, recipe_id)
+
+        for tid in old - new:
+            posting = self.postings[tid]
+            if isinstance(posting, set):
+                posting.discard(recipe_id)
+            else:
+                self.postings[tid] = posting & ~bit
+        for tid in new - old:
+            posting = self.postings[tid]
+            if isinstance(posting, set):
+                posting.add(recipe_id)
+                if len(posting) > self.max_id // DENSE_RATIO + 1:
+                    self.postings[tid] = bitmap_from_ids(posting)
+            else:
+                self.postings[tid] = posting | bit
+
+        if recipe_id in self.recipe_terms:
+            self.remove_size(recipe_id, len(old))
+        if new:
+            self.recipe_terms[recipe_id] = array("I", sorted(new)).tobytes()
+            self.sizes[len(new)] = self.sizes.get(len(new), 0) | bit
+        else:
+            self.recipe_terms.pop(recipe_id, None)
+
+    def remove_size(self, recipe_id: int, size: int) -> None:
+        remaining = self.sizes.get(size, 0) & ~(1 << recipe_id)
+        if remaining:
+            self.sizes[size] = remaining
+        else:
+            self.sizes.pop(size, None)
+
+    def remove_recipe(self, recipe_id: int) -> None:
+        with self.lock:
+            if recipe_id in self.recipe_terms:
+                self.set_recipe(recipe_id, ())
+
+    def refresh_recipes(self, *recipe_ids) -> None:
+        """Re-read the ingredient names of some recipes (one query) and update their postings"""
+        ids = {pk for pk in recipe_ids if pk is not None}
+        if not ids or not self.loaded:
+            return
+        names = {pk: set() for pk in ids}
+        for recipe_id, name in Ingredient.objects.filter(recipe_id__in=ids).values_list("recipe_id", "name"):
+            names[recipe_id].add(name)
+        existing = set(Recipe.objects.filter(pk__in=ids).values_list("id", flat=True))
+        with self.lock:
+            for pk, recipe_names in names.items():
+                self.set_recipe(pk, recipe_names if pk in existing else ())
+
+    def sync(self) -> None:
+        """Build on first use, then apply what other processes changed since the last sync"""
+        with self.lock:
+            if not self.loaded:
+                self.load()
+                return
+        now = timezone.now()
+        changed = list(
+            Recipe.objects.filter(updated_at__gte=self.synced_at - SYNC_OVERLAP).values_list("id", flat=True)
+        )
+        self.refresh_recipes(*changed)
+        self.synced_at = now
+
+    # -- querying ---------------------------------------------------------------------------
+
+    def dense(self, tid: int) -> int:
+        posting = self.postings[tid]
+        return bitmap_from_ids(posting) if isinstance(posting, set) else posting
+
+    def match(self, pantry, max_missing: int = 0, offset: int = 0, limit: int = 10) -> dict:
+        """
+        Recipes that use at least one pantry item and lack at most `max_missing` ingredients.
+        Ordered by missing count, then by number of pantry items used (desc), then id.
+        Returns {"ids": [(recipe_id, matched, missing)], "counts": {missing: n}, "total": n}.
+        """
+        with self.lock:
+            tids = sorted({self.terms[n] for n in map(normalize_name, pantry) if n in self.terms})
+            bitmaps = [self.dense(t) for t in tids]
+            sizes = dict(self.sizes)
+
+        # Bit-sliced counter: slices[i] holds bit i of every recipe's match count
+        slices = []
+        for bitmap in bitmaps:
+            carry = bitmap
+            for i, current in enumerate(slices):
+                if not carry:
+                    break
+                slices[i], carry = current ^ carry, current & carry
+            if carry:
+                slices.append(carry)
+
+        matched_eq = {}
+        for m in range(1, len(bitmaps) + 1):
+            if m.bit_length() > len(slices):
+                break
+            acc = -1
+            for i, current in enumerate(slices):
+                acc &= current if (m >> i) & 1 else ~current
+            if acc > 0:
+                matched_eq[m] = acc
+
+        buckets, counts = [], {}
+        for missing in range(max_missing + 1):
+            for m in sorted(matched_eq, reverse=True):
+                hits = matched_eq[m] & sizes.get(m + missing, 0)
+                if hits:
+                    buckets.append((m, missing, hits))
+                    counts[missing] = counts.get(missing, 0) + hits.bit_count()
+
+        results, skip = [], offset
+        for m, missing, hits in buckets:
+            if len(results) >= limit:
+                break
+            size = hits.bit_count()
+            if skip >= size:
+                skip -= size
+                continue
+            for pos, recipe_id in enumerate(iter_bits(hits)):
+                if pos < skip:
+                    continue
+                results.append((recipe_id, m, missing))
+                if len(results) >= limit:
+                    break
+            skip = 0
+
+        return {"ids": results, "counts": counts, "total": sum(counts.values())}
+
+
+pantry_index = PantryIndex()
@@ -0,0 +1,124 @@
+"""
+Precomputed recipe documents. Every write to a recipe or its ingredients/images rebuilds the
+recipe's RecipeRead payload in the same transaction (see signals.py), stored as rendered JSON, so
+detail, list, search and export responses read one row per recipe and splice its text into the
+output instead of joining the child tables and rebuilding the document.
+"""
+import re
+
+from .models import Recipe, RecipeDocument
+from .serializers import RECIPE_FIELDS, arecipe_documents, assemble_documents, children_querysets, recipe_documents
+from .utils.renderers import RawJSON, dumps
+
+# Column to add to a recipe .values() query to read the stored document with the row
+DOCUMENT = "document__body"
+# ids per rebuild batch, to stay clear of SQLite's variable limit
+BATCH_SIZE = 500
+
+# URLs are stored as paths behind a NUL, which the JSON text holds as the escape "\u0000" and
+# which with_origin() swaps for the request's scheme and host. PostgreSQL text cannot contain a
+# NUL, so user strings never do; an escape only counts after an even run of backslashes.
+ORIGIN_MARKER = "\x00"
+STORED_ORIGIN = re.compile(rb"(?<!\\)((?:\\\\)*)\\u0000/")
+
+
+def stored_url(path: str) -> str:
+    return ORIGIN_MARKER + path
+
+
+def with_origin(body: str, origin: bytes) -> RawJSON:
+    text = body.encode()
+    # Without an escaped backslash every "\u0000" is a marker, and a plain replace is exact
+    if b"\\\\" not in text:
+        return RawJSON(text.replace(b"\\u0000/", origin + b"/"))
+    return RawJSON(STORED_ORIGIN.sub(lambda match: match[1] + origin + b"/", text))
+
+
+def request_origin(request) -> bytes:
+    return request.build_absolute_uri("/")[:-1].encode()
+
+
+def refresh_recipes(*recipe_ids) -> None:
+    """Rebuild the stored documents of the given recipes from their current rows"""
+    ids = sorted({pk for pk in recipe_ids if pk is not None})
+    for start in range(0, len(ids), BATCH_SIZE):
+        rows = list(Recipe.objects.filter(pk__in=ids[start:start + BATCH_SIZE]).values(*RECIPE_FIELDS))
+        if not rows:
+            continue
+        ingredients, images = children_querysets(rows)
+        RecipeDocument.objects.bulk_create(
+            [
+                RecipeDocument(recipe_id=document["id"], body=dumps(document).decode())
+                for document in assemble_documents(stored_url, rows, ingredients, images)
+            ],
+            update_conflicts=True, unique_fields=["recipe"], update_fields=["body"],
+        )
+
+
+def rebuild_all(batch_size: int = BATCH_SIZE) -> int:
+    """Backfill/rebuild every document; used after migrating or changing IMAGE_VARIANT_WIDTHS"""
+    done = 0
+    ids = Recipe.objects.order_by("id").values_list("id", flat=True)
+    last = 0
+    while True:
+        batch = list(ids.filter(id__gt=last)[:batch_size])
+        if not batch:
+            return done
+        refresh_recipes(*batch)
+        done += len(batch)
+        last = batch[-1]
+
+
+def missing_documents(rows) -> list[int]:
+    return [row["id"] for row in rows if row[DOCUMENT] is None]
+
+
+def fallback_queryset(ids):
+    return Recipe.objects.filter(pk__in=ids).values(*RECIPE_FIELDS)
+
+
+def splice(request, rows, built: list[dict], extra) -> dict[int, RawJSON]:
+    origin = request_origin(request)
+    built = {document["id"]: RawJSON(dumps(document)) for document in built}
+    documents = {}
+    for row in rows:
+        body = row[DOCUMENT]
+        document = with_origin(body, origin) if body is not None else built.get(row["id"])
+        if document is not None:
+            documents[row["id"]] = with_fields(document, **{key: row[key] for key in extra}) if extra else document
+    return documents
+
+
+def stored_documents(request, rows, extra=()) -> list[RawJSON]:
+    """
+    Rendered documents for recipe rows read with DOCUMENT, in order, with the row's `extra`
+    columns appended as keys. Recipes without one yet (written before the backfill) are built
+    the slow way, not stored; rows whose recipe has disappeared since are left out.
+    """
+    return list(stored_documents_by_id(request, rows, extra).values())
+
+
+def stored_documents_by_id(request, rows, extra=()) -> dict[int, RawJSON]:
+    """stored_documents() keyed by recipe id, in row order"""
+    rows = list(rows)
+    missing = missing_documents(rows)
+    return splice(request, rows, recipe_documents(request, fallback_queryset(missing)) if missing else [], extra)
+
+
+async def astored_documents(request, rows, extra=()) -> list[RawJSON]:
+    """stored_documents() for async views; only the fallback reads the database"""
+    return list((await astored_documents_by_id(request, rows, extra)).values())
+
+
+async def astored_documents_by_id(request, rows, extra=()) -> dict[int, RawJSON]:
+    rows = list(rows)
+    missing = missing_documents(rows)
+    if not missing:
+        return splice(request, rows, [], extra)
+    fallback = [row async for row in fallback_queryset(missing)]
+    return splice(request, rows, await arecipe_documents(request, fallback), extra)
+
+
+def with_fields(document: RawJSON, **fields) -> RawJSON:
+    """A stored document with extra keys appended, e.g. a search rank"""
+    return RawJSON(document[:-1] + b"," + dumps(fields)[1:])
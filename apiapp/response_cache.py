@@ -0,0 +1,313 @@
+import functools
+import hashlib
+import heapq
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+from urllib.parse import urlencode
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.http import parse_http_date_safe
+
+from .utils.http import not_modified
+from .utils.lru import ByteLRUCache
+
+logger = logging.getLogger(__name__)
+
+CACHE_ALIAS = getattr(settings, "RESPONSE_CACHE_ALIAS", "default")
+CACHE_SECONDS = getattr(settings, "RESPONSE_CACHE_SECONDS", 300)
+# Headers stored with a body and replayed on a hit
+REPLAYED_HEADERS = ("Content-Type", "ETag", "Last-Modified", "Cache-Control")
+
+GLOBAL_VERSION = "rc:v:all"
+
+# Process-local first level in front of the shared cache: key -> (body, ((status, headers), expires)).
+# Entries expire after CACHE_SECONDS like shared ones: a write handled by another process only
+# reaches this one through the shared version counters, and without a shared backend not at all.
+local_cache = ByteLRUCache(getattr(settings, "RESPONSE_CACHE_LOCAL_BYTES", 16 * 1024 * 1024))
+
+
+class SharedStats:
+    """Hit/miss counters for the shared (second level) cache, per process"""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self._lock = threading.Lock()
+
+    def count(self, field: str) -> None:
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+
+shared_stats = SharedStats()
+
+
+def enabled() -> bool:
+    return getattr(settings, "RESPONSE_CACHE_ENABLED", False)
+
+
+def cache():
+    return caches[CACHE_ALIAS]
+
+
+def shared() -> bool:
+    """With a local-memory backend the process-local LRU already is the whole cache"""
+    return not isinstance(cache(), LocMemCache)
+
+
+def recipe_version_key(recipe_id) -> str:
+    return f"rc:v:r:{recipe_id}"
+
+
+def get_versions(*keys) -> list:
+    """
+    Current value of each counter, in one round trip. A missing counter (never bumped, or
+    evicted) starts from the clock rather than 0, so it can never revive keys cached under an
+    earlier incarnation of itself.
+    """
+    found = cache().get_many(keys)
+    versions = []
+    for key in keys:
+        if key not in found:
+            cache().add(key, time.time_ns(), timeout=None)
+            found[key] = cache().get(key)
+        versions.append(found[key])
+    return versions
+
+
+def list_version():
+    """The counter every write bumps, i.e. the version of any list of recipes"""
+    return get_versions(GLOBAL_VERSION)[0]
+
+
+async def alist_version():
+    # A local-memory backend is answered on the event loop; a shared one is network I/O
+    if shared():
+        return await sync_to_async(list_version)()
+    return list_version()
+
+
+def bump(*keys) -> None:
+    for key in keys:
+        try:
+            cache().incr(key)
+        except ValueError:
+            cache().add(key, time.time_ns(), timeout=None)
+
+
+def invalidate_recipes(*recipe_ids) -> None:
+    """
+    New versions for the given recipes and for every list page, once the surrounding
+    transaction commits; bumping earlier would let a concurrent read cache the old rows
+    under the new version.
+    """
+    keys = [recipe_version_key(pk) for pk in {pk for pk in recipe_ids if pk is not None}]
+    transaction.on_commit(lambda: bump_committed(GLOBAL_VERSION, *keys))
+
+
+def bump_committed(*keys) -> None:
+    bump(*keys)
+    # A read replica can serve the old rows until it catches up, and whatever is cached from
+    # them meanwhile lands under the new version; a second bump once the lag is over drops it
+    if getattr(settings, "DATABASE_REPLICAS", None):
+        delayed_bumps.schedule(getattr(settings, "REPLICA_PIN_SECONDS", 10), keys)
+
+
+class DelayedBumps:
+    """
+    Bumps due later, run by one daemon thread per process from a heap ordered by due time.
+    A key already waiting is bumped once, at the latest due time asked for, so a burst of
+    writes costs a few heap entries rather than a thread each.
+    """
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.heap = []      # (due, key), monotonic clock
+        self.pending = {}   # key -> due of its live heap entry
+        self.thread = None
+
+    def schedule(self, delay: float, keys) -> None:
+        due = time.monotonic() + delay
+        with self.cond:
+            for key in keys:
+                if self.pending.get(key, 0) < due:
+                    self.pending[key] = due
+                    heapq.heappush(self.heap, (due, key))
+            # Started on first use, and again in a forked worker, which inherits no threads
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name="response-cache-bumps", daemon=True)
+                self.thread.start()
+            self.cond.notify()
+
+    def take_due(self) -> list:
+        """Wait for the earliest entry to fall due, then pop every due key"""
+        with self.cond:
+            while not self.heap or self.heap[0][0] > time.monotonic():
+                self.cond.wait(self.heap[0][0] - time.monotonic() if self.heap else None)
+            now = time.monotonic()
+            keys = []
+            while self.heap and self.heap[0][0] <= now:
+                due, key = heapq.heappop(self.heap)
+                # Entries superseded by a later due time for the same key are dropped
+                if self.pending.get(key) == due:
+                    del self.pending[key]
+                    keys.append(key)
+            return keys
+
+    def run(self) -> None:
+        while True:
+            keys = self.take_due()
+            try:
+                bump(*keys)
+            except Exception:
+                logger.exception("Delayed response cache bump failed for %s", keys)
+
+
+delayed_bumps = DelayedBumps()
+
+
+def request_key(request, scope: str, versions) -> str:
+    """Scheme and host are part of the key because bodies carry absolute URLs"""
+    query = urlencode(sorted((k, v) for k, values in request.GET.lists() for v in values))
+    url = f"{request.scheme}://{request.get_host()}{request.path}?{query}"
+    version = ".".join(str(v) for v in versions)
+    # Hashed so keys stay short for memcached-style backends however long the query string is
+    return f"rc:{scope}:{version}:{hashlib.md5(url.encode()).hexdigest()}"
+
+
+def replay(request, body: bytes, status: int, headers: dict):
+    etag = headers.get("ETag")
+    last_modified = headers.get("Last-Modified")
+    if etag or last_modified:
+        since = parse_http_date_safe(last_modified) if last_modified else None
+        cached = not_modified(
+            request, etag, datetime.fromtimestamp(since, tz=timezone.utc) if since is not None else None,
+            cache_control=headers.get("Cache-Control"),
+        )
+        if cached is not None:
+            return cached
+    response = HttpResponse(body, status=status)
+    for name, value in headers.items():
+        response[name] = value
+    return response
+
+
+def lookup(request, scope: str, version_keys: list):
+    """(key, stored entry or None) for a request: process-local LRU first, then the shared cache"""
+    key = request_key(request, scope, get_versions(*version_keys))
+    entry = local_get(key)
+    if entry is None and shared():
+        stored = cache().get(key)
+        if stored is not None:
+            shared_stats.count("hits")
+            body, meta = stored
+            local_set(key, body, meta)
+            entry = stored
+        else:
+            shared_stats.count("misses")
+    return key, entry
+
+
+def local_get(key: str):
+    entry = local_cache.get(key)
+    if entry is None:
+        return None
+    body, (meta, expires) = entry
+    if expires <= time.monotonic():
+        local_cache.delete(key)
+        return None
+    return body, meta
+
+
+def local_set(key: str, body: bytes, meta) -> None:
+    local_cache.set(key, body, (meta, time.monotonic() + CACHE_SECONDS))
+
+
+def store(key: str, response) -> None:
+    if response.status_code == 200 and not response.streaming and isinstance(response, HttpResponse):
+        meta = (200, {name: response[name] for name in REPLAYED_HEADERS if response.has_header(name)})
+        body = response.content
+        local_set(key, body, meta)
+        if shared():
+            cache().set(key, (body, meta), CACHE_SECONDS)
+            shared_stats.count("stores")
+
+
+def cached_response(scope: str, version_keys):
+    """
+    Cache successful GET responses of a view under the current value of some version counters.
+    `version_keys(kwargs)` names the counters the response depends on. Hits are answered from
+    the process-local LRU or the shared cache, without touching the database; conditional
+    requests get their 304 from the stored validators. Works on sync and async views.
+    """
+
+    def decorator(view):
+        if iscoroutinefunction(view):
+            return async_decorator(view)
+
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method != "GET" or not enabled():
+                return view(request, *args, **kwargs)
+
+            key, entry = lookup(request, scope, version_keys(kwargs))
+            if entry is not None:
+                body, (status, headers) = entry
+                return replay(request, body, status, headers)
+
+            response = view(request, *args, **kwargs)
+            store(key, response)
+            return response
+
+        return wrapper
+
+    def async_decorator(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method != "GET" or not enabled():
+                return await view(request, *args, **kwargs)
+
+            # A local-memory backend is answered on the event loop; a shared one is network I/O
+            is_shared = shared()
+            if is_shared:
+                key, entry = await sync_to_async(lookup)(request, scope, version_keys(kwargs))
+            else:
+                key, entry = lookup(request, scope, version_keys(kwargs))
+            if entry is not None:
+                body, (status, headers) = entry
+                return replay(request, body, status, headers)
+
+            response = await view(request, *args, **kwargs)
+            if is_shared:
+                await sync_to_async(store)(key, response)
+            else:
+                store(key, response)
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def recipe_versions(kwargs):
+    return [recipe_version_key(kwargs["recipe_id"])]
+
+
+def list_versions(kwargs):
+    return [GLOBAL_VERSION]
+
+
+def stats() -> dict:
+    return {
+        "local": local_cache.stats(),
+        "shared": {"hits": shared_stats.hits, "misses": shared_stats.misses, "stores": shared_stats.stores},
+        "backend": cache().__class__.__name__,
+    }
@@ -16,8 +16,10 @@ class ImageCreate(Schema):
 # Schema for reading – used when returning to clients
 class ImageRead(ImageBase):
     id: int
-    url: str
+    url: Optional[str] = None  # None for metadata-only rows without bytes
     thumbnail_url: Optional[str] = None  # Optional, if thumbnails exist
+    thumbnail_status: Optional[str] = None  # none / pending / ready / failed
+    srcset: Optional[str] = None  # "<variant url> <width>w, ..." for responsive <img> tags
 
     class Config:
         from_attributes = True
@@ -1,4 +1,4 @@
-from ninja import Schema
+from ninja import Field, Schema
 from typing import  Optional
 from apiapp.constants import MeasurementUnit
 
@@ -6,7 +6,7 @@ from apiapp.constants import MeasurementUnit
 class IngredientBase(Schema):
     name: str
     category: Optional[str] = None
-    quantity: int
+    quantity: int = Field(ge=0)
     measurement_unit: MeasurementUnit
 
 class IngredientCreate(IngredientBase):
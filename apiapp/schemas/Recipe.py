@@ -1,4 +1,4 @@
-from ninja import Schema
+from ninja import Field, Schema
 from typing import List, Optional
 from ..constants import DietType, MealType, MealCategory, DifficultyLevel
 from .Ingredient import IngredientCreate, IngredientRead
@@ -11,8 +11,8 @@ class RecipeBase(Schema):
     diet_type: DietType
     meal_type: MealType
     meal_category: MealCategory
-    preparation_time: int
-    cooking_time: int
+    preparation_time: int = Field(ge=0)
+    cooking_time: int = Field(ge=0)
     difficulty_level: DifficultyLevel
     video_url: Optional[str] = None
     rating: Optional[float] = 0.0
@@ -28,4 +28,19 @@ class RecipeRead(RecipeBase):
     images: List[ImageRead] = []
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+
+class RecipeFilters(Schema):
+    """Query-string filters shared by the recipe list, search and export; repeat enum params to OR values"""
+    diet_type: Optional[List[DietType]] = None
+    meal_type: Optional[List[MealType]] = None
+    meal_category: Optional[List[MealCategory]] = None
+    difficulty_level: Optional[List[DifficultyLevel]] = None
+    min_preparation_time: Optional[int] = None
+    max_preparation_time: Optional[int] = None
+    min_cooking_time: Optional[int] = None
+    max_cooking_time: Optional[int] = None
+    min_rating: Optional[float] = None
+    min_servings: Optional[int] = None
+    max_servings: Optional[int] = None
@@ -0,0 +1,11 @@
+from ninja import Schema
+from pydantic import Field
+from typing import List
+
+# --- Shopping list Schemas ---
+class ShoppingListEntry(Schema):
+    recipe_id: int
+    servings: float = Field(gt=0)
+
+class ShoppingListRequest(Schema):
+    recipes: List[ShoppingListEntry] = Field(min_length=1, max_length=100)
@@ -0,0 +1,140 @@
+import re
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import F, FloatField
+from django.db.models.expressions import RawSQL
+
+from .models import Recipe
+
+# Text search configuration used to build and query the tsvector column (PostgreSQL)
+SEARCH_CONFIG = getattr(settings, "RECIPE_SEARCH_CONFIG", "english")
+# Longer queries are cut here; every extra term is one more index probe
+MAX_TERMS = 8
+# Recipe fields that feed the index; saves touching none of them skip the refresh
+INDEXED_FIELDS = {"name", "description", "instructions"}
+# ids per UPDATE/INSERT when refreshing, to stay clear of SQLite's variable limit
+INDEX_BATCH_SIZE = 500
+
+FTS_TABLE = "apiapp_recipe_fts"
+# bm25 column weights for name, ingredients, description, instructions (FTS5)
+FTS_WEIGHTS = (10.0, 5.0, 2.0, 1.0)
+
+# Weights: A name, B ingredient names, C description, D instructions
+PG_REFRESH_SQL = """
+    UPDATE apiapp_recipe r SET search_vector =
+        setweight(to_tsvector(%(config)s::regconfig, coalesce(r.name, '')), 'A') ||
+        setweight(to_tsvector(%(config)s::regconfig, coalesce(
+            (SELECT string_agg(i.name, ' ') FROM apiapp_ingredient i WHERE i.recipe_id = r.id), ''
+        )), 'B') ||
+        setweight(to_tsvector(%(config)s::regconfig, coalesce(r.description, '')), 'C') ||
+        setweight(to_tsvector(%(config)s::regconfig, coalesce(r.instructions, '')), 'D')
+    WHERE r.id = ANY(%(ids)s)
+"""
+
+FTS_DELETE_SQL = f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({{ids}})"
+FTS_INSERT_SQL = f"""
+    INSERT INTO {FTS_TABLE} (rowid, name, ingredients, description, instructions)
+    SELECT r.id, r.name,
+           coalesce((SELECT group_concat(i.name, ' ') FROM apiapp_ingredient i WHERE i.recipe_id = r.id), ''),
+           r.description, r.instructions
+    FROM apiapp_recipe r WHERE r.id IN ({{ids}})
+"""
+
+
+class SearchUnavailable(Exception):
+    """The database backend has neither tsvector nor FTS5 search"""
+
+
+def backend() -> str | None:
+    if connection.vendor == "postgresql":
+        return "postgresql"
+    if connection.vendor == "sqlite":
+        return "fts5"
+    return None
+
+
+def tokenize(query: str) -> list[str]:
+    """Words only; punctuation never reaches the query syntax of either backend"""
+    return re.findall(r"\w+", query.lower())[:MAX_TERMS]
+
+
+def index_recipes(*recipe_ids) -> None:
+    """Rebuild the search document of the given recipes from their current rows"""
+    ids = sorted({pk for pk in recipe_ids if pk is not None})
+    kind = backend()
+    if not ids or kind is None:
+        return
+    with connection.cursor() as cursor:
+        for start in range(0, len(ids), INDEX_BATCH_SIZE):
+            batch = ids[start:start + INDEX_BATCH_SIZE]
+            if kind == "postgresql":
+                cursor.execute(PG_REFRESH_SQL, {"config": SEARCH_CONFIG, "ids": batch})
+            else:
+                placeholders = ", ".join(["%s"] * len(batch))
+                cursor.execute(FTS_DELETE_SQL.format(ids=placeholders), batch)
+                cursor.execute(FTS_INSERT_SQL.format(ids=placeholders), batch)
+
+
+def unindex_recipes(*recipe_ids) -> None:
+    """The tsvector column goes with the row; only the FTS5 table needs cleaning up"""
+    ids = [pk for pk in recipe_ids if pk is not None]
+    if not ids or backend() != "fts5":
+        return
+    with connection.cursor() as cursor:
+        for start in range(0, len(ids), INDEX_BATCH_SIZE):
+            batch = ids[start:start + INDEX_BATCH_SIZE]
+            cursor.execute(FTS_DELETE_SQL.format(ids=", ".join(["%s"] * len(batch))), batch)
+
+
+def rebuild_index(batch_size: int = 5000) -> int:
+    """Reindex every recipe; used after changing the search config or restoring a dump"""
+    done = 0
+    ids = Recipe.objects.order_by("id").values_list("id", flat=True)
+    last = 0
+    while True:
+        batch = list(ids.filter(id__gt=last)[:batch_size])
+        if not batch:
+            return done
+        index_recipes(*batch)
+        done += len(batch)
+        last = batch[-1]
+
+
+def search_recipes(query: str):
+    """
+    Recipes matching every term of `query` (the last letters of each term may be missing),
+    annotated with `rank` and ordered best first. Both backends answer from their index:
+    a GIN probe on search_vector, or an FTS5 MATCH.
+    """
+    terms = tokenize(query)
+    if not terms:
+        return Recipe.objects.none()
+    kind = backend()
+
+    if kind == "postgresql":
+        tsquery = SearchQuery(" & ".join(f"'{t}':*" for t in terms), search_type="raw", config=SEARCH_CONFIG)
+        return (
+            Recipe.objects.filter(search_vector=tsquery)
+            .annotate(rank=SearchRank(F("search_vector"), tsquery))
+            .order_by("-rank", "id")
+        )
+
+    if kind == "fts5":
+        match = " ".join(f'"{t}"*' for t in terms)
+        weights = ", ".join(str(w) for w in FTS_WEIGHTS)
+        # bm25() is lower-is-better, so it is negated to read like ts_rank
+        rank = RawSQL(
+            f"SELECT -bm25({FTS_TABLE}, {weights}) FROM {FTS_TABLE} "
+            f"WHERE {FTS_TABLE} MATCH %s AND rowid = apiapp_recipe.id",
+            [match],
+            output_field=FloatField(),
+        )
+        return (
+            Recipe.objects.filter(id__in=RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [match]))
+            .annotate(rank=rank)
+            .order_by("-rank", "id")
+        )
+
+    raise SearchUnavailable(f"Full-text search is not supported on {connection.vendor}")
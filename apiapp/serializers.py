@@ -0,0 +1,134 @@
+from .models import Image, Ingredient
+from . import variants
+
+# Columns read with .values() for the fast path; the documents built from them have exactly
+# the shape (and key order) of RecipeRead / IngredientRead / ImageRead
+RECIPE_FIELDS = (
+    "name", "description", "instructions", "diet_type", "meal_type", "meal_category",
+    "preparation_time", "cooking_time", "difficulty_level", "video_url", "rating", "number_of_servings", "id",
+)
+# updated_at is read too, for ETags, but is not part of the document
+RECIPE_VALUES = RECIPE_FIELDS + ("updated_at",)
+INGREDIENT_VALUES = ("recipe_id", "name", "category", "quantity", "measurement_unit", "id")
+IMAGE_VALUES = (
+    "recipe_id", "id", "filename", "content_type", "size", "has_data", "has_thumbnail", "thumbnail_status", "width",
+)
+# Child lists a document embeds, selectable with ?include=
+RECIPE_RELATIONS = ("ingredients", "images")
+
+
+class FieldsetError(ValueError):
+    """Raised for an unknown name in ?fields= or ?include="""
+
+
+def parse_fieldset(fields: str | None, include: str | None):
+    """
+    (recipe columns, relations) for ?fields=a,b&include=images, or None when neither is given
+    (the full document). id is always returned; ?fields= alone embeds no relations and
+    ?include= alone keeps every column.
+    """
+    if fields is None and include is None:
+        return None
+
+    def names(value, allowed, param):
+        requested = {name.strip() for name in value.split(",") if name.strip()}
+        unknown = requested - set(allowed)
+        if unknown:
+            raise FieldsetError(
+                f"Unknown {param}: {', '.join(sorted(unknown))}. Allowed: {', '.join(sorted(allowed))}"
+            )
+        return requested
+
+    columns = RECIPE_FIELDS if fields is None else names(fields, RECIPE_FIELDS, "fields") | {"id"}
+    relations = set() if include is None else names(include, RECIPE_RELATIONS, "include")
+    return (
+        tuple(field for field in RECIPE_FIELDS if field in columns),
+        tuple(relation for relation in RECIPE_RELATIONS if relation in relations),
+    )
+
+
+def absolute_url_builder(request):
+    """build_absolute_uri for absolute paths, with scheme and host worked out once per request"""
+    origin = request.build_absolute_uri("/")[:-1]
+    return lambda path: origin + path
+
+
+def image_document(base_url, row: dict) -> dict:
+    image_id = row["id"]
+    has_data = row["has_data"]
+    return {
+        "filename": row["filename"],
+        "content_type": row["content_type"],
+        "size": row["size"],
+        "id": image_id,
+        "url": base_url(f"/api/images/{image_id}/raw/") if has_data else None,
+        "thumbnail_url": base_url(f"/api/images/{image_id}/thumb/") if row["has_thumbnail"] else None,
+        "thumbnail_status": row["thumbnail_status"],
+        "srcset": variants.srcset(base_url, image_id, row["width"]) if has_data else None,
+    }
+
+
+def recipe_documents(request, rows, fieldset=None) -> list[dict]:
+    """
+    RecipeRead-shaped dicts for recipe value rows (dicts with at least RECIPE_FIELDS), in order.
+    Children come from one .values() query per table; no model instances or schema objects
+    are built, and the result goes straight to the JSON encoder. With a parse_fieldset()
+    result the rows need only its columns, and relations left out are not queried.
+    """
+    rows = list(rows)
+    if not rows:
+        return []
+    fields, relations = fieldset or (RECIPE_FIELDS, RECIPE_RELATIONS)
+    ingredients, images = children_querysets(rows, relations)
+    return assemble_documents(absolute_url_builder(request), rows, ingredients, images, fields)
+
+
+async def arecipe_documents(request, rows, fieldset=None) -> list[dict]:
+    """recipe_documents() for async views; the child rows are read with async iteration"""
+    rows = list(rows)
+    if not rows:
+        return []
+    fields, relations = fieldset or (RECIPE_FIELDS, RECIPE_RELATIONS)
+    ingredients, images = children_querysets(rows, relations)
+    return assemble_documents(
+        absolute_url_builder(request), rows,
+        [i async for i in ingredients] if ingredients is not None else None,
+        [i async for i in images] if images is not None else None,
+        fields,
+    )
+
+
+def children_querysets(rows, relations=RECIPE_RELATIONS):
+    """Ingredient and image value querysets for the rows; None for a relation not asked for"""
+    ids = [row["id"] for row in rows]
+    return (
+        Ingredient.objects.filter(recipe_id__in=ids).order_by("id").values(*INGREDIENT_VALUES)
+        if "ingredients" in relations else None,
+        Image.objects.filter(recipe_id__in=ids).order_by("id").values(*IMAGE_VALUES)
+        if "images" in relations else None,
+    )
+
+
+def assemble_documents(base_url, rows, ingredient_rows, image_rows, fields=RECIPE_FIELDS) -> list[dict]:
+    """Documents of `fields`, embedding each child list that is not None"""
+    ingredients = images = None
+    if ingredient_rows is not None:
+        ingredients = {row["id"]: [] for row in rows}
+        for ing in ingredient_rows:
+            recipe_id = ing.pop("recipe_id")
+            ingredients[recipe_id].append(ing)
+
+    if image_rows is not None:
+        images = {row["id"]: [] for row in rows}
+        for img in image_rows:
+            images[img["recipe_id"]].append(image_document(base_url, img))
+
+    documents = []
+    for row in rows:
+        document = {field: row[field] for field in fields}
+        if ingredients is not None:
+            document["ingredients"] = ingredients[row["id"]]
+        if images is not None:
+            document["images"] = images[row["id"]]
+        documents.append(document)
+    return documents
@@ -0,0 +1,100 @@
+from array import array
+
+from .constants import MeasurementUnit
+from .models import Ingredient, enum_choices
+from .pantry import normalize_name
+
+try:
+    import numpy as np
+except ImportError:  # optional; the pure-Python path gives the same results
+    np = None
+
+MASS = "mass"
+VOLUME = "volume"
+
+# unit -> (dimension, size in the dimension's base unit: grams or millilitres)
+UNIT_SIZES = {
+    MeasurementUnit.GRAM: (MASS, 1.0),
+    MeasurementUnit.KILOGRAM: (MASS, 1000.0),
+    MeasurementUnit.LITER: (VOLUME, 1000.0),
+    MeasurementUnit.TEASPOON: (VOLUME, 4.92892),
+    MeasurementUnit.TABLESPOON: (VOLUME, 14.7868),
+    MeasurementUnit.CUP: (VOLUME, 236.588),
+}
+# Display units per dimension, largest first; a total is shown in the first one it reaches 1 of
+DISPLAY_UNITS = {
+    MASS: [MeasurementUnit.KILOGRAM, MeasurementUnit.GRAM],
+    VOLUME: [MeasurementUnit.LITER, MeasurementUnit.CUP, MeasurementUnit.TABLESPOON, MeasurementUnit.TEASPOON],
+}
+UNIT_LABELS = dict(enum_choices(MeasurementUnit))
+
+
+def group_sums(keys, values, size: int):
+    """Sum `values` per integer key in one pass (bincount when NumPy is installed)"""
+    if np is not None:
+        return np.bincount(np.frombuffer(keys, dtype=np.uint32), weights=np.frombuffer(values), minlength=size).tolist()
+    sums = [0.0] * size
+    for key, value in zip(keys, values):
+        sums[key] += value
+    return sums
+
+
+def display_quantity(dimension: str, base_amount: float) -> tuple[MeasurementUnit, float]:
+    units = DISPLAY_UNITS[dimension]
+    for unit in units:
+        size = UNIT_SIZES[unit][1]
+        if base_amount >= size:
+            return unit, base_amount / size
+    unit = units[-1]
+    return unit, base_amount / UNIT_SIZES[unit][1]
+
+
+def shopping_list(entries) -> dict:
+    """
+    Consolidate the ingredients of several recipes, each scaled to the requested servings.
+    One query fetches every ingredient row (with its recipe's serving count); rows are then
+    factorized into (normalized name, dimension) keys and summed per key.
+    """
+    servings = {}
+    for entry in entries:
+        servings[entry.recipe_id] = servings.get(entry.recipe_id, 0) + entry.servings
+
+    rows = Ingredient.objects.filter(recipe_id__in=servings).values_list(
+        "recipe_id", "name", "quantity", "measurement_unit", "recipe__number_of_servings"
+    )
+
+    groups = {}       # (name, dimension) -> key
+    keys = array("I")
+    values = array("d")
+    found = set()
+    for recipe_id, name, quantity, unit, recipe_servings in rows:
+        found.add(recipe_id)
+        if unit in UNIT_SIZES:
+            dimension, size = UNIT_SIZES[unit]
+        else:
+            # No conversion known for the unit: summed per unit, unconverted
+            dimension, size = unit, 1.0
+        key = groups.setdefault((normalize_name(name) or name, dimension), len(groups))
+        keys.append(key)
+        values.append(quantity * size * servings[recipe_id] / (recipe_servings or 1))
+
+    totals = group_sums(keys, values, len(groups))
+    items = []
+    for (name, dimension), key in groups.items():
+        if dimension in DISPLAY_UNITS:
+            unit, amount = display_quantity(dimension, totals[key])
+        else:
+            unit, amount = dimension, totals[key]
+        items.append({
+            "name": name,
+            "quantity": round(amount, 3),
+            "measurement_unit": int(unit),
+            "unit_label": UNIT_LABELS.get(unit),
+        })
+    items.sort(key=lambda item: (item["name"], item["measurement_unit"]))
+
+    return {
+        "items": items,
+        # Recipes with no ingredient rows (or that do not exist) contribute nothing
+        "empty_recipe_ids": sorted(set(servings) - found),
+    }
@@ -0,0 +1,121 @@
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+from django.utils import timezone
+
+from . import read_model, response_cache, search, storage
+from .models import Image, ImageVariant, Ingredient, Recipe
+from .pantry import pantry_index
+from .variants import forget_image
+
+# Sent with recipe_ids after bulk writes (bulk_create, COPY) that bypass post_save
+recipes_bulk_changed = Signal()
+
+
+def touch_recipes(*recipe_ids) -> None:
+    """
+    Bump updated_at so recipe ETags change when a child row does, rebuild the stored documents
+    and drop cached responses
+    """
+    ids = {pk for pk in recipe_ids if pk is not None}
+    if ids:
+        Recipe.objects.filter(pk__in=ids).update(updated_at=timezone.now())
+        read_model.refresh_recipes(*ids)
+        response_cache.invalidate_recipes(*ids)
+
+
+def in_transaction(write, *args, **kwargs):
+    """
+    Run a model write in one transaction with the receivers below, so the updated_at bump and
+    the stored document rebuild commit with it or not at all. Views run in autocommit, where
+    save() commits before post_save is sent; delete() already sends post_delete in its own.
+    """
+    with transaction.atomic():
+        return write(*args, **kwargs)
+
+
+def deleting_recipe(origin) -> bool:
+    """True when a child is removed by the cascade of a recipe delete; the recipe goes too"""
+    return isinstance(origin, Recipe) or getattr(origin, "model", None) is Recipe
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(sender, instance, created=False, update_fields=None, **kwargs):
+    if update_fields is None or set(update_fields) - {"updated_at"}:
+        read_model.refresh_recipes(instance.pk)
+    response_cache.invalidate_recipes(instance.pk)
+    if created or update_fields is None or search.INDEXED_FIELDS & set(update_fields):
+        search.index_recipes(instance.pk)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    recipe_id = instance.pk
+    response_cache.invalidate_recipes(recipe_id)
+    search.unindex_recipes(recipe_id)
+    transaction.on_commit(lambda: pantry_index.remove_recipe(recipe_id))
+
+
+@receiver(recipes_bulk_changed)
+def recipes_bulk_saved(sender, recipe_ids, **kwargs):
+    read_model.refresh_recipes(*recipe_ids)
+    response_cache.invalidate_recipes(*recipe_ids)
+    search.index_recipes(*recipe_ids)
+    transaction.on_commit(lambda: pantry_index.refresh_recipes(*recipe_ids))
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_save, sender=Image)
+def child_saved(sender, instance, **kwargs):
+    recipe_ids = (instance.recipe_id, getattr(instance, "_loaded_recipe_id", None))
+    touch_recipes(*recipe_ids)
+    if sender is Ingredient:
+        # Ingredient names feed the recipe's search document and the pantry index
+        search.index_recipes(*recipe_ids)
+        transaction.on_commit(lambda: pantry_index.refresh_recipes(*recipe_ids))
+    instance._loaded_recipe_id = instance.recipe_id
+
+
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_delete, sender=Image)
+def child_deleted(sender, instance, origin=None, **kwargs):
+    if deleting_recipe(origin):
+        return
+    touch_recipes(instance.recipe_id)
+    if sender is Ingredient:
+        recipe_id = instance.recipe_id
+        search.index_recipes(recipe_id)
+        transaction.on_commit(lambda: pantry_index.refresh_recipes(recipe_id))
+
+
+def release_blob(digest: str) -> None:
+    """
+    Remove a filesystem blob once no image row points at it any more. The check and the unlink
+    hold the blob lock, so a row adding a reference commits either before the check (and the
+    blob stays) or after the unlink (and puts the blob back first).
+    """
+    if not digest:
+        return
+    with storage.blob_lock(digest):
+        still_used = Image.objects.filter(
+            Q(sha256=digest) | Q(thumbnail_sha256=digest), storage=storage.FILESYSTEM
+        ).exists() or ImageVariant.objects.filter(sha256=digest, storage=storage.FILESYSTEM).exists()
+        if not still_used:
+            storage.get_blob_store().delete(digest)
+
+
+@receiver(post_delete, sender=Image)
+def image_deleted(sender, instance, **kwargs):
+    forget_image(instance.pk)
+    if instance.storage == storage.FILESYSTEM:
+        # Only unlink files once the row deletion is actually committed
+        digests = (instance.sha256, instance.thumbnail_sha256)
+        transaction.on_commit(lambda: [release_blob(d) for d in digests])
+
+
+@receiver(post_delete, sender=ImageVariant)
+def variant_deleted(sender, instance, **kwargs):
+    if instance.storage == storage.FILESYSTEM:
+        digest = instance.sha256
+        transaction.on_commit(lambda: release_blob(digest))
@@ -0,0 +1,154 @@
+import hashlib
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection
+
+DATABASE = "database"
+FILESYSTEM = "filesystem"
+STORAGE_CHOICES = [(DATABASE, "Database"), (FILESYSTEM, "Filesystem")]
+
+
+def sha256_hex(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+class FileSystemBlobStore:
+    """
+    Content-addressed blob directory: every blob lives at <root>/ab/cd/<sha256>.
+    Identical content maps to the same file, so duplicate uploads are stored once.
+    """
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def path(self, digest: str) -> Path:
+        return self.root / digest[:2] / digest[2:4] / digest
+
+    def exists(self, digest: str) -> bool:
+        return self.path(digest).exists()
+
+    def put(self, content: bytes) -> str:
+        digest = sha256_hex(content)
+        target = self.path(digest)
+        if target.exists():
+            return digest
+
+        target.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temp file in the same directory and rename, so readers never see partial blobs
+        fd, tmp = tempfile.mkstemp(dir=target.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                fh.write(content)
+            os.replace(tmp, target)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        return digest
+
+    def put_stream(self, chunks) -> tuple[str, int]:
+        """Like put(), but hashes and writes chunk by chunk; returns (digest, size)"""
+        digest, size, staged = self.stage_stream(chunks)
+        self.discard(staged)
+        return digest, size
+
+    def stage_stream(self, chunks) -> tuple[str, int, str]:
+        """
+        put_stream() that keeps a private hard link to the blob and returns (digest, size, path).
+        Until publish() or discard(), the caller can restore the blob from it if it is released
+        (e.g. its last other reference deleted) before the caller's own row is committed.
+        """
+        hasher = hashlib.sha256()
+        size = 0
+        self.root.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.root, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                for chunk in chunks:
+                    hasher.update(chunk)
+                    size += len(chunk)
+                    fh.write(chunk)
+            digest = hasher.hexdigest()
+            target = self.path(digest)
+            if not target.exists():
+                target.parent.mkdir(parents=True, exist_ok=True)
+                try:
+                    os.link(tmp, target)
+                except FileExistsError:
+                    pass
+        except BaseException:
+            self.discard(tmp)
+            raise
+        return digest, size, tmp
+
+    def publish(self, digest: str, staged: str) -> None:
+        """Make sure a staged blob is in place (call under blob_lock) and drop the private link"""
+        target = self.path(digest)
+        if target.exists():
+            self.discard(staged)
+        else:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(staged, target)
+
+    def discard(self, staged: str) -> None:
+        try:
+            os.remove(staged)
+        except FileNotFoundError:
+            pass
+
+    def open(self, digest: str):
+        return open(self.path(digest), "rb")
+
+    def size(self, digest: str) -> int:
+        return self.path(digest).stat().st_size
+
+    def delete(self, digest: str) -> None:
+        try:
+            os.remove(self.path(digest))
+        except FileNotFoundError:
+            pass
+
+
+# Process-wide fallback for blob_lock() on databases without advisory locks (SQLite: one host)
+local_blob_lock = threading.RLock()
+
+
+@contextmanager
+def blob_lock(*digests):
+    """
+    Serialises releasing a filesystem blob (reference check + unlink, signals.release_blob)
+    against adding a reference to it (blob in place + INSERT + commit). Enter it before the
+    transaction that adds the reference and leave it after the commit. Session advisory locks
+    per digest on PostgreSQL; a lock for this process elsewhere.
+    """
+    keys = sorted({int(digest[:15], 16) for digest in digests if digest})
+    if not keys:
+        yield
+        return
+    if connection.vendor != "postgresql":
+        with local_blob_lock:
+            yield
+        return
+    with connection.cursor() as cursor:
+        for key in keys:
+            cursor.execute("SELECT pg_advisory_lock(%s)", [key])
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            for key in keys:
+                cursor.execute("SELECT pg_advisory_unlock(%s)", [key])
+
+
+def default_backend() -> str:
+    return getattr(settings, "IMAGE_STORAGE_BACKEND", DATABASE)
+
+
+def get_blob_store() -> FileSystemBlobStore:
+    root = getattr(settings, "IMAGE_STORAGE_ROOT", Path(settings.BASE_DIR) / "media" / "blobs")
+    return FileSystemBlobStore(root)
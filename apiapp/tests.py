@@ -1,3 +1,906 @@
-from django.test import TestCase
+import io
+import json
+import logging
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from PIL import Image as PILImage
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DatabaseError
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from mainapp import db_router
+from . import metrics, read_model, response_cache, search, storage, variants
+from .middleware import ReplicaRoutingMiddleware
+from .utils import log
+from .utils.http import parse_range_header, ranged_response, strong_etag
+from .utils.lru import ByteLRUCache
+from .utils.utils import error
+from .utils.renderers import dumps
+from .constants import MeasurementUnit
+from .models import Image, Ingredient, Recipe
+from .pantry import pantry_index
+from .endpoints.images import save_uploaded_image
+from .signals import release_blob
+
+# Query budgets per endpoint. Each one is a fixed number: it must not grow with the number of
+# recipes on a page or with the number of ingredients/images per recipe, which is why every
+# test below runs against a one-recipe catalog and against a larger one.
+#
+#   recipe list (offset)       rows with their stored documents, COUNT             2
+#   recipe list (cursor)       rows with their stored documents                    1
+#   recipe list + facets       offset list + one aggregate                         3
+#   recipe detail              row with its stored document                        1
+#   recipe search              ranked rows with their stored documents             1
+#   pantry match               index sync, rows, ingredients, images               4
+#   shopping list              one joined ingredient read                          1
+#   export                     rows with their stored documents, once              1
+#   child listings             parent lookup (404 check) + children                2
+#   image / ingredient reads   one row or one listing                              1
+#   batch lookups              one id__in read (recipes: with stored documents)    1
+#   image raw/thumb/base64     metadata row, deferred blob column                  2
+#   image variant              LRU hit                                             0
+#                              stored: variant row, its data column                2
+#                              rendered: variant lookup, image row, image data,
+#                              savepoint, INSERT, release                          6
+#
+#   ?fields= / ?include= on list, detail, search and export read the requested columns instead
+#   of the stored document, plus one read per included relation.
+#
+#   create recipe              savepoint, recipe + ingredient INSERTs, release     4 + index + document
+#   import recipes (per batch) savepoint, recipe + ingredient INSERTs, release     4 + index + document
+#   upload image               recipe row, savepoint, image INSERT, updated_at
+#                              bump, thumbnail job INSERT, release                 6 + document
+#   update recipe              row, ingredients, images, savepoint, UPDATE,
+#                              release                                             6 + index + document
+#   delete recipe              row, cascade reads (ingredients, images, variants),
+#                              cascade DELETEs (jobs, ingredients, images,
+#                              document, recipe)                                   9 + unindex
+#   add/update an ingredient   parent or row, savepoint, write, recipe
+#                              updated_at bump, release                            5 + index + document
+#   delete an ingredient       row, DELETE, recipe updated_at bump                 3 + index + document
+#   update image               row, savepoint, UPDATE, updated_at bump, release    5 + document
+#   delete image               row, variants, jobs DELETE, DELETE, updated_at bump 5 + document
+#
+# Writes whose receivers rebuild derived rows run them in the write's transaction
+# (signals.in_transaction); under the test's own transaction that is a savepoint and a release.
+# "index" is the search document refresh (one UPDATE on PostgreSQL, DELETE + INSERT on the SQLite
+# FTS5 table); "unindex" only exists for FTS5. "document" is the stored recipe document rebuild
+# (read_model.py): recipe row, ingredients, images, one upsert. The pantry index refresh runs
+# after commit and is not part of a request's budget.
+LIST_QUERIES = 2
+CURSOR_LIST_QUERIES = 1
+FACETED_LIST_QUERIES = 3
+DETAIL_QUERIES = 1
+SEARCH_QUERIES = 1
+PANTRY_QUERIES = 4
+SHOPPING_LIST_QUERIES = 1
+EXPORT_QUERIES = 1
+CHILD_LISTING_QUERIES = 2
+SINGLE_QUERIES = 1
+BATCH_QUERIES = 1
+CREATE_RECIPE_QUERIES = 4
+UPDATE_RECIPE_QUERIES = 6
+DELETE_RECIPE_QUERIES = 9
+INGREDIENT_WRITE_QUERIES = 5
+DELETE_INGREDIENT_QUERIES = 3
+UPDATE_IMAGE_QUERIES = 5
+DELETE_IMAGE_QUERIES = 5
+DOCUMENT_QUERIES = 4
+BLOB_QUERIES = 2
+RENDER_VARIANT_QUERIES = 6
+STORED_VARIANT_QUERIES = 2
+UPLOAD_IMAGE_QUERIES = 6
+IMPORT_QUERIES = 4
+# Rows per import in the budget test; bulk_create only splits an INSERT past SQLite's variable limit
+IMPORT_ROWS = 5
+
+
+def png_bytes(width=320, height=240) -> bytes:
+    out = io.BytesIO()
+    PILImage.new("RGB", (width, height), (200, 60, 40)).save(out, "PNG")
+    return out.getvalue()
+
+
+def index_queries() -> int:
+    return {"postgresql": 1, "fts5": 2}.get(search.backend(), 0)
+
+
+def unindex_queries() -> int:
+    return 1 if search.backend() == "fts5" else 0
+
+
+class SeededCatalog:
+    """RECIPES recipes with INGREDIENTS ingredients and IMAGES (metadata-only) images each"""
+
+    RECIPES = 1
+    INGREDIENTS = 1
+    IMAGES = 1
+
+    @classmethod
+    def setUpTestData(cls):
+        recipes = Recipe.objects.bulk_create([
+            Recipe(name=f"Tomato soup {i}", description="Simple", instructions="Simmer the tomatoes",
+                   diet_type=i % 3, meal_type=i % 3, meal_category=i % 3, preparation_time=10 + i,
+                   cooking_time=20 + i, difficulty_level=i % 3, rating=i % 5, number_of_servings=2)
+            for i in range(cls.RECIPES)
+        ])
+        Ingredient.objects.bulk_create([
+            Ingredient(recipe=recipe, name="tomato" if n == 0 else f"spice {n}", category="veg",
+                       quantity=100 + n, measurement_unit=0)
+            for recipe in recipes for n in range(cls.INGREDIENTS)
+        ])
+        Image.objects.bulk_create([
+            Image(recipe=recipe, filename=f"{recipe.pk}-{n}.jpg", content_type="image/jpeg", size=1024,
+                  has_data=True, width=800, height=600)
+            for recipe in recipes for n in range(cls.IMAGES)
+        ])
+        if search.backend():
+            search.index_recipes(*[r.pk for r in recipes])
+        read_model.refresh_recipes(*[r.pk for r in recipes])
+        # Seeded "long ago", so the pantry index has nothing to catch up on when synced
+        Recipe.objects.update(updated_at=timezone.now() - timedelta(days=1))
+        cls.recipe = recipes[0]
+        cls.ingredient = Ingredient.objects.filter(recipe=cls.recipe).first()
+        cls.image = Image.objects.filter(recipe=cls.recipe).first()
+
+    def setUp(self):
+        # Cached counts and facets would hide queries
+        cache.clear()
+
+
+class QueryBudgetTests(SeededCatalog):
+    """Mixed into a TestCase per catalog size; see the budgets above"""
+
+    def recipe_payload(self, **overrides):
+        payload = {
+            "name": "Tomato salad", "description": "Fresh", "instructions": "Slice the tomatoes",
+            "diet_type": 0, "meal_type": 1, "meal_category": 0, "preparation_time": 5, "cooking_time": 0,
+            "difficulty_level": 0, "rating": 4.0, "number_of_servings": 2,
+            "ingredients": [
+                {"name": f"item {n}", "category": "veg", "quantity": n + 1, "measurement_unit": 0}
+                for n in range(self.INGREDIENTS)
+            ],
+        }
+        payload.update(overrides)
+        return payload
+
+    def assertQueries(self, budget, method, path, **kwargs):
+        with self.assertNumQueries(budget):
+            response = getattr(self.client, method)(path, **kwargs)
+            if response.streaming:
+                # Streamed bodies run their queries while being consumed
+                response.body = b"".join(response.streaming_content)
+        self.assertLess(response.status_code, 300)
+        return response
+
+    # -- reads ----------------------------------------------------------------------------------
+
+    def test_list_recipes(self):
+        response = self.assertQueries(LIST_QUERIES, "get", "/api/recipes/?page_size=50")
+        self.assertEqual(len(response.json()["data"]["items"]), self.RECIPES)
+
+    def test_list_recipes_cursor(self):
+        self.assertQueries(CURSOR_LIST_QUERIES, "get", "/api/recipes/?mode=cursor&page_size=50&sort=-rating")
+
+    def test_list_recipes_with_facets(self):
+        self.assertQueries(FACETED_LIST_QUERIES, "get", "/api/recipes/?facets=true&diet_type=0&max_cooking_time=90")
+
+    def test_get_recipe(self):
+        response = self.assertQueries(DETAIL_QUERIES, "get", f"/api/recipes/{self.recipe.pk}")
+        data = response.json()["data"]
+        self.assertEqual(len(data["ingredients"]), self.INGREDIENTS)
+        self.assertEqual(len(data["images"]), self.IMAGES)
+
+    def test_search_recipes(self):
+        if not search.backend():
+            self.skipTest("full-text search is not available on this database")
+        response = self.assertQueries(SEARCH_QUERIES, "get", "/api/recipes/search?q=tomato&page_size=50")
+        self.assertEqual(len(response.json()["data"]["items"]), self.RECIPES)
+
+    def test_pantry_recipes(self):
+        pantry_index.load()
+        have = "&".join(["have=tomatoes"] + [f"have=spice+{n}" for n in range(1, self.INGREDIENTS - 1)])
+        response = self.assertQueries(PANTRY_QUERIES, "get", f"/api/recipes/pantry?{have}&max_missing=1&page_size=50")
+        self.assertEqual(response.json()["data"]["total"], self.RECIPES)
+
+    def test_shopping_list(self):
+        recipes = [{"recipe_id": pk, "servings": 4} for pk in Recipe.objects.values_list("id", flat=True)]
+        self.assertQueries(SHOPPING_LIST_QUERIES, "post", "/api/recipes/shopping-list",
+                           data={"recipes": recipes}, content_type="application/json")
+
+    def test_export_recipes(self):
+        response = self.assertQueries(EXPORT_QUERIES, "get", "/api/recipes/export")
+        self.assertEqual(len(response.body.splitlines()), self.RECIPES)
+
+    def test_sparse_fieldsets(self):
+        response = self.assertQueries(LIST_QUERIES, "get", "/api/recipes/?fields=name,rating&page_size=50")
+        items = response.json()["data"]["items"]
+        self.assertEqual([list(item) for item in items], [["name", "rating", "id"]] * self.RECIPES)
+        response = self.assertQueries(DETAIL_QUERIES + 1, "get",
+                                      f"/api/recipes/{self.recipe.pk}?fields=name&include=images")
+        self.assertEqual(list(response.json()["data"]), ["name", "id", "images"])
+        response = self.assertQueries(EXPORT_QUERIES + 2, "get", "/api/recipes/export?include=ingredients,images")
+        self.assertEqual(len(json.loads(response.body.splitlines()[0])["ingredients"]), self.INGREDIENTS)
+        self.assertEqual(self.client.get("/api/recipes/?fields=name,blob").status_code, 400)
+
+    def test_batch_lookups(self):
+        ids = list(Recipe.objects.order_by("-id").values_list("id", flat=True)) + [0]
+        response = self.assertQueries(BATCH_QUERIES, "get", f"/api/recipes/batch?ids={','.join(map(str, ids))}")
+        data = response.json()["data"]
+        self.assertEqual([item["id"] for item in data["items"]], ids)
+        self.assertEqual(data["items"][-1], {"id": 0, "error": "Not found"})
+        self.assertEqual(data["missing"], [0])
+        self.assertQueries(BATCH_QUERIES, "get", f"/api/ingredients/batch?ids={self.ingredient.pk}&ids=0")
+        self.assertQueries(BATCH_QUERIES, "get", f"/api/images/batch?ids={self.image.pk},0")
+        self.assertEqual(self.client.get("/api/recipes/batch?ids=1,x").status_code, 400)
+
+    def test_recipe_child_listings(self):
+        self.assertQueries(CHILD_LISTING_QUERIES, "get", f"/api/recipes/{self.recipe.pk}/images")
+        self.assertQueries(CHILD_LISTING_QUERIES, "get", f"/api/recipes/{self.recipe.pk}/ingredients")
+
+    def test_image_reads(self):
+        self.assertQueries(SINGLE_QUERIES, "get", "/api/images/")
+        self.assertQueries(SINGLE_QUERIES, "get", f"/api/images/recipes/{self.recipe.pk}/images/")
+        self.assertQueries(SINGLE_QUERIES, "get", f"/api/images/{self.image.pk}")
+
+    def test_ingredient_reads(self):
+        self.assertQueries(SINGLE_QUERIES, "get", "/api/ingredients/")
+        self.assertQueries(SINGLE_QUERIES, "get", f"/api/ingredients/?recipe_id={self.recipe.pk}")
+        self.assertQueries(SINGLE_QUERIES, "get", f"/api/ingredients/{self.ingredient.pk}")
+
+    def with_blobs(self):
+        """The seeded image with real bytes and a thumbnail in the database (seeded ones have none)"""
+        content = png_bytes()
+        Image.objects.filter(pk=self.image.pk).update(
+            data=content, sha256=storage.sha256_hex(content), size=len(content), thumbnail=content,
+            thumbnail_sha256=storage.sha256_hex(content), thumbnail_content_type="image/png", has_thumbnail=True,
+        )
+
+    def test_image_blob_reads(self):
+        self.with_blobs()
+        for path in ["raw/", "thumb/", "base64/"]:
+            self.assertQueries(BLOB_QUERIES, "get", f"/api/images/{self.image.pk}/{path}")
+
+    def test_image_variant(self):
+        self.with_blobs()
+        variants.forget_image(self.image.pk)
+        path = f"/api/images/{self.image.pk}/v/{variants.VARIANT_WIDTHS[0]}.webp"
+        self.assertQueries(RENDER_VARIANT_QUERIES, "get", path)
+        self.assertQueries(0, "get", path)  # in-process LRU
+        variants.forget_image(self.image.pk)
+        self.assertQueries(STORED_VARIANT_QUERIES, "get", path)
+
+    # -- writes ---------------------------------------------------------------------------------
+
+    def test_upload_image(self):
+        with tempfile.TemporaryDirectory() as tmp, override_settings(IMAGE_STORAGE_ROOT=tmp):
+            self.assertQueries(UPLOAD_IMAGE_QUERIES + DOCUMENT_QUERIES, "post",
+                               f"/api/images/recipes/{self.recipe.pk}/images/",
+                               data={"file": SimpleUploadedFile("a.png", png_bytes(), "image/png")})
+
+    def test_import_recipes(self):
+        body = "\n".join(json.dumps(self.recipe_payload(name=f"Imported {n}")) for n in range(IMPORT_ROWS))
+        response = self.assertQueries(IMPORT_QUERIES + index_queries() + DOCUMENT_QUERIES, "post",
+                                      "/api/recipes/import", data=body, content_type="application/x-ndjson")
+        self.assertEqual(response.json()["data"]["created"], IMPORT_ROWS)
+
+    def test_create_ingredient(self):
+        self.assertQueries(INGREDIENT_WRITE_QUERIES + index_queries() + DOCUMENT_QUERIES, "post",
+                           f"/api/ingredients/recipes/{self.recipe.pk}",
+                           data={"name": "basil", "category": "herb", "quantity": 5, "measurement_unit": 0},
+                           content_type="application/json")
+
+    def test_create_recipe(self):
+        response = self.assertQueries(CREATE_RECIPE_QUERIES + index_queries() + DOCUMENT_QUERIES,
+                                      "post", "/api/recipes/",
+                                      data=self.recipe_payload(), content_type="application/json")
+        self.assertEqual(len(response.json()["data"]["ingredients"]), self.INGREDIENTS)
+
+    def test_update_recipe(self):
+        response = self.assertQueries(UPDATE_RECIPE_QUERIES + index_queries() + DOCUMENT_QUERIES,
+                                      "put", f"/api/recipes/{self.recipe.pk}",
+                                      data=self.recipe_payload(description=None), content_type="application/json")
+        data = response.json()["data"]
+        self.assertEqual((data["description"], data["cooking_time"]), ("", 0))
+        self.assertEqual((len(data["ingredients"]), len(data["images"])), (self.INGREDIENTS, self.IMAGES))
+
+    def test_delete_recipe(self):
+        self.assertQueries(DELETE_RECIPE_QUERIES + unindex_queries(), "delete", f"/api/recipes/{self.recipe.pk}")
+
+    def test_add_ingredient(self):
+        self.assertQueries(INGREDIENT_WRITE_QUERIES + index_queries() + DOCUMENT_QUERIES, "post",
+                           f"/api/recipes/{self.recipe.pk}/ingredients",
+                           data={"name": "basil", "category": "herb", "quantity": 5, "measurement_unit": 0},
+                           content_type="application/json")
+
+    def test_update_ingredient(self):
+        self.assertQueries(INGREDIENT_WRITE_QUERIES + index_queries() + DOCUMENT_QUERIES, "put",
+                           f"/api/ingredients/{self.ingredient.pk}",
+                           data={"name": "basil", "category": "herb", "quantity": 5, "measurement_unit": 0},
+                           content_type="application/json")
+
+    def test_delete_ingredient(self):
+        self.assertQueries(DELETE_INGREDIENT_QUERIES + index_queries() + DOCUMENT_QUERIES, "delete",
+                           f"/api/ingredients/{self.ingredient.pk}")
+
+    def test_update_image(self):
+        self.assertQueries(UPDATE_IMAGE_QUERIES + DOCUMENT_QUERIES, "put", f"/api/images/{self.image.pk}",
+                           data={"filename": "renamed.jpg"}, content_type="application/json")
+
+    def test_delete_image(self):
+        self.assertQueries(DELETE_IMAGE_QUERIES + DOCUMENT_QUERIES, "delete", f"/api/images/{self.image.pk}")
+
+
+# Response cache hits would skip the queries being measured
+@override_settings(RESPONSE_CACHE_ENABLED=False)
+class SmallCatalogQueryBudgetTests(QueryBudgetTests, TestCase):
+    RECIPES = 1
+    INGREDIENTS = 1
+    IMAGES = 1
+
+
+@override_settings(RESPONSE_CACHE_ENABLED=False)
+class LargeCatalogQueryBudgetTests(QueryBudgetTests, TestCase):
+    RECIPES = 40
+    INGREDIENTS = 12
+    IMAGES = 5
+
+
+@override_settings(RESPONSE_CACHE_ENABLED=False)
+class CursorPaginationTests(SeededCatalog, TestCase):
+    RECIPES = 7  # ratings 0-4 repeat, so every page boundary below falls inside a tie
+
+    def page(self, query):
+        response = self.client.get(f"/api/recipes/?mode=cursor&page_size=2&sort=-rating&fields=id,rating{query}")
+        self.assertEqual(response.status_code, 200)
+        return response.json()["data"]
+
+    def test_cursors_walk_ties_on_the_sort_key_without_gaps_or_repeats(self):
+        expected = list(Recipe.objects.order_by("-rating", "-id").values_list("id", flat=True))
+        pages = [self.page("")]
+        while pages[-1]["next"]:
+            pages.append(self.page(f"&cursor={pages[-1]['next']}"))
+        self.assertEqual([item["id"] for page in pages for item in page["items"]], expected)
+        self.assertIsNone(pages[0]["prev"])
+
+        back = [self.page(f"&cursor={pages[-1]['prev']}")]
+        while back[-1]["prev"]:
+            back.append(self.page(f"&cursor={back[-1]['prev']}"))
+        self.assertEqual([[item["id"] for item in page["items"]] for page in back],
+                         [[item["id"] for item in page["items"]] for page in pages[-2::-1]])
+
+    def test_bad_cursor_is_a_400(self):
+        first = self.page("")
+        for cursor, message in [("not-a-cursor", "Invalid cursor"), (first["next"] + "x", "Invalid cursor")]:
+            response = self.client.get(f"/api/recipes/?sort=-rating&cursor={cursor}")
+            self.assertEqual(response.status_code, 400, cursor)
+            self.assertIn(message, response.json()["message"])
+        response = self.client.get(f"/api/recipes/?sort=rating&cursor={first['next']}")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("different sort order", response.json()["message"])
+
+    def test_list_etag_ignores_cached_counts_and_follows_writes(self):
+        path = "/api/recipes/?page_size=2&include_total=true&facets=true"
+        etag = self.client.get(path)["ETag"]
+        with mock.patch("apiapp.utils.pagination.cached_count", return_value=999), \
+                mock.patch("apiapp.endpoints.recipes.facet_counts", return_value={}):
+            response = self.client.get(path)
+            self.assertEqual(response.json()["data"]["total"], 999)
+            self.assertEqual(response["ETag"], etag)
+            self.assertEqual(self.client.get(path, headers={"If-None-Match": etag}).status_code, 304)
+
+        # A write off the page still changes what the page's list version says
+        last = Recipe.objects.order_by("id").last()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.delete(f"/api/recipes/{last.pk}").status_code, 200)
+        self.assertNotEqual(self.client.get(path)["ETag"], etag)
+        self.assertEqual(self.client.get(path, headers={"If-None-Match": etag}).status_code, 200)
+
+
+class RangeTests(SimpleTestCase):
+    BODY = bytes(range(100))
+    ETAG = strong_etag("abc")
+
+    def get(self, **headers):
+        request = RequestFactory().get("/", headers=headers)
+        response = ranged_response(request, io.BytesIO(self.BODY), "image/jpeg", etag=self.ETAG)
+        body = b"".join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    def test_parse_range_header(self):
+        for header, expected in [
+            ("bytes=-5", [(95, 99)]),  # suffix
+            ("bytes=-500", [(0, 99)]),  # suffix longer than the body
+            ("bytes=90-", [(90, 99)]),  # open-ended
+            ("bytes=50-500", [(50, 99)]),  # past the end
+            ("bytes=0-4,-5", [(0, 4), (95, 99)]),
+            ("bytes=100-,200-300", []),  # nothing satisfiable
+            ("items=0-4", None),
+            ("bytes=5-1", None),
+            # Malformed bounds: the header is ignored and the whole body served
+            ("bytes=-", None), ("bytes=+5-10", None), ("bytes=1_0-20", None), ("bytes=0--5", None),
+            ("bytes=0-1 0", None), ("bytes=\u0665-9", None),
+            ("bytes=" + ",".join(["0-1"] * 17), None),
+        ]:
+            self.assertEqual(parse_range_header(header, len(self.BODY)), expected, header)
+
+    def test_single_range(self):
+        response, body = self.get(Range="bytes=-5")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual((response["Content-Range"], response["Content-Length"]), ("bytes 95-99/100", "5"))
+        self.assertEqual(body, self.BODY[95:])
+
+    def test_multiple_ranges(self):
+        response, body = self.get(Range="bytes=0-4,90-")
+        self.assertEqual(response.status_code, 206)
+        self.assertTrue(response["Content-Type"].startswith("multipart/byteranges; boundary="))
+        self.assertEqual(len(body), int(response["Content-Length"]))
+        self.assertIn(b"Content-Range: bytes 0-4/100\r\n\r\n" + self.BODY[:5] + b"\r\n--", body)
+        self.assertIn(b"Content-Range: bytes 90-99/100\r\n\r\n" + self.BODY[90:] + b"\r\n--", body)
+        self.assertTrue(body.endswith(b"--\r\n"))
+
+    def test_malformed_range_is_ignored(self):
+        response, body = self.get(Range="bytes=+5-10")
+        self.assertEqual((response.status_code, body), (200, self.BODY))
+
+    def test_unsatisfiable_range_is_a_416(self):
+        response, _ = self.get(Range="bytes=100-")
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], "bytes */100")
+
+    def test_if_range(self):
+        response, _ = self.get(Range="bytes=0-4", If_Range=self.ETAG)
+        self.assertEqual(response.status_code, 206)
+        # A weak or stale validator sends the whole, current body instead
+        for validator in ["W/" + self.ETAG, strong_etag("stale")]:
+            response, body = self.get(Range="bytes=0-4", If_Range=validator)
+            self.assertEqual((response.status_code, body), (200, self.BODY), validator)
+
+
+class PantryIndexTests(TestCase):
+    RECIPES = {
+        "both": ["tomato", "onion"],
+        "tomato only": ["Tomatoes"],
+        "one missing": ["tomato", "onion", "garlic"],
+        "two missing": ["tomato", "basil", "garlic"],
+        "unrelated": ["flour", "sugar"],
+    }
+
+    def setUp(self):
+        self.ids = {}
+        for name, ingredients in self.RECIPES.items():
+            recipe = Recipe.objects.create(name=name, instructions="Cook", diet_type=0, meal_type=0, meal_category=0,
+                                           preparation_time=1, cooking_time=1, difficulty_level=0)
+            Ingredient.objects.bulk_create([Ingredient(recipe=recipe, name=n, quantity=1, measurement_unit=0) for n in ingredients])
+            self.ids[name] = recipe.pk
+        pantry_index.load()
+        self.addCleanup(pantry_index.reset)
+
+    def match(self, pantry, **kwargs):
+        names = {pk: name for name, pk in self.ids.items()}
+        return [(names[pk], matched, missing) for pk, matched, missing in pantry_index.match(pantry, **kwargs)["ids"]]
+
+    def test_ordered_by_missing_then_matched(self):
+        self.assertEqual(self.match(["tomato", "onion"], max_missing=2), [
+            ("both", 2, 0), ("tomato only", 1, 0), ("one missing", 2, 1), ("two missing", 1, 2),
+        ])
+        result = pantry_index.match(["tomato", "onion"], max_missing=1)
+        self.assertEqual((result["counts"], result["total"]), ({0: 2, 1: 1}, 3))
+        self.assertEqual(self.match(["tomato", "onion"], max_missing=2, offset=1, limit=2),
+                         [("tomato only", 1, 0), ("one missing", 2, 1)])
+
+    def test_ingredient_edit_updates_the_index(self):
+        ingredient = Ingredient.objects.get(recipe_id=self.ids["tomato only"])
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.put(f"/api/ingredients/{ingredient.pk}", {"name": "garlic", "category": "veg",
+                                       "quantity": 1, "measurement_unit": 0}, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.match(["tomato"], max_missing=0), [])
+        self.assertEqual(self.match(["garlic"], max_missing=0), [("tomato only", 1, 0)])
+
+    def test_sync_picks_up_edits_made_elsewhere(self):
+        # Another process's write: no signals here, only the recipe's updated_at moves
+        Ingredient.objects.filter(recipe_id=self.ids["unrelated"], name="sugar").update(name="onion")
+        Recipe.objects.filter(pk=self.ids["unrelated"]).update(updated_at=timezone.now())
+        self.assertNotIn("unrelated", [name for name, _, _ in self.match(["onion"], max_missing=1)])
+        pantry_index.sync()
+        self.assertIn(("unrelated", 1, 1), self.match(["onion"], max_missing=1))
+
+
+class ShoppingListTests(TestCase):
+    def recipe(self, servings, *ingredients):
+        recipe = Recipe.objects.create(name="Soup", instructions="Simmer", diet_type=0, meal_type=0, meal_category=0,
+                                       preparation_time=1, cooking_time=1, difficulty_level=0,
+                                       number_of_servings=servings)
+        Ingredient.objects.bulk_create([
+            Ingredient(recipe=recipe, name=name, quantity=quantity, measurement_unit=unit)
+            for name, quantity, unit in ingredients
+        ])
+        return recipe.pk
+
+    def test_scaled_converted_and_summed(self):
+        first = self.recipe(2, ("tomato", 500, MeasurementUnit.GRAM), ("milk", 2, MeasurementUnit.CUP),
+                            ("sugar", 100, MeasurementUnit.GRAM), ("stock", 3, 9))
+        second = self.recipe(4, ("Tomatoes", 1, MeasurementUnit.KILOGRAM), ("milk", 1, MeasurementUnit.LITER),
+                             ("sugar", 1, MeasurementUnit.TABLESPOON), ("stock", 2, 9))
+        response = self.client.post("/api/recipes/shopping-list", {"recipes": [
+            {"recipe_id": first, "servings": 4}, {"recipe_id": second, "servings": 2}, {"recipe_id": 0, "servings": 1},
+        ]}, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        data = response.json()["data"]
+        self.assertEqual([(i["name"], i["quantity"], i["measurement_unit"], i["unit_label"]) for i in data["items"]], [
+            # 2 × 2 cups + 0.5 × 1 l
+            ("milk", 1.446, MeasurementUnit.LITER, "Liter"),
+            # Unknown units are not converted, only scaled and summed per unit
+            ("stock", 7, 9, None),
+            # Mass and volume of one name stay separate lines
+            ("sugar", 200, MeasurementUnit.GRAM, "Gram"),
+            ("sugar", 1.5, MeasurementUnit.TEASPOON, "Teaspoon"),
+            ("tomato", 1.5, MeasurementUnit.KILOGRAM, "Kilogram"),
+        ])
+        self.assertEqual(data["empty_recipe_ids"], [0])
+
+
+@override_settings(RESPONSE_CACHE_ENABLED=True)
+class ResponseCacheTests(SeededCatalog, TestCase):
+    def setUp(self):
+        super().setUp()
+        response_cache.local_cache.clear()
+
+    def cached_read(self, path):
+        self.assertEqual(self.client.get(path).status_code, 200)
+        with self.assertNumQueries(0):
+            return self.client.get(path).json()["data"]
+
+    def test_child_row_write_invalidates_cached_responses(self):
+        detail, listing = f"/api/recipes/{self.recipe.pk}", "/api/recipes/"
+        for path in [detail, listing]:
+            self.cached_read(path)
+        ingredient = {"name": "basil", "category": "herb", "quantity": 5, "measurement_unit": 0}
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.put(f"/api/ingredients/{self.ingredient.pk}", ingredient,
+                                       content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(self.cached_read(detail)["ingredients"][0]["name"], "basil")
+        self.assertEqual(self.cached_read(listing)["items"][0]["ingredients"][0]["name"], "basil")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f"/api/images/{self.image.pk}")
+        self.assertEqual(self.cached_read(detail)["images"], [])
+
+    def test_write_in_one_process_misses_in_another(self):
+        # Two workers: a local LRU each, version counters in the shared cache
+        workers = [ByteLRUCache(1024 * 1024), ByteLRUCache(1024 * 1024)]
+        detail = f"/api/recipes/{self.recipe.pk}"
+        for worker in workers:
+            with mock.patch.object(response_cache, "local_cache", worker):
+                self.cached_read(detail)
+        with mock.patch.object(response_cache, "local_cache", workers[0]), self.captureOnCommitCallbacks(execute=True):
+            self.client.put(f"/api/ingredients/{self.ingredient.pk}", {"name": "basil", "category": "herb",
+                            "quantity": 5, "measurement_unit": 0}, content_type="application/json")
+        with mock.patch.object(response_cache, "local_cache", workers[1]):
+            misses = workers[1].misses
+            self.assertEqual(self.cached_read(detail)["ingredients"][0]["name"], "basil")
+            self.assertEqual(workers[1].misses, misses + 1)
+
+    def test_local_entries_expire(self):
+        detail = f"/api/recipes/{self.recipe.pk}"
+        with mock.patch.object(response_cache, "CACHE_SECONDS", 0):
+            self.client.get(detail)
+        with self.assertNumQueries(DETAIL_QUERIES):
+            self.client.get(detail)
+
+    @override_settings(DATABASE_REPLICAS=["replica_1"], REPLICA_PIN_SECONDS=0.05)
+    def test_replica_lag_bump_is_coalesced(self):
+        key = response_cache.recipe_version_key(self.recipe.pk)
+        [start] = response_cache.get_versions(key)
+        threads = threading.active_count()
+        for _ in range(20):
+            response_cache.bump_committed(key)
+        self.assertLessEqual(threading.active_count(), threads + 1)
+        self.assertEqual(response_cache.get_versions(key), [start + 20])
+        deadline = time.monotonic() + 5
+        while response_cache.get_versions(key) == [start + 20] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        time.sleep(0.1)
+        # One delayed bump for the whole burst
+        self.assertEqual(response_cache.get_versions(key), [start + 21])
+
+
+class MetricsTests(TestCase):
+    def test_request_is_recorded_per_route(self):
+        recipe = Recipe.objects.create(name="Soup", instructions="Simmer", diet_type=0, meal_type=0, meal_category=0,
+                                       preparation_time=5, cooking_time=20, difficulty_level=0, rating=4,
+                                       number_of_servings=2)
+        self.client.get(f"/api/recipes/{recipe.pk}")
+        self.client.get("/api/recipes/0")
+        body = self.client.get("/api/metrics").content.decode()
+        self.assertIn('mealmaster_http_requests_total{route="api/recipes/<recipe_id>",method="GET",status="200"}', body)
+        self.assertIn('mealmaster_http_requests_total{route="api/recipes/<recipe_id>",method="GET",status="404"}', body)
+        self.assertIn('mealmaster_db_queries_per_request_bucket{route="api/recipes/<recipe_id>",method="GET",le="+Inf"}',
+                      body)
+
+    def test_streamed_export_is_recorded_with_its_queries(self):
+        Recipe.objects.create(name="Soup", instructions="Simmer", diet_type=0, meal_type=0, meal_category=0,
+                              preparation_time=5, cooking_time=20, difficulty_level=0)
+        with mock.patch.object(metrics, "observe_request") as observe:
+            response = self.client.get("/api/recipes/export")
+            observe.assert_not_called()
+            body = b"".join(response.streaming_content)
+        route, method, status, elapsed, size, queries, seconds = observe.call_args.args
+        self.assertEqual((route, status, size), ("api/recipes/export", 200, len(body)))
+        self.assertGreaterEqual(queries, 1)
+
+    def test_histogram_buckets_are_cumulative(self):
+        shard = metrics.Shard()
+        for value in (0.002, 0.02, 20.0):
+            shard.observe("mealmaster_thumbnail_duration_seconds", ("ok",), value)
+        hist = shard.histograms["mealmaster_thumbnail_duration_seconds", ("ok",)]
+        self.assertEqual(hist[-1], 3)
+        self.assertEqual(hist[len(metrics.LATENCY_BUCKETS)], 1)  # +Inf only
+        self.assertAlmostEqual(hist[-2], 20.022)
+
+
+@override_settings(DATABASE_REPLICAS=["replica_1", "replica_2"])
+class ReplicaRoutingTests(SimpleTestCase):
+    def route(self, method, **cookies):
+        """The alias a model read would use inside a request, and the response"""
+        request = getattr(RequestFactory(), method)("/api/recipes/")
+        request.COOKIES.update(cookies)
+        seen = []
+
+        def view(request):
+            seen.append(db_router.ReplicaRouter().db_for_read(Recipe))
+            return HttpResponse()
+
+        response = ReplicaRoutingMiddleware(view)(request)
+        return seen[0], response
+
+    def test_reads_go_to_a_replica(self):
+        alias, response = self.route("get")
+        self.assertIn(alias, ["replica_1", "replica_2"])
+        self.assertNotIn(ReplicaRoutingMiddleware.COOKIE, response.cookies)
+
+    def test_writes_pin_the_client_to_the_primary(self):
+        alias, response = self.route("post")
+        self.assertEqual(alias, "default")
+        self.assertIn(ReplicaRoutingMiddleware.COOKIE, response.cookies)
+        alias, _ = self.route("get", **{ReplicaRoutingMiddleware.COOKIE: "1"})
+        self.assertEqual(alias, "default")
+
+    def test_streamed_bodies_read_from_the_request_replica(self):
+        def view(request):
+            return StreamingHttpResponse(db_router.ReplicaRouter().db_for_read(Recipe) for _ in range(2))
+
+        body = b"".join(ReplicaRoutingMiddleware(view)(RequestFactory().get("/api/recipes/export")).streaming_content)
+        self.assertIn(body.decode(), ["replica_1" * 2, "replica_2" * 2])
+
+    async def test_async_streamed_bodies_read_from_the_request_replica(self):
+        async def view(request):
+            async def chunks():
+                for _ in range(2):
+                    yield db_router.ReplicaRouter().db_for_read(Recipe)
+            return StreamingHttpResponse(chunks())
+
+        response = await ReplicaRoutingMiddleware(view)(RequestFactory().get("/api/recipes/export"))
+        body = b"".join([chunk async for chunk in response.streaming_content])
+        self.assertIn(body.decode(), ["replica_1" * 2, "replica_2" * 2])
+
+    def test_reads_outside_requests_use_the_primary(self):
+        self.assertEqual(db_router.ReplicaRouter().db_for_read(Recipe), "default")
+        self.assertEqual(db_router.ReplicaRouter().db_for_write(Recipe), "default")
+
+
+class LoggingTests(SimpleTestCase):
+    def test_records_are_written_as_json_by_the_listener(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            handler = log.BackgroundHandler(filename=Path(tmp) / "api.log", console=False)
+            logger = logging.getLogger("apiapp.tests.logging")
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            logger.addHandler(handler)
+            token = log.request_id.set("abc123")
+            try:
+                logger.warning("Recipe %s not found", 7, extra={"status_code": 404})
+                try:
+                    1 / 0
+                except ZeroDivisionError:
+                    logger.exception("Boom")
+            finally:
+                log.request_id.reset(token)
+                logger.removeHandler(handler)
+                handler.close()
+            lines = [json.loads(line) for line in (Path(tmp) / "api.log").read_text().splitlines()]
+        self.assertEqual(lines[0]["message"], "Recipe 7 not found")
+        self.assertEqual(lines[0]["request_id"], "abc123")
+        self.assertEqual(lines[0]["status_code"], 404)
+        self.assertIn("ZeroDivisionError", lines[1]["exception"])
+
+    def test_repeated_warnings_are_rate_limited(self):
+        limiter = log.RateLimitFilter(burst=2, seconds=60)
+        record = lambda level=logging.WARNING: logging.LogRecord("api", level, "", 0, "Slow %s", ("x",), None)
+        self.assertEqual([limiter.filter(record()) for _ in range(4)], [True, True, False, False])
+        self.assertTrue(limiter.filter(record(logging.ERROR)))
+        self.assertTrue(limiter.filter(record(logging.INFO)))
+        limiter.seconds = 0  # next window
+        first = record()
+        self.assertTrue(limiter.filter(first))
+        self.assertEqual(first.suppressed, 2)
+
+    def test_different_api_warnings_are_limited_separately(self):
+        records = []
+        handler = logging.Handler()
+        handler.emit = records.append
+        handler.addFilter(log.RateLimitFilter(burst=1, seconds=60))
+        logger = logging.getLogger("apiapp.utils.utils")
+        self.addCleanup(logger.setLevel, logger.level)
+        self.addCleanup(logger.removeHandler, handler)
+        logger.setLevel(logging.WARNING)
+        logger.addHandler(handler)
+        for message in ["Recipe not found", "Recipe not found", "Invalid cursor"]:
+            error(message, 400)
+        self.assertEqual([r.getMessage() for r in records],
+                         ["API Warning: Recipe not found | Details: None", "API Warning: Invalid cursor | Details: None"])
+
+
+class WriteTransactionTests(SeededCatalog, TestCase):
+    def test_failed_document_rebuild_rolls_back_the_write(self):
+        ingredient = {"name": "basil", "category": "herb", "quantity": 5, "measurement_unit": 0}
+        updated_at = Recipe.objects.get(pk=self.recipe.pk).updated_at
+        with mock.patch.object(read_model, "refresh_recipes", side_effect=DatabaseError("refresh failed")):
+            for method, path, data in [
+                ("put", f"/api/ingredients/{self.ingredient.pk}", ingredient),
+                ("post", f"/api/recipes/{self.recipe.pk}/ingredients", ingredient),
+                ("put", f"/api/images/{self.image.pk}", {"filename": "renamed.jpg"}),
+            ]:
+                response = getattr(self.client, method)(path, data, content_type="application/json")
+                self.assertEqual(response.status_code, 500, path)
+        self.assertEqual(Ingredient.objects.get(pk=self.ingredient.pk).name, "tomato")
+        self.assertFalse(Ingredient.objects.filter(name="basil").exists())
+        self.assertEqual(Image.objects.get(pk=self.image.pk).filename, self.image.filename)
+        self.assertEqual(Recipe.objects.get(pk=self.recipe.pk).updated_at, updated_at)
+
+
+class BlobStoreTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.enterContext(override_settings(IMAGE_STORAGE_ROOT=tmp.name))
+        self.store = storage.get_blob_store()
+        self.recipe = Recipe.objects.create(name="Soup", instructions="Simmer", diet_type=0, meal_type=0,
+                                            meal_category=0, preparation_time=1, cooking_time=1, difficulty_level=0)
+
+    def upload(self, content):
+        img = Image(recipe=self.recipe, filename="a.jpg", content_type="image/jpeg", storage=storage.FILESYSTEM)
+        img.size = img.set_blob_stream("data", [content])
+        return img
+
+    def test_upload_deduplicated_against_a_released_blob_puts_it_back(self):
+        first = self.upload(b"same bytes")
+        save_uploaded_image(first)
+        second = self.upload(b"same bytes")  # deduplicated: the file already exists
+        # The only committed reference goes away before the second row is saved
+        first.delete()
+        release_blob(first.sha256)
+        self.assertFalse(self.store.exists(first.sha256))
+        save_uploaded_image(second)
+        with second.open_blob("data") as fh:
+            self.assertEqual(fh.read(), b"same bytes")
+        self.assertEqual([p.name for p in Path(self.store.root).iterdir() if p.name.startswith(".tmp-")], [])
+
+
+class ImportTests(TestCase):
+    def recipe(self, **overrides):
+        return {"name": "Soup", "instructions": "Simmer", "diet_type": 0, "meal_type": 0, "meal_category": 0,
+                "preparation_time": 5, "cooking_time": 10, "difficulty_level": 0, **overrides}
+
+    def test_rows_refused_by_the_database_are_reported(self):
+        rows = [self.recipe(), self.recipe(), self.recipe(number_of_servings=None), self.recipe(cooking_time=-5)]
+        response = self.client.post("/api/recipes/import?batch_size=10", "\n".join(map(json.dumps, rows)),
+                                    content_type="application/x-ndjson")
+        self.assertEqual(response.status_code, 200)
+        report = response.json()["data"]
+        self.assertEqual((report["created"], report["failed"]), (2, 2))
+        self.assertEqual(sorted(e["row"] for e in report["errors"]), [3, 4])
+        self.assertEqual(Recipe.objects.count(), 2)
+
+    def test_negative_times_are_rejected(self):
+        response = self.client.post("/api/recipes/", self.recipe(preparation_time=-5), content_type="application/json")
+        self.assertEqual(response.status_code, 422)
+        self.assertFalse(Recipe.objects.exists())
+
+
+class ReadModelTests(SimpleTestCase):
+    def test_only_origin_markers_are_replaced(self):
+        origin = b"http://testserver"
+        for name in ["Plain", "Back\\slash", "Literal \\u0000/ text"]:
+            body = dumps({"name": name, "url": read_model.stored_url("/api/images/1/raw/")}).decode()
+            document = json.loads(read_model.with_origin(body, origin))
+            self.assertEqual(document, {"name": name, "url": "http://testserver/api/images/1/raw/"})
+
+
+@override_settings(RESPONSE_CACHE_ENABLED=False)
+class AsyncApiTests(SeededCatalog, TestCase):
+    """The async handlers (mainapp/urls_async.py) answer exactly like the sync ones"""
+
+    RECIPES = 5
+    INGREDIENTS = 3
+    IMAGES = 2
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Image.objects.filter(pk=cls.image.pk).update(data=b"0123456789" * 100, size=1000, sha256="abc")
+
+    async def fetch(self, path, **kwargs):
+        with override_settings(ROOT_URLCONF="mainapp.urls_async"):
+            response = await self.async_client.get(path, **kwargs)
+        if response.streaming:
+            return response, b"".join([chunk async for chunk in response.streaming_content])
+        return response, response.content
+
+    def fetch_sync(self, path, **kwargs):
+        response = self.client.get(path, **kwargs)
+        return response, b"".join(response.streaming_content) if response.streaming else response.content
+
+    async def assertSameResponse(self, path, **headers):
+        expected, expected_body = await sync_to_async(self.fetch_sync)(path, headers=headers)
+        response, body = await self.fetch(path, headers=headers)
+        self.assertEqual(response.status_code, expected.status_code, path)
+        self.assertEqual(body, expected_body, path)
+        for header in ("Content-Type", "ETag", "Cache-Control", "Content-Range", "Content-Encoding"):
+            self.assertEqual(response.get(header), expected.get(header), f"{path} {header}")
+
+    async def test_reads_match_sync_handlers(self):
+        recipe, ingredient, image = self.recipe.pk, self.ingredient.pk, self.image.pk
+        for path in [
+            "/api/recipes/", "/api/recipes/?page=2&page_size=2&sort=-rating", "/api/recipes/?mode=cursor&page_size=2",
+            "/api/recipes/?facets=true&diet_type=1", f"/api/recipes/{recipe}", "/api/recipes/0",
+            "/api/recipes/search?q=tomato", "/api/recipes/pantry?have=tomato&max_missing=2",
+            "/api/recipes/export", "/api/recipes/export?gzip=true&chunk_size=2",
+            "/api/recipes/?fields=id,name&include=images", f"/api/recipes/{recipe}?include=ingredients",
+            "/api/recipes/search?q=tomato&fields=name", "/api/recipes/export?fields=name,rating&chunk_size=2",
+            f"/api/recipes/batch?ids={recipe},0", f"/api/recipes/batch?ids={recipe}&fields=name&include=images",
+            f"/api/ingredients/batch?ids=0,{ingredient}", f"/api/images/batch?ids={image}",
+            f"/api/recipes/{recipe}/images", f"/api/recipes/{recipe}/ingredients",
+            f"/api/ingredients/?recipe_id={recipe}", f"/api/ingredients/{ingredient}",
+            "/api/images/", f"/api/images/{image}", f"/api/images/{image}/raw/", f"/api/images/{image}/base64/",
+            f"/api/images/recipes/{recipe}/images/", f"/api/images/{image}/v/123.gif",
+            "/api/recipes/?mode=pages", "/api/recipes/?fields=nope", "/api/recipes/export?sort=nope",
+        ]:
+            await self.assertSameResponse(path)
+        await self.assertSameResponse(f"/api/images/{image}/raw/", Range="bytes=10-19")
+        # Multipart boundaries are random, so only the shape is compared
+        response, body = await self.fetch(f"/api/images/{image}/raw/", headers={"Range": "bytes=0-4,-5"})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(len(body), int(response["Content-Length"]))
+        self.assertIn(b"Content-Range: bytes 995-999/1000\r\n\r\n56789", body)
+
+    async def test_conditional_get(self):
+        response, _ = await self.fetch(f"/api/recipes/{self.recipe.pk}")
+        response, _ = await self.fetch(f"/api/recipes/{self.recipe.pk}", headers={"If-None-Match": response["ETag"]})
+        self.assertEqual(response.status_code, 304)
+
+    async def test_pantry_matching_runs_off_the_event_loop(self):
+        match = pantry_index.match
+        threads = []
+
+        def recording_match(*args):
+            threads.append(threading.current_thread())
+            return match(*args)
+
+        with mock.patch.object(pantry_index, "match", recording_match):
+            response, _ = await self.fetch("/api/recipes/pantry?have=tomato")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(threads), 1)
+        self.assertIsNot(threads[0], threading.current_thread())
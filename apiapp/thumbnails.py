@@ -0,0 +1,115 @@
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import metrics, storage
+from .models import THUMBNAIL_FAILED, THUMBNAIL_NONE, THUMBNAIL_READY, Image, ThumbnailJob
+from .signals import touch_recipes
+from .utils.imaging import THUMBNAIL_SIZE, make_thumbnail
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = getattr(settings, "THUMBNAIL_MAX_ATTEMPTS", 3)
+
+
+def queue_enabled() -> bool:
+    """With the queue disabled (e.g. local dev without a worker) thumbnails are rendered inline"""
+    return getattr(settings, "THUMBNAIL_QUEUE_ENABLED", True)
+
+
+def enqueue_thumbnail(img: Image) -> ThumbnailJob:
+    """Queue a job for an image saved with thumbnail_status=pending, inside the same transaction"""
+    return ThumbnailJob.objects.create(image=img)
+
+
+def claim_jobs(limit: int) -> list[ThumbnailJob]:
+    """Atomically move up to `limit` queued jobs to running; concurrent workers never get the same job"""
+    claimed_at = timezone.now()
+    with transaction.atomic():
+        queued = ThumbnailJob.objects.filter(status=ThumbnailJob.QUEUED).order_by("created_at")
+        if connection.features.has_select_for_update_skip_locked:
+            queued = queued.select_for_update(skip_locked=True)
+        ids = list(queued.values_list("id", flat=True)[:limit])
+        # The status guard keeps this safe on backends without SKIP LOCKED as well
+        ThumbnailJob.objects.filter(id__in=ids, status=ThumbnailJob.QUEUED).update(
+            status=ThumbnailJob.RUNNING, started_at=claimed_at, attempts=F("attempts") + 1
+        )
+    return list(ThumbnailJob.objects.filter(id__in=ids, status=ThumbnailJob.RUNNING, started_at=claimed_at))
+
+
+def requeue_stale(older_than: timedelta) -> int:
+    """Jobs left running by a crashed worker go back to the queue"""
+    cutoff = timezone.now() - older_than
+    return ThumbnailJob.objects.filter(status=ThumbnailJob.RUNNING, started_at__lt=cutoff).update(
+        status=ThumbnailJob.QUEUED
+    )
+
+
+def load_source(job: ThumbnailJob):
+    """A file path for filesystem blobs (pool workers read it themselves), bytes otherwise"""
+    img = Image.objects.metadata().filter(pk=job.image_id).first()
+    if img is None or not img.has_data:
+        return None
+    return img.blob_source("data")
+
+
+def skip_job(job: ThumbnailJob) -> None:
+    """The image was deleted or has no bytes; nothing to render"""
+    ThumbnailJob.objects.filter(pk=job.pk).update(status=ThumbnailJob.DONE, finished_at=timezone.now())
+    set_status(job.image_id, THUMBNAIL_NONE)
+
+
+def complete_job(job: ThumbnailJob, thumb_bytes: bytes, content_type: str) -> None:
+    # The thumbnail may share its blob with another image's; written under the blob lock
+    with storage.blob_lock(storage.sha256_hex(thumb_bytes)), transaction.atomic():
+        img = Image.objects.metadata().filter(pk=job.image_id).first()
+        if img is not None:
+            img.set_blob("thumbnail", thumb_bytes)
+            img.thumbnail_content_type = content_type
+            img.thumbnail_status = THUMBNAIL_READY
+            img.save(update_fields=[
+                "thumbnail", "thumbnail_sha256", "has_thumbnail", "thumbnail_content_type", "thumbnail_status",
+            ])
+        ThumbnailJob.objects.filter(pk=job.pk).update(status=ThumbnailJob.DONE, finished_at=timezone.now())
+
+
+def fail_job(job: ThumbnailJob, exc: BaseException) -> None:
+    """Retry until MAX_ATTEMPTS, then give up and mark the image failed"""
+    logger.warning("Thumbnail job %s for image %s failed (attempt %s): %s", job.pk, job.image_id, job.attempts, exc)
+    final = job.attempts >= MAX_ATTEMPTS
+    with transaction.atomic():
+        ThumbnailJob.objects.filter(pk=job.pk).update(
+            status=ThumbnailJob.FAILED if final else ThumbnailJob.QUEUED,
+            last_error=str(exc)[:2000],
+            finished_at=timezone.now() if final else None,
+        )
+        if final:
+            set_status(job.image_id, THUMBNAIL_FAILED)
+
+
+def set_status(image_id: int, status: str) -> None:
+    recipe_id = Image.objects.filter(pk=image_id).values_list("recipe_id", flat=True).first()
+    if recipe_id is not None:
+        Image.objects.filter(pk=image_id).update(thumbnail_status=status)
+        touch_recipes(recipe_id)
+
+
+def attach_thumbnail(img: Image) -> None:
+    """Synchronous fallback used when the queue is disabled; the caller saves the image"""
+    started = time.perf_counter()
+    try:
+        thumb_bytes, content_type = make_thumbnail(img.blob_source("data"), size=THUMBNAIL_SIZE)
+    except Exception as e:
+        metrics.observe_thumbnail(time.perf_counter() - started, "error")
+        logger.warning("Thumbnail generation failed for %s: %s", img.filename, e)
+        img.thumbnail_status = THUMBNAIL_FAILED
+        return
+    metrics.observe_thumbnail(time.perf_counter() - started)
+    img.set_blob("thumbnail", thumb_bytes)
+    img.thumbnail_content_type = content_type
+    img.thumbnail_status = THUMBNAIL_READY
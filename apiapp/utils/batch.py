@@ -0,0 +1,34 @@
+from django.conf import settings
+
+# Batch lookups: GET .../batch?ids=3,1,2 answers several ids with one id__in query
+MAX_BATCH_SIZE = getattr(settings, "API_MAX_BATCH_SIZE", 100)
+
+
+class BatchError(ValueError):
+    """Raised for a malformed, empty or oversized ?ids= list"""
+
+
+def parse_ids(values) -> list[int]:
+    """?ids=3,1&ids=2 -> [3, 1, 2]; repeated ids are answered once, at their first position"""
+    ids = {}
+    for value in values:
+        for part in value.split(","):
+            part = part.strip()
+            if not part:
+                continue
+            if not (part.isascii() and part.isdigit()):
+                raise BatchError(f"Invalid id '{part}'")
+            ids[int(part)] = None
+            if len(ids) > MAX_BATCH_SIZE:
+                raise BatchError(f"At most {MAX_BATCH_SIZE} ids per request")
+    if not ids:
+        raise BatchError("ids must list at least one id")
+    return list(ids)
+
+
+def in_request_order(ids: list[int], found: dict) -> dict:
+    """The batch response body: items in request order, with a not-found marker for missing ids"""
+    return {
+        "items": [found[pk] if pk in found else {"id": pk, "error": "Not found"} for pk in ids],
+        "missing": [pk for pk in ids if pk not in found],
+    }
@@ -0,0 +1,211 @@
+import asyncio
+import hashlib
+import io
+import uuid
+
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+
+# Blob URLs are content-addressed per image id, so their bytes never change
+IMMUTABLE = "public, max-age=31536000, immutable"
+# JSON documents may change at any time; clients keep them but must revalidate
+REVALIDATE = "no-cache"
+
+CHUNK_SIZE = 64 * 1024
+# More ranges than this in one request is treated as abuse and answered with the full body
+MAX_RANGES = 16
+
+
+def weak_etag(*parts) -> str:
+    digest = hashlib.md5("|".join(str(p) for p in parts).encode()).hexdigest()
+    return f'W/"{digest}"'
+
+
+def strong_etag(value: str) -> str:
+    return quote_etag(value)
+
+
+def set_cache_headers(response, etag=None, last_modified=None, cache_control=REVALIDATE):
+    if etag:
+        response["ETag"] = etag
+    if last_modified is not None:
+        response["Last-Modified"] = http_date(last_modified.timestamp())
+    if cache_control:
+        response["Cache-Control"] = cache_control
+    return response
+
+
+def not_modified(request, etag=None, last_modified=None, cache_control=REVALIDATE):
+    """
+    Return a 304 (or 412) response if the request's validators match, else None.
+    Call it before loading anything expensive.
+    """
+    response = get_conditional_response(
+        request,
+        etag=etag,
+        last_modified=int(last_modified.timestamp()) if last_modified is not None else None,
+    )
+    if response is not None:
+        set_cache_headers(response, etag, last_modified, cache_control)
+    return response
+
+
+def parse_range_header(header: str, size: int):
+    """
+    Parse "bytes=0-99,200-,-50" into inclusive (start, end) pairs.
+    Returns None when the header should be ignored (bad syntax, other unit, too many ranges)
+    and [] when it is well formed but nothing is satisfiable.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or not spec:
+        return None
+    parts = spec.split(",")
+    if len(parts) > MAX_RANGES:
+        return None
+
+    ranges = []
+    for part in parts:
+        first, sep, last = part.strip().partition("-")
+        # Plain ASCII digits only: int() would also take "+5", " 5", "1_0" and other scripts' digits
+        if not sep or not all(bound == "" or (bound.isascii() and bound.isdigit()) for bound in (first, last)):
+            return None
+        if first == "":
+            if last == "":
+                return None
+            # Suffix range: the last N bytes
+            length = int(last)
+            if length <= 0:
+                continue
+            start, end = max(size - length, 0), size - 1
+        else:
+            start = int(first)
+            end = int(last) if last else None
+            if end is not None and start > end:
+                return None
+            end = size - 1 if end is None else min(end, size - 1)
+        if start < size:
+            ranges.append((start, end))
+    return ranges
+
+
+def if_range_matches(request, etag, last_modified) -> bool:
+    """A Range request is honoured only if If-Range (when sent) still names the current representation"""
+    value = request.headers.get("If-Range")
+    if not value:
+        return True
+    value = value.strip()
+    if value.startswith(('"', 'W/')):
+        # Weak validators never match If-Range
+        return bool(etag) and not etag.startswith("W/") and value == etag
+    since = parse_http_date_safe(value)
+    return since is not None and last_modified is not None and since == int(last_modified.timestamp())
+
+
+def iter_file_range(fh, start: int, end: int, close: bool = True):
+    try:
+        fh.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = fh.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        if close:
+            fh.close()
+
+
+async def aread(fh, size: int = -1) -> bytes:
+    """fh.read() that keeps disk reads off the event loop; in-memory blobs are read in place"""
+    if isinstance(fh, io.BytesIO):
+        return fh.read(size)
+    return await asyncio.to_thread(fh.read, size)
+
+
+async def aiter_file_range(fh, start: int, end: int, close: bool = True):
+    """iter_file_range() as an async iterator, which ASGI streams without a thread per response"""
+    try:
+        fh.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await aread(fh, min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        if close:
+            fh.close()
+
+
+def ranged_response(request, fh, content_type, etag=None, last_modified=None, cache_control=REVALIDATE,
+                    asynchronous=False):
+    """
+    Serve a seekable binary file with Range/If-Range support:
+    200 for the whole body, 206 for one or more ranges (multipart/byteranges), 416 when unsatisfiable.
+    Bytes are read from the file chunk by chunk; nothing is materialized. With `asynchronous`
+    the body is an async iterator (for async views under ASGI) instead of a file wrapper.
+    """
+    iter_range = aiter_file_range if asynchronous else iter_file_range
+    fh.seek(0, 2)
+    size = fh.tell()
+    fh.seek(0)
+
+    header = request.headers.get("Range")
+    ranges = None
+    if header and request.method in ("GET", "HEAD") and if_range_matches(request, etag, last_modified):
+        ranges = parse_range_header(header, size)
+
+    if ranges is None and asynchronous:
+        response = StreamingHttpResponse(iter_range(fh, 0, size - 1), content_type=content_type)
+        response["Content-Length"] = str(size)
+    elif ranges is None:
+        response = FileResponse(fh, content_type=content_type)
+    elif not ranges:
+        fh.close()
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{size}"
+    elif len(ranges) == 1:
+        start, end = ranges[0]
+        response = StreamingHttpResponse(iter_range(fh, start, end), status=206, content_type=content_type)
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+        response["Content-Length"] = str(end - start + 1)
+    else:
+        boundary = uuid.uuid4().hex
+        heads = [
+            (f"--{boundary}\r\nContent-Type: {content_type}\r\n"
+             f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n").encode()
+            for start, end in ranges
+        ]
+        tail = f"\r\n--{boundary}--\r\n".encode()
+
+        def multipart():
+            try:
+                for i, (start, end) in enumerate(ranges):
+                    yield (b"\r\n" if i else b"") + heads[i]
+                    yield from iter_file_range(fh, start, end, close=False)
+                yield tail
+            finally:
+                fh.close()
+
+        async def amultipart():
+            try:
+                for i, (start, end) in enumerate(ranges):
+                    yield (b"\r\n" if i else b"") + heads[i]
+                    async for chunk in aiter_file_range(fh, start, end, close=False):
+                        yield chunk
+                yield tail
+            finally:
+                fh.close()
+
+        length = sum(len(h) for h in heads) + 2 * (len(ranges) - 1) + len(tail)
+        length += sum(end - start + 1 for start, end in ranges)
+        response = StreamingHttpResponse(
+            amultipart() if asynchronous else multipart(), status=206, content_type=f"multipart/byteranges; boundary={boundary}"
+        )
+        response["Content-Length"] = str(length)
+
+    response["Accept-Ranges"] = "bytes"
+    return set_cache_headers(response, etag, last_modified, cache_control)
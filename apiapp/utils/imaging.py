@@ -0,0 +1,91 @@
+import asyncio
+import io
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image as PILImage
+
+# Size of the stored thumbnail served at /images/{id}/thumb/
+THUMBNAIL_SIZE = (400, 400)
+# Formats accepted on upload, by PIL format name
+UPLOAD_FORMATS = {"JPEG", "PNG", "WEBP", "GIF"}
+# Anything with more pixels than this is refused before decoding (decompression bombs)
+MAX_PIXELS = 40_000_000
+
+
+# PIL work from async views: one thread per core, so a burst of renders queues up instead of
+# oversubscribing the CPU (Pillow releases the GIL while decoding, resizing and encoding)
+executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix="imaging")
+
+
+class UnsupportedImage(ValueError):
+    pass
+
+
+async def offload(fn, *args):
+    """Run an imaging function on the executor without blocking the event loop"""
+    return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+
+
+def open_image(source):
+    """source is bytes, a path or a binary file object; PIL only reads the header at this point"""
+    return PILImage.open(io.BytesIO(source) if isinstance(source, (bytes, bytearray, memoryview)) else source)
+
+
+def sniff_image(fileobj, max_pixels=MAX_PIXELS):
+    """Validate format and dimensions from the header alone; return (content_type, width, height)"""
+    try:
+        img = PILImage.open(fileobj)
+        fmt, (width, height) = img.format, img.size
+    except PILImage.DecompressionBombError:
+        raise UnsupportedImage("Image dimensions too large")
+    except Exception:
+        raise UnsupportedImage("File is not a supported image")
+    finally:
+        fileobj.seek(0)
+    if fmt not in UPLOAD_FORMATS:
+        raise UnsupportedImage(f"Unsupported image format {fmt}")
+    if width * height > max_pixels:
+        raise UnsupportedImage("Image dimensions too large")
+    return PILImage.MIME[fmt], width, height
+
+
+def make_thumbnail(image_bytes, size=(300, 300), fmt="JPEG"):
+    """Return thumbnail bytes and content_type; image_bytes may also be a path or file object"""
+    img = open_image(image_bytes)
+    # thumbnail() lets JPEGs decode at a reduced scale via draft(), so the full bitmap is never built
+    img.thumbnail(size, reducing_gap=2.0)
+    if fmt == "JPEG" and img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+    out = io.BytesIO()
+    img.save(out, fmt)
+    return out.getvalue(), f"image/{fmt.lower()}"
+
+
+def timed_thumbnail(image_bytes, size=(300, 300), fmt="JPEG"):
+    """make_thumbnail plus its render time in seconds, for pool processes reporting back to the worker"""
+    started = time.perf_counter()
+    content, content_type = make_thumbnail(image_bytes, size, fmt)
+    return content, content_type, time.perf_counter() - started
+
+
+# Whitelisted output formats for /images/{id}/v/{width}.{fmt}
+VARIANT_FORMATS = {"webp": "WEBP", "jpeg": "JPEG", "png": "PNG"}
+
+
+def make_variant(image_bytes, width, fmt):
+    """Resize to `width` (never upscaling), keeping the aspect ratio; return bytes and content_type"""
+    img = open_image(image_bytes)
+    if img.width > width:
+        height = max(1, round(img.height * width / img.width))
+        # JPEG: decode at the smallest DCT scale that is still >= 2x the target
+        img.draft(None, (width * 2, height * 2))
+        img = img.resize((width, height), PILImage.LANCZOS, reducing_gap=2.0)
+    pil_format = VARIANT_FORMATS[fmt]
+    if pil_format == "JPEG" and img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+    out = io.BytesIO()
+    options = {"optimize": True} if pil_format == "PNG" else {"quality": 82}
+    img.save(out, pil_format, **options)
+    return out.getvalue(), f"image/{fmt}"
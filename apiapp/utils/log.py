@@ -0,0 +1,163 @@
+"""
+Logging that keeps I/O off request threads: BackgroundHandler only enqueues, and a QueueListener
+thread renders JSON lines to a size-rotated file (and the console). Configured in settings.LOGGING.
+"""
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+# Set per request by apiapp.middleware.RequestIdMiddleware and stamped on every record it logs
+request_id = contextvars.ContextVar("request_id", default=None)
+
+# LogRecord attributes that are not `extra=` fields
+RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id"}
+plain = logging.Formatter()
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, request id, then any extra fields"""
+
+    def format(self, record):
+        document = {
+            "time": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            document["request_id"] = record.request_id
+        for key, value in vars(record).items():
+            if key not in RESERVED and not key.startswith("_"):
+                document[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            document["exception"] = record.exc_text
+        if record.stack_info:
+            document["stack"] = record.stack_info
+        return json.dumps(document, default=str)
+
+
+class BackgroundHandler(logging.handlers.QueueHandler):
+    """
+    Puts records on a bounded queue and returns; the listener thread does the formatting and
+    writing. When the queue is full the record is dropped (and counted on the next one written)
+    rather than making the request wait for the disk.
+
+    dictConfig on Python < 3.12 cannot hand other configured handlers to a QueueHandler, so this
+    one builds its targets itself.
+    """
+
+    def __init__(self, filename=None, max_bytes=10 * 1024 * 1024, backup_count=5, console=True,
+                 queue_size=10000):
+        super().__init__(queue.Queue(queue_size))
+        formatter = JsonFormatter()
+        targets = []
+        if filename:
+            targets.append(logging.handlers.RotatingFileHandler(
+                filename, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8", delay=True))
+        if console:
+            targets.append(logging.StreamHandler(sys.stderr))
+        for target in targets:
+            target.setFormatter(formatter)
+        self.dropped = 0
+        self.dropped_lock = threading.Lock()
+        self.listener = logging.handlers.QueueListener(self.queue, *targets, respect_handler_level=True)
+        self.listener.start()
+        self.running = True
+        atexit.register(self.stop)
+
+    def prepare(self, record):
+        """
+        Runs on the thread that logs: merges the arguments and renders the traceback while they
+        are still valid, and picks up the request id from that thread's context.
+        """
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = plain.formatException(record.exc_info)
+            record.exc_info = None
+        # django.request logs a response after the middleware has returned, but passes the request
+        request = getattr(record, "request", None)
+        if not hasattr(record, "request_id"):
+            record.request_id = request_id.get() or getattr(request, "request_id", None)
+        if request is not None and hasattr(request, "method"):
+            record.request = f"{request.method} {request.get_full_path()}"
+        return record
+
+    def enqueue(self, record):
+        try:
+            if self.dropped:
+                with self.dropped_lock:
+                    record.dropped, self.dropped = self.dropped, 0
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self.dropped_lock:
+                self.dropped += 1 + getattr(record, "dropped", 0)
+
+    def stop(self) -> None:
+        """Writes out what is still queued; also run at exit"""
+        if self.running:
+            self.running = False
+            self.listener.stop()
+
+    def close(self):
+        self.stop()
+        for target in self.listener.handlers:
+            target.close()
+        super().close()
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets through at most `burst` records of one warning per logger every `seconds`. A warning is
+    its rendered message, so only real repeats are limited, not every record sharing a template
+    like error()'s; other levels always pass. The first record of the next window carries how
+    many were suppressed.
+    """
+
+    # Windows kept before expired ones are dropped; rendered messages are not a bounded set
+    MAX_WINDOWS = 10_000
+
+    def __init__(self, burst=20, seconds=60.0, level=logging.WARNING):
+        super().__init__()
+        self.burst = burst
+        self.seconds = seconds
+        self.level = level
+        self.windows = {}  # (logger, message hash) -> [window start, passed, suppressed]
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno != self.level:
+            return True
+        key = (record.name, hash(record.getMessage()))
+        now = time.monotonic()
+        with self.lock:
+            window = self.windows.get(key)
+            if window is None or now - window[0] >= self.seconds:
+                suppressed = window[2] if window else 0
+                if window is None and len(self.windows) >= self.MAX_WINDOWS:
+                    self.prune(now)
+                self.windows[key] = [now, 1, 0]
+                if suppressed:
+                    record.suppressed = suppressed
+                return True
+            if window[1] < self.burst:
+                window[1] += 1
+                return True
+            window[2] += 1
+            return False
+
+    def prune(self, now: float) -> None:
+        self.windows = {key: w for key, w in self.windows.items() if now - w[0] < self.seconds}
+        if len(self.windows) >= self.MAX_WINDOWS:
+            # A flood of distinct warnings within one window: start over rather than grow
+            self.windows.clear()
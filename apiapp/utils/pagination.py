@@ -0,0 +1,166 @@
+import base64
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+
+MAX_PAGE_SIZE = getattr(settings, "API_MAX_PAGE_SIZE", 100)
+MAX_OFFSET = getattr(settings, "API_MAX_OFFSET", 10_000)
+COUNT_CACHE_SECONDS = getattr(settings, "API_COUNT_CACHE_SECONDS", 60)
+
+
+class PaginationError(ValueError):
+    """Raised for a bad page, page size, sort key or cursor"""
+
+
+def clamp_page_size(page_size: int) -> int:
+    if page_size < 1:
+        raise PaginationError("page_size must be >= 1")
+    return min(page_size, MAX_PAGE_SIZE)
+
+
+def parse_sort(sort: str, allowed) -> tuple[str, bool]:
+    """Split "-field" into ("field", descending) and check it against the whitelist"""
+    field = sort.lstrip("-")
+    if field not in allowed:
+        raise PaginationError(f"Unsupported sort key '{sort}'. Allowed: {', '.join(sorted(allowed))}")
+    return field, sort.startswith("-")
+
+
+def encode_cursor(sort: str, key, pk: int, direction: str) -> str:
+    raw = json.dumps({"s": sort, "k": key, "i": pk, "d": direction}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str) -> dict:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if payload["d"] not in ("n", "p") or not isinstance(payload["i"], int):
+            raise ValueError
+    except Exception:
+        raise PaginationError("Invalid cursor")
+    if payload["s"] != sort:
+        raise PaginationError("Cursor was issued for a different sort order")
+    return payload
+
+
+def count_key(queryset) -> str:
+    return "count:" + hashlib.md5(str(queryset.query).encode()).hexdigest()
+
+
+def cached_count(queryset) -> int:
+    """COUNT(*) for a queryset, cached briefly so large tables are not counted on every page"""
+    return cache.get_or_set(count_key(queryset), queryset.count, COUNT_CACHE_SECONDS)
+
+
+async def acached_count(queryset) -> int:
+    key = count_key(queryset)
+    total = await cache.aget(key)
+    if total is None:
+        total = await queryset.acount()
+        await cache.aset(key, total, COUNT_CACHE_SECONDS)
+    return total
+
+
+def offset_bounds(page: int, page_size: int) -> tuple[int, int]:
+    """(clamped page size, first row), bounded by MAX_OFFSET"""
+    page_size = clamp_page_size(page_size)
+    if page < 1:
+        raise PaginationError("page must be >= 1")
+    start = (page - 1) * page_size
+    if start > MAX_OFFSET:
+        raise PaginationError(f"Offset too large (max {MAX_OFFSET}); use cursor pagination instead")
+    return page_size, start
+
+
+def offset_result(rows: list, total: int | None, page: int, page_size: int) -> dict:
+    return {
+        "rows": rows[:page_size],
+        "total": total,
+        "page": page,
+        "page_size": page_size,
+        "total_pages": (total + page_size - 1) // page_size if total is not None else None,
+        "has_next": len(rows) > page_size,
+    }
+
+
+def offset_page(queryset, page: int, page_size: int, include_total: bool = True) -> dict:
+    """Classic page/page_size slicing, bounded by MAX_OFFSET; only the requested rows are fetched"""
+    page_size, start = offset_bounds(page, page_size)
+    rows = list(queryset[start:start + page_size + 1])
+    total = cached_count(queryset) if include_total else None
+    return offset_result(rows, total, page, page_size)
+
+
+async def aoffset_page(queryset, page: int, page_size: int, include_total: bool = True) -> dict:
+    page_size, start = offset_bounds(page, page_size)
+    rows = [row async for row in queryset[start:start + page_size + 1]]
+    total = await acached_count(queryset) if include_total else None
+    return offset_result(rows, total, page, page_size)
+
+
+class KeysetQuery:
+    """
+    Keyset (seek) pagination over (sort_key, id). Each page is a single indexed range scan,
+    so the cost does not depend on how deep into the table the client is.
+    """
+
+    def __init__(self, queryset, sort: str, allowed, page_size: int, cursor: str | None = None):
+        self.sort = sort
+        self.page_size = clamp_page_size(page_size)
+        self.field, descending = parse_sort(sort, allowed)
+        state = decode_cursor(cursor, sort) if cursor else None
+        self.first_page = state is None
+        self.backwards = state is not None and state["d"] == "p"
+
+        # Walking backwards is the same scan with the ordering flipped
+        desc = descending != self.backwards
+        field = self.field
+        qs = queryset.order_by(*([f"-{field}", "-id"] if desc else [field, "id"]))
+        if state is not None:
+            op = "lt" if desc else "gt"
+            if field == "id":
+                qs = qs.filter(**{f"id__{op}": state["i"]})
+            else:
+                qs = qs.filter(
+                    Q(**{f"{field}__{op}": state["k"]}) | Q(**{field: state["k"], f"id__{op}": state["i"]})
+                )
+        # One extra row tells whether there is another page in the walking direction
+        self.rows = qs[:self.page_size + 1]
+
+    def cursor_for(self, row, direction: str) -> str:
+        # Rows may be model instances or .values() dicts
+        if isinstance(row, dict):
+            return encode_cursor(self.sort, row[self.field], row["id"], direction)
+        return encode_cursor(self.sort, getattr(row, self.field), row.id, direction)
+
+    def result(self, rows: list, total: int | None) -> dict:
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if self.backwards:
+            rows.reverse()
+        has_next = has_more if not self.backwards else True
+        has_prev = (not self.first_page) if not self.backwards else has_more
+        return {
+            "rows": rows,
+            "page_size": self.page_size,
+            "next": self.cursor_for(rows[-1], "n") if rows and has_next else None,
+            "prev": self.cursor_for(rows[0], "p") if rows and has_prev else None,
+            "total": total,
+        }
+
+
+def keyset_page(queryset, sort: str, allowed, page_size: int, cursor: str | None = None,
+                include_total: bool = False) -> dict:
+    page = KeysetQuery(queryset, sort, allowed, page_size, cursor)
+    return page.result(list(page.rows), cached_count(queryset) if include_total else None)
+
+
+async def akeyset_page(queryset, sort: str, allowed, page_size: int, cursor: str | None = None,
+                       include_total: bool = False) -> dict:
+    page = KeysetQuery(queryset, sort, allowed, page_size, cursor)
+    rows = [row async for row in page.rows]
+    return page.result(rows, await acached_count(queryset) if include_total else None)
@@ -0,0 +1,60 @@
+import json
+import re
+
+from django.http import HttpResponse
+from ninja.renderers import BaseRenderer
+from ninja.responses import NinjaJSONEncoder
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:  # optional; falls back to the stdlib encoder Ninja uses
+    orjson = None
+
+_fallback_encoder = NinjaJSONEncoder()
+
+
+class RawJSON(bytes):
+    """Already-rendered JSON (e.g. a stored recipe document); dumps() splices it in unchanged"""
+
+
+# What dumps() writes in place of a RawJSON before splicing; a NUL cannot come from a text column
+RAW_PLACEHOLDER = re.compile(rb'"\\u0000raw(\d+)"')
+
+
+def _default(obj):
+    """Types orjson does not know natively (pydantic models, Decimal, ...)"""
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    return _fallback_encoder.default(obj)
+
+
+def dumps(data) -> bytes:
+    raw = []
+
+    def default(obj):
+        if isinstance(obj, RawJSON):
+            raw.append(obj)
+            return f"\x00raw{len(raw) - 1}"
+        return _default(obj)
+
+    if orjson is not None:
+        rendered = orjson.dumps(data, default=default, option=orjson.OPT_NON_STR_KEYS)
+    else:
+        rendered = json.dumps(data, cls=NinjaJSONEncoder, default=default).encode()
+    if raw:
+        rendered = RAW_PLACEHOLDER.sub(lambda match: raw[int(match[1])], rendered)
+    return rendered
+
+
+def json_response(data, status: int = 200) -> HttpResponse:
+    """Body already rendered to bytes; Ninja passes HttpResponse objects through untouched"""
+    return HttpResponse(dumps(data), status=status, content_type="application/json")
+
+
+class ORJSONRenderer(BaseRenderer):
+    """Registered on the NinjaAPI for everything that is not returned as a ready HttpResponse"""
+    media_type = "application/json"
+
+    def render(self, request, data, *, response_status):
+        return dumps(data)
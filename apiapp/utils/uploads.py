@@ -0,0 +1,50 @@
+from django.conf import settings
+from django.core.files.uploadhandler import FileUploadHandler
+
+MAX_UPLOAD_BYTES = getattr(settings, "IMAGE_MAX_UPLOAD_BYTES", 2 * 1024 * 1024)
+# Allowance for multipart boundaries and part headers when judging Content-Length
+MULTIPART_SLACK = 64 * 1024
+
+
+class MaxSizeUploadHandler(FileUploadHandler):
+    """
+    First handler in FILE_UPLOAD_HANDLERS. Once a request or file is known to be over
+    MAX_UPLOAD_BYTES it swallows the remaining chunks, so later handlers never buffer them,
+    and flags the request so the view can answer 413.
+    """
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        self.file_bytes = 0
+        if content_length and content_length > MAX_UPLOAD_BYTES + MULTIPART_SLACK:
+            self.request.upload_too_large = True
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.file_bytes = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        if getattr(self.request, "upload_too_large", False):
+            return None
+        self.file_bytes += len(raw_data)
+        if self.file_bytes > MAX_UPLOAD_BYTES:
+            self.request.upload_too_large = True
+            return None
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
+
+
+def is_too_large(request, file) -> bool:
+    return getattr(request, "upload_too_large", False) or (file.size or 0) > MAX_UPLOAD_BYTES
+
+
+def bounded_chunks(file, limit: int = MAX_UPLOAD_BYTES):
+    """Yield the upload chunk by chunk, refusing to go past `limit` bytes"""
+    seen = 0
+    file.seek(0)
+    for chunk in file.chunks():
+        seen += len(chunk)
+        if seen > limit:
+            raise ValueError("File too large")
+        yield chunk
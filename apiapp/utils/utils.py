@@ -1,18 +1,19 @@
 import logging
-from ninja.responses import Response
-from ..schemas.responses import APIError, APISuccess
+from django.http import HttpResponse
+from ..schemas.responses import APIError
+from .renderers import json_response
 
 logger = logging.getLogger(__name__)
 
-def success(data, status_code: int = 200) -> Response:
-    """Uniform success response"""
-    return Response(APISuccess(status="success",data= data), status=status_code)
+def success(data, status_code: int = 200) -> HttpResponse:
+    """Uniform success response (the APISuccess envelope), rendered to bytes in one pass"""
+    return json_response({"status": "success", "data": data}, status_code)
 
-def error(message: str, status_code: int = 400, *, code: int | None = None, details=None, exc: Exception | None = None) -> Response:
+def error(message: str, status_code: int = 400, *, code: int | None = None, details=None, exc: Exception | None = None) -> HttpResponse:
     """Uniform error response with logging"""
     if exc:
         logger.exception("API Error: %s", message, exc_info=exc)
     else:
         logger.warning("API Warning: %s | Details: %s", message, details)
 
-    return Response(APIError(message=message, code=code, details=details).dict(),status=status_code)
\ No newline at end of file
+    return json_response(APIError(message=message, code=code, details=details).dict(), status_code)
\ No newline at end of file
@@ -0,0 +1,103 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, router, transaction
+
+from . import storage
+from .models import Image, ImageVariant
+from .utils.imaging import VARIANT_FORMATS, make_variant, offload
+from .utils.lru import ByteLRUCache
+
+VARIANT_WIDTHS = tuple(getattr(settings, "IMAGE_VARIANT_WIDTHS", (160, 320, 640, 960, 1280)))
+# Format advertised in ImageRead.srcset
+SRCSET_FORMAT = "webp"
+
+# Hot variants stay in process memory: key (image_id, width, fmt) -> (bytes, (content_type, sha256))
+variant_cache = ByteLRUCache(getattr(settings, "IMAGE_VARIANT_CACHE_BYTES", 32 * 1024 * 1024))
+
+
+def is_allowed(width: int, fmt: str) -> bool:
+    return width in VARIANT_WIDTHS and fmt in VARIANT_FORMATS
+
+
+def srcset(base_url, image_id: int, original_width: int | None = None) -> str:
+    """Variants are never upscaled, so widths beyond the original are left out"""
+    widths = [w for w in VARIANT_WIDTHS if original_width is None or w <= original_width] or [VARIANT_WIDTHS[0]]
+    return ", ".join(
+        f"{base_url(f'/api/images/{image_id}/v/{w}.{SRCSET_FORMAT}')} {w}w" for w in widths
+    )
+
+
+def get_variant(image_id: int, width: int, fmt: str):
+    """
+    Return (bytes, content_type, sha256) for a variant, or None if the image has no bytes.
+    Order of lookup: in-process LRU, persisted ImageVariant row, render from the original.
+    """
+    key = (image_id, width, fmt)
+    cached = variant_cache.get(key)
+    if cached is not None:
+        payload, (content_type, digest) = cached
+        return payload, content_type, digest
+
+    variant = ImageVariant.objects.defer("data").filter(image_id=image_id, width=width, format=fmt).first()
+    if variant is None:
+        variant = render_variant(image_id, width, fmt)
+        if variant is None:
+            return None
+        payload = variant.data if variant.storage == storage.DATABASE else variant.read_blob()
+    else:
+        payload = variant.read_blob()
+    return remember(key, variant, payload)
+
+
+async def aget_variant(image_id: int, width: int, fmt: str):
+    """get_variant() for async views: queries through the async ORM, PIL on the imaging executor"""
+    key = (image_id, width, fmt)
+    cached = variant_cache.get(key)
+    if cached is not None:
+        payload, (content_type, digest) = cached
+        return payload, content_type, digest
+
+    variant = await ImageVariant.objects.defer("data").filter(image_id=image_id, width=width, format=fmt).afirst()
+    if variant is None:
+        img = await Image.objects.metadata().filter(pk=image_id).afirst()
+        if img is None or not img.has_data:
+            return None
+        source = await sync_to_async(img.blob_source)("data")
+        content, content_type = await offload(make_variant, source, width, fmt)
+        variant = await sync_to_async(save_variant)(img, width, fmt, content, content_type)
+        payload = variant.data if variant.storage == storage.DATABASE else await variant.aread_blob()
+    else:
+        payload = await variant.aread_blob()
+    return remember(key, variant, payload)
+
+
+def remember(key, variant: ImageVariant, payload) -> tuple:
+    payload = bytes(payload)
+    variant_cache.set(key, payload, (variant.content_type, variant.sha256))
+    return payload, variant.content_type, variant.sha256
+
+
+def render_variant(image_id: int, width: int, fmt: str):
+    img = Image.objects.metadata().filter(pk=image_id).first()
+    if img is None or not img.has_data:
+        return None
+    content, content_type = make_variant(img.blob_source("data"), width, fmt)
+    return save_variant(img, width, fmt, content, content_type)
+
+
+def save_variant(img: Image, width: int, fmt: str, content: bytes, content_type: str) -> ImageVariant:
+    variant = ImageVariant(image=img, width=width, format=fmt, content_type=content_type, storage=img.storage)
+    # Identical renders share a blob; it is written and referenced under the blob lock
+    digest = storage.sha256_hex(content) if img.storage == storage.FILESYSTEM else None
+    try:
+        with storage.blob_lock(digest), transaction.atomic():
+            variant.set_blob(content)
+            variant.save()
+    except IntegrityError:
+        # Another request rendered it first; keep theirs, read from the primary a replica may lag
+        return ImageVariant.objects.using(router.db_for_write(ImageVariant)).get(image_id=img.pk, width=width, format=fmt)
+    return variant
+
+
+def forget_image(image_id: int) -> None:
+    variant_cache.delete_where(lambda key: key[0] == image_id)
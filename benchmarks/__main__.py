@@ -0,0 +1,40 @@
+"""
+Run the micro-benchmarks and the load driver on one seeded catalog and write a single results file.
+
+    python -m benchmarks [--recipes 2000] [--requests 200] [--concurrency 4] [--output FILE]
+
+The parts can also be run on their own: benchmarks.micro, benchmarks.load, benchmarks.serialization.
+Set DJANGO_SETTINGS_MODULE to benchmark against another database (e.g. a local PostgreSQL);
+a throwaway test database is created and dropped either way.
+"""
+import argparse
+
+from . import load, micro
+from .catalog import seed_catalog
+from .common import benchmark_environment, setup, write_results
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    load.add_arguments(parser)
+    parser.add_argument("--seconds", type=float, default=2.0, help="time spent on each micro-benchmark")
+    parser.add_argument("--page-size", type=int, default=100, help="recipes per page in the micro-benchmarks")
+    parser.add_argument("--output", help="results file (default: benchmarks/results/all-<timestamp>.json)")
+    args = parser.parse_args()
+
+    setup()
+    with benchmark_environment():
+        catalog = seed_catalog(args.recipes, args.ingredients, args.images, args.seed)
+        print("micro-benchmarks")
+        results = {"micro": micro.run(argparse.Namespace(recipes=args.page_size, seconds=args.seconds))}
+        micro.print_results(results["micro"])
+        print("load")
+        results["load"] = load.run(args, catalog)
+        parameters = {k: v for k, v in vars(args).items() if k != "output"}
+        path = write_results("all", parameters, results, args.output)
+    print(f"results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
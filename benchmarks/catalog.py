@@ -0,0 +1,179 @@
+"""
+Seeded synthetic catalog: N recipes with M ingredients each and K images each.
+
+    python -m benchmarks.catalog --recipes 1000 --ingredients 8 [--seed 1] > catalog.ndjson
+
+On the command line it writes RecipeCreate documents as NDJSON, ready for POST /api/recipes/import.
+The benchmarks call seed_catalog(), which also creates image rows and, unless told otherwise,
+real JPEG blobs and thumbnails. The same seed always gives the same catalog.
+"""
+import argparse
+import io
+import random
+import sys
+
+from apiapp.constants import DietType, DifficultyLevel, MealCategory, MealType, MeasurementUnit
+
+INGREDIENTS = {
+    "vegetable": ["tomato", "onion", "garlic", "carrot", "potato", "spinach", "bell pepper", "zucchini",
+                  "mushroom", "broccoli", "cucumber", "eggplant", "leek", "celery", "sweet potato", "kale"],
+    "dairy": ["milk", "butter", "cheddar", "parmesan", "yogurt", "cream", "feta", "mozzarella", "egg"],
+    "pantry": ["flour", "sugar", "rice", "pasta", "olive oil", "soy sauce", "vinegar", "honey", "oats",
+               "lentils", "chickpeas", "coconut milk", "stock", "breadcrumbs", "tomato paste"],
+    "protein": ["chicken breast", "salmon", "tofu", "beef mince", "shrimp", "tempeh", "cod", "black beans"],
+    "spice": ["salt", "black pepper", "paprika", "cumin", "turmeric", "chili flakes", "cinnamon", "oregano",
+              "thyme", "basil", "ginger", "coriander"],
+    "fruit": ["lemon", "lime", "apple", "banana", "mango", "blueberries", "orange", "avocado"],
+}
+ADJECTIVES = ["Quick", "Spicy", "Creamy", "Roasted", "Smoky", "Crispy", "Herby", "Lemony", "Rustic", "Golden"]
+DISHES = ["soup", "salad", "curry", "stew", "bake", "stir-fry", "risotto", "tacos", "pasta", "bowl", "pie", "omelette"]
+SENTENCES = [
+    "A weeknight favourite that comes together with very little washing up.",
+    "Bright, fresh and easy to scale up for a crowd.",
+    "Keeps well in the fridge for up to three days and reheats nicely.",
+    "The kind of comfort food that tastes even better the next day.",
+    "Serve with crusty bread or a simple green salad.",
+    "Swap the protein for whatever you have to hand.",
+]
+STEPS = [
+    "Heat the oil in a large pan over a medium heat.",
+    "Add the onion and cook for 8-10 minutes until soft and golden.",
+    "Stir in the garlic and spices and cook for another minute until fragrant.",
+    "Pour in the stock, bring to a simmer and cook for 20 minutes, stirring now and then.",
+    "Season to taste with salt, pepper and a squeeze of lemon.",
+    "Preheat the oven to 200C and line a baking tray with parchment.",
+    "Whisk the eggs with the milk and a pinch of salt until smooth.",
+    "Fold everything together gently, taking care not to overmix.",
+    "Bake for 25-30 minutes until golden on top and bubbling at the edges.",
+    "Leave to rest for five minutes before slicing and serving.",
+]
+# Typical phone/camera uploads: (width, height)
+IMAGE_SHAPES = [(1200, 800), (1600, 1200), (2048, 1365), (1080, 1080)]
+# Distinct JPEGs rendered per catalog; image rows share them (the filesystem store dedupes by digest)
+IMAGE_POOL_SIZE = 4
+BATCH_SIZE = 1000
+
+
+def recipe_documents(count: int, ingredients: int = 8, seed: int = 0):
+    """RecipeCreate-shaped dicts with realistic text lengths and uniformly drawn enum values"""
+    rng = random.Random(seed)
+    vocabulary = [(category, name) for category, names in INGREDIENTS.items() for name in names]
+    for i in range(count):
+        picks = rng.sample(vocabulary, min(ingredients, len(vocabulary)))
+        # Beyond the vocabulary size, names repeat with a qualifier so every row stays distinct
+        for n in range(ingredients - len(picks)):
+            category, name = rng.choice(vocabulary)
+            picks.append((category, f"{name} ({n + 2})"))
+        yield {
+            "name": f"{rng.choice(ADJECTIVES)} {picks[0][1]} {rng.choice(DISHES)}",
+            "description": " ".join(rng.sample(SENTENCES, rng.randint(1, 3))),
+            "instructions": "\n".join(f"{n}. {step}" for n, step in
+                                      enumerate(rng.sample(STEPS, rng.randint(4, len(STEPS))), 1)),
+            "diet_type": int(rng.choice(list(DietType))),
+            "meal_type": int(rng.choice(list(MealType))),
+            "meal_category": int(rng.choice(list(MealCategory))),
+            "preparation_time": rng.randint(5, 60),
+            "cooking_time": rng.choice([0, 10, 15, 20, 30, 45, 60, 90, 120, 240]),
+            "difficulty_level": int(rng.choice(list(DifficultyLevel))),
+            "video_url": f"https://videos.example.com/{i}" if rng.random() < 0.3 else None,
+            "rating": round(rng.uniform(1, 5), 1),
+            "number_of_servings": rng.randint(1, 8),
+            "ingredients": [
+                {"name": name, "category": category, "quantity": rng.randint(1, 500),
+                 "measurement_unit": int(rng.choice(list(MeasurementUnit)))}
+                for category, name in picks
+            ],
+        }
+
+
+def sample_jpeg(width: int, height: int, seed: int = 0) -> bytes:
+    """A photo-like JPEG (gradient plus grain), so encoded sizes land where real uploads do"""
+    from PIL import Image, ImageChops
+
+    rng = random.Random(seed)
+    gradient = Image.linear_gradient("L").resize((width, height))
+    grain = Image.effect_noise((width, height), 48)
+    channels = [ImageChops.add(gradient.rotate(rng.choice([0, 90, 180, 270]), expand=False), grain, 1.6)
+                for _ in range(3)]
+    out = io.BytesIO()
+    Image.merge("RGB", channels).save(out, "JPEG", quality=85)
+    return out.getvalue()
+
+
+def image_pool(seed: int = 0) -> list[dict]:
+    from apiapp.utils.imaging import THUMBNAIL_SIZE, make_thumbnail
+
+    pool = []
+    for n in range(IMAGE_POOL_SIZE):
+        width, height = IMAGE_SHAPES[n % len(IMAGE_SHAPES)]
+        data = sample_jpeg(width, height, seed + n)
+        thumbnail, thumbnail_type = make_thumbnail(data, THUMBNAIL_SIZE)
+        pool.append({"data": data, "width": width, "height": height,
+                     "thumbnail": thumbnail, "thumbnail_content_type": thumbnail_type})
+    return pool
+
+
+def seed_catalog(recipes: int, ingredients: int = 8, images: int = 1, seed: int = 0, image_data: bool = True) -> dict:
+    """
+    Insert the catalog through the bulk import path (so search indexing and signals run as in
+    production) and attach `images` image rows per recipe. Without image_data the rows carry
+    realistic metadata only, which is all the JSON endpoints read.
+    """
+    from apiapp import storage
+    from apiapp.importer import create_recipes
+    from apiapp.models import THUMBNAIL_READY, Image, Recipe
+    from apiapp.signals import recipes_bulk_changed
+    from apiapp.schemas.Recipe import RecipeCreate
+
+    rng = random.Random(seed)
+    pool = image_pool(seed) if image_data and images else []
+    recipe_ids, documents = [], recipe_documents(recipes, ingredients, seed)
+    while True:
+        batch = [RecipeCreate(**doc) for _, doc in zip(range(BATCH_SIZE), documents)]
+        if not batch:
+            break
+        rows = create_recipes(batch)
+        recipe_ids.extend(recipe.pk for recipe, _, _ in rows)
+
+        image_rows = []
+        for recipe, _, _ in rows:
+            for n in range(images):
+                width, height = rng.choice(IMAGE_SHAPES)
+                img = Image(recipe=recipe, filename=f"recipe-{recipe.pk}-{n}.jpg", content_type="image/jpeg",
+                            width=width, height=height, storage=storage.default_backend())
+                if pool:
+                    source = pool[rng.randrange(len(pool))]
+                    img.width, img.height = source["width"], source["height"]
+                    img.set_blob("data", source["data"])
+                    img.set_blob("thumbnail", source["thumbnail"])
+                    img.size = len(source["data"])
+                    img.thumbnail_content_type = source["thumbnail_content_type"]
+                    img.thumbnail_status = THUMBNAIL_READY
+                else:
+                    # ~0.25 bytes per pixel is typical for a quality-85 photo
+                    img.size = int(width * height * rng.uniform(0.18, 0.32))
+                    img.has_data = True
+                image_rows.append(img)
+        Image.objects.bulk_create(image_rows, batch_size=BATCH_SIZE)
+        # As the importer does after attaching images: stored documents pick them up
+        recipes_bulk_changed.send(sender=Recipe, recipe_ids=[recipe.pk for recipe, _, _ in rows])
+
+    return {"recipe_ids": recipe_ids, "recipes": recipes, "ingredients": recipes * ingredients,
+            "images": recipes * images}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--recipes", type=int, default=1000)
+    parser.add_argument("--ingredients", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    import json
+
+    for document in recipe_documents(args.recipes, args.ingredients, args.seed):
+        sys.stdout.write(json.dumps(document) + "\n")
+
+
+if __name__ == "__main__":
+    main()
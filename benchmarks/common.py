@@ -0,0 +1,113 @@
+"""
+Plumbing shared by the benchmark scripts: Django setup, a throwaway database, timing and
+result files. Nothing here talks to the network; everything runs in-process.
+"""
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+
+def setup() -> None:
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "mainapp.settings")
+    import django
+
+    django.setup()
+
+
+@contextmanager
+def benchmark_environment():
+    """
+    A test database created from the configured DATABASES (SQLite, or a local PostgreSQL) and a
+    temporary blob directory, both removed afterwards. DEBUG is off so queries are not logged,
+    and thumbnails are rendered inline since no worker runs.
+    """
+    from django.db import connection
+    from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        with tempfile.TemporaryDirectory(prefix="mealmaster-bench-") as blobs, override_settings(
+            DEBUG=False, ALLOWED_HOSTS=["testserver"], IMAGE_STORAGE_ROOT=blobs, THUMBNAIL_QUEUE_ENABLED=False,
+        ):
+            yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def summarize(samples: list[float], elapsed: float | None = None) -> dict:
+    """Per-call durations in seconds -> rate and latency percentiles in milliseconds"""
+    elapsed = sum(samples) if elapsed is None else elapsed
+    cuts = statistics.quantiles(samples, n=100, method="inclusive") if len(samples) > 1 else samples * 99
+    return {
+        "runs": len(samples),
+        "per_second": round(len(samples) / elapsed, 2) if elapsed else None,
+        "mean_ms": round(statistics.fmean(samples) * 1000, 3),
+        "p50_ms": round(cuts[49] * 1000, 3),
+        "p95_ms": round(cuts[94] * 1000, 3),
+        "p99_ms": round(cuts[98] * 1000, 3),
+    }
+
+
+def measure(fn, seconds: float, min_runs: int = 5) -> dict:
+    """Call fn repeatedly for about `seconds` (after one warm-up call) and summarize the timings"""
+    fn()
+    samples, started = [], time.perf_counter()
+    while len(samples) < min_runs or time.perf_counter() - started < seconds:
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return summarize(samples)
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=Path(__file__).resolve().parent,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment() -> dict:
+    import django
+    from django.db import connection
+
+    return {
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "database": connection.vendor,
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def write_results(suite: str, parameters: dict, results: dict, output: str | None = None) -> Path:
+    """
+    One JSON document per run: what was run, on what, and the numbers. Defaults to
+    benchmarks/results/<suite>-<UTC timestamp>.json; compare two with `python -m benchmarks.compare`.
+    """
+    created = datetime.now(timezone.utc)
+    path = Path(output) if output else RESULTS_DIR / f"{suite}-{created:%Y%m%dT%H%M%SZ}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    document = {
+        "suite": suite,
+        "created_at": created.isoformat(timespec="seconds"),
+        "environment": environment(),
+        "parameters": parameters,
+        "results": results,
+    }
+    path.write_text(json.dumps(document, indent=2, sort_keys=True) + "\n")
+    return path
@@ -0,0 +1,63 @@
+"""
+Compare two result files from the same suite and flag regressions.
+
+    python -m benchmarks.compare BASELINE.json CURRENT.json [--threshold 10]
+
+A measurement regresses when its throughput drops, or its p95 latency rises, by more than
+`threshold` percent. Exits with status 1 if anything regressed, so it can gate a release job.
+"""
+import argparse
+import json
+import sys
+
+
+def measurements(results: dict, prefix: str = ""):
+    """Flatten nested result dicts into (dotted name, measurement) pairs"""
+    for name, value in sorted(results.items()):
+        if isinstance(value, dict) and "per_second" in value:
+            yield prefix + name, value
+        elif isinstance(value, dict):
+            yield from measurements(value, f"{prefix}{name}.")
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> list[dict]:
+    before = dict(measurements(baseline["results"]))
+    rows = []
+    for name, after in measurements(current["results"]):
+        old = before.get(name)
+        if old is None or not old["per_second"] or not old["p95_ms"]:
+            continue
+        throughput = (after["per_second"] - old["per_second"]) / old["per_second"] * 100
+        p95 = (after["p95_ms"] - old["p95_ms"]) / old["p95_ms"] * 100
+        rows.append({
+            "name": name, "throughput_change": throughput, "p95_change": p95,
+            "regressed": throughput < -threshold or p95 > threshold,
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=10.0, help="allowed change in percent")
+    args = parser.parse_args()
+
+    with open(args.baseline) as fh:
+        baseline = json.load(fh)
+    with open(args.current) as fh:
+        current = json.load(fh)
+    if baseline["suite"] != current["suite"]:
+        sys.exit(f"cannot compare a {baseline['suite']!r} run with a {current['suite']!r} run")
+
+    rows = compare(baseline, current, args.threshold)
+    print(f"{baseline['environment'].get('git_revision')} -> {current['environment'].get('git_revision')}"
+          f" ({current['suite']}, threshold {args.threshold:g}%)")
+    for row in rows:
+        flag = "REGRESSED" if row["regressed"] else ""
+        print(f"  {row['name']:<44} throughput {row['throughput_change']:+7.1f}%   p95 {row['p95_change']:+7.1f}%   {flag}")
+    sys.exit(1 if any(row["regressed"] for row in rows) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+"""
+In-process HTTP load driver: every router, under both WSGI and ASGI, against a seeded catalog.
+
+    python -m benchmarks.load [--recipes 2000] [--requests 200] [--concurrency 4]
+                              [--servers wsgi asgi asgi-async] [--only recipes.detail ...] [--response-cache]
+                              [--client-latency 0.05] [--wsgi-threads 8]
+
+Requests go straight into Django's WSGIHandler / ASGIHandler (no sockets, no server process), so
+the numbers cover routing, middleware, views, the ORM and rendering. `concurrency` clients send
+requests back to back. Under WSGI each request holds one of `wsgi-threads` server threads until
+its client has the whole body; under ASGI the clients are tasks on one event loop, served by the
+sync handlers (asgi, through Django's thread pool) or by the async ones (asgi-async, the
+mainapp/urls_async.py deployment). --client-latency makes every client take that long to accept
+each chunk of a response, like a phone on a slow link. Every scenario reports throughput and
+p50/p95/p99 latency; non-2xx/304 responses are counted as errors.
+"""
+import argparse
+import asyncio
+import io
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from .common import benchmark_environment, setup, summarize, write_results
+
+HOST = "testserver"
+OK_STATUSES = {200, 201, 304}
+
+
+def scenarios(catalog: dict, rng: random.Random) -> dict:
+    """name -> callable returning (method, url, json body or None); ids are drawn per request"""
+    import json
+
+    from apiapp import search
+    from apiapp.models import Image, Ingredient
+
+    recipe_ids = catalog["recipe_ids"]
+    pages = max(1, min(20, len(recipe_ids) // 20))
+    image_ids = list(Image.objects.values_list("id", flat=True))
+    ingredient_ids = list(Ingredient.objects.values_list("id", flat=True)[:5000])
+    pantry = ["tomato", "onion", "garlic", "olive oil", "salt", "black pepper", "egg", "rice"]
+    words = ["tomato", "curry", "garlic", "roasted", "lemon", "soup", "chicken", "creamy"]
+
+    def get(path):
+        return lambda: ("GET", path() if callable(path) else path, None)
+
+    def recipe():
+        return rng.choice(recipe_ids)
+
+    def image():
+        return rng.choice(image_ids)
+
+    plan = {
+        "recipes.list": get(lambda: f"/api/recipes/?page={rng.randint(1, pages)}&page_size=20"),
+        "recipes.list_cursor": get("/api/recipes/?mode=cursor&page_size=20&sort=-rating"),
+        "recipes.list_filtered_facets": get(lambda: f"/api/recipes/?facets=true&diet_type={rng.randint(0, 2)}"
+                                            f"&max_cooking_time={rng.choice([20, 45, 90])}&page_size=20"),
+        "recipes.detail": get(lambda: f"/api/recipes/{recipe()}"),
+        "recipes.pantry": get(lambda: "/api/recipes/pantry?" + "&".join(f"have={p}" for p in rng.sample(pantry, 4))
+                              + "&max_missing=3"),
+        "recipes.shopping_list": lambda: ("POST", "/api/recipes/shopping-list", json.dumps({
+            "recipes": [{"recipe_id": recipe(), "servings": rng.randint(1, 6)} for _ in range(7)],
+        })),
+        "recipes.export_filtered": get(lambda: f"/api/recipes/export?diet_type={rng.randint(0, 2)}"
+                                       f"&meal_type={rng.randint(0, 2)}&difficulty_level={rng.randint(0, 2)}"),
+        "recipes.ingredients": get(lambda: f"/api/recipes/{recipe()}/ingredients"),
+        "recipes.images": get(lambda: f"/api/recipes/{recipe()}/images"),
+        "ingredients.by_recipe": get(lambda: f"/api/ingredients/?recipe_id={recipe()}"),
+        "ingredients.detail": get(lambda: f"/api/ingredients/{rng.choice(ingredient_ids)}"),
+    }
+    if search.backend():
+        plan["recipes.search"] = get(lambda: f"/api/recipes/search?q={rng.choice(words)}&page_size=20")
+    if image_ids:
+        plan.update({
+            "images.metadata": get(lambda: f"/api/images/{image()}"),
+            "images.by_recipe": get(lambda: f"/api/images/recipes/{recipe()}/images/"),
+            "images.raw": get(lambda: f"/api/images/{image()}/raw/"),
+            "images.thumbnail": get(lambda: f"/api/images/{image()}/thumb/"),
+            "images.variant": get(lambda: f"/api/images/{image()}/v/320.webp"),
+        })
+    return plan
+
+
+# -- WSGI ---------------------------------------------------------------------------------------
+
+def wsgi_call(handler, method: str, url: str, body: str | None, latency: float = 0.0) -> int:
+    parts = urlsplit(url)
+    payload = (body or "").encode()
+    environ = {
+        "REQUEST_METHOD": method,
+        "SCRIPT_NAME": "",
+        "PATH_INFO": parts.path,
+        "QUERY_STRING": parts.query,
+        "SERVER_NAME": HOST,
+        "SERVER_PORT": "80",
+        "SERVER_PROTOCOL": "HTTP/1.1",
+        "HTTP_HOST": HOST,
+        "CONTENT_TYPE": "application/json" if body else "",
+        "CONTENT_LENGTH": str(len(payload)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": "http",
+        "wsgi.input": io.BytesIO(payload),
+        "wsgi.errors": io.StringIO(),
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    status = []
+    result = handler(environ, lambda s, headers, exc_info=None: status.append(s))
+    try:
+        for _ in result:  # drain, including streamed bodies
+            if latency:
+                time.sleep(latency)
+    finally:
+        if hasattr(result, "close"):
+            result.close()
+    return int(status[0].split(" ", 1)[0])
+
+
+def run_wsgi(handler, make_request, requests: int, concurrency: int, latency: float = 0.0,
+             threads: int | None = None) -> tuple[list[float], int, float]:
+    # A server thread is taken from the request until the client has read the last byte
+    server_threads = threading.BoundedSemaphore(threads or concurrency)
+
+    def one(request):
+        t0 = time.perf_counter()
+        with server_threads:
+            status = wsgi_call(handler, *request, latency)
+        return time.perf_counter() - t0, status
+
+    # Drawn up front, so the same seed sends the same requests whatever the thread interleaving
+    batch = [make_request() for _ in range(requests)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(one, batch))
+    elapsed = time.perf_counter() - started
+    return [d for d, _ in outcomes], sum(1 for _, s in outcomes if s not in OK_STATUSES), elapsed
+
+
+# -- ASGI ---------------------------------------------------------------------------------------
+
+async def asgi_call(handler, method: str, url: str, body: str | None, latency: float = 0.0) -> int:
+    parts = urlsplit(url)
+    payload = (body or "").encode()
+    headers = [(b"host", HOST.encode())]
+    if body:
+        headers += [(b"content-type", b"application/json"), (b"content-length", str(len(payload)).encode())]
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method,
+        "scheme": "http", "path": parts.path, "raw_path": parts.path.encode(), "root_path": "",
+        "query_string": parts.query.encode(), "headers": headers,
+        "client": ("127.0.0.1", 50000), "server": (HOST, 80),
+    }
+    done = asyncio.Event()
+    sent_body = False
+    status = []
+
+    async def receive():
+        nonlocal sent_body
+        if not sent_body:
+            sent_body = True
+            return {"type": "http.request", "body": payload, "more_body": False}
+        await done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+        elif message["type"] == "http.response.body":
+            if latency:
+                await asyncio.sleep(latency)
+            if not message.get("more_body"):
+                done.set()
+
+    await handler(scope, receive, send)
+    done.set()
+    return status[0]
+
+
+def run_asgi(handler, make_request, requests: int, concurrency: int, latency: float = 0.0,
+             threads: int | None = None) -> tuple[list[float], int, float]:
+    async def main():
+        queue = [make_request() for _ in range(requests)][::-1]
+        samples, errors = [], 0
+
+        async def worker():
+            nonlocal errors
+            while queue:
+                method, url, body = queue.pop()
+                t0 = time.perf_counter()
+                status = await asgi_call(handler, method, url, body, latency)
+                samples.append(time.perf_counter() - t0)
+                errors += status not in OK_STATUSES
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return samples, errors, time.perf_counter() - started
+
+    return asyncio.run(main())
+
+
+# -- driver -------------------------------------------------------------------------------------
+
+def run(args, catalog: dict) -> dict:
+    from django.core.handlers.asgi import ASGIHandler
+    from django.core.handlers.wsgi import WSGIHandler
+    from django.test.utils import override_settings
+
+    plan = scenarios(catalog, random.Random(args.seed))
+    if args.only:
+        plan = {name: make for name, make in plan.items() if name in args.only}
+    # server -> (handler, runner, URLconf)
+    servers = {
+        "wsgi": (WSGIHandler(), run_wsgi, "mainapp.urls"),
+        "asgi": (ASGIHandler(), run_asgi, "mainapp.urls"),
+        "asgi-async": (ASGIHandler(), run_asgi, "mainapp.urls_async"),
+    }
+    options = {"latency": args.client_latency, "threads": args.wsgi_threads}
+
+    results = {}
+    for server in args.servers:
+        handler, runner, urlconf = servers[server]
+        results[server] = {}
+        with override_settings(RESPONSE_CACHE_ENABLED=args.response_cache, ROOT_URLCONF=urlconf):
+            for name, make_request in plan.items():
+                # Warm-up: first renders (variants, pantry index, facet counts) are not measured
+                runner(handler, make_request, args.concurrency, args.concurrency, **options)
+                samples, errors, elapsed = runner(handler, make_request, args.requests, args.concurrency, **options)
+                results[server][name] = {**summarize(samples, elapsed), "errors": errors}
+                print_line(server, name, results[server][name])
+    return results
+
+
+def print_line(server: str, name: str, result: dict) -> None:
+    print(f"  {server:<10} {name:<30} {result['per_second']:>9.1f} req/s   p50 {result['p50_ms']:>8.2f} ms"
+          f"   p95 {result['p95_ms']:>8.2f} ms   p99 {result['p99_ms']:>8.2f} ms"
+          + (f"   errors {result['errors']}" if result["errors"] else ""))
+
+
+def add_arguments(parser) -> None:
+    parser.add_argument("--recipes", type=int, default=2000)
+    parser.add_argument("--ingredients", type=int, default=8)
+    parser.add_argument("--images", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--requests", type=int, default=200, help="measured requests per scenario and server")
+    parser.add_argument("--concurrency", type=int, default=4, help="clients sending requests at the same time")
+    parser.add_argument("--wsgi-threads", type=int, help="WSGI server threads (default: one per client)")
+    parser.add_argument("--client-latency", type=float, default=0.0, metavar="SECONDS",
+                        help="time each client takes to accept a chunk of a response (slow mobile links)")
+    parser.add_argument("--servers", nargs="+", choices=["wsgi", "asgi", "asgi-async"],
+                        default=["wsgi", "asgi", "asgi-async"])
+    parser.add_argument("--only", nargs="+", metavar="SCENARIO", help="run only these scenarios")
+    parser.add_argument("--response-cache", action="store_true",
+                        help="leave the response cache on (off by default, so every request reaches the view)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_arguments(parser)
+    parser.add_argument("--output", help="results file (default: benchmarks/results/load-<timestamp>.json)")
+    args = parser.parse_args()
+
+    setup()
+    from .catalog import seed_catalog
+
+    with benchmark_environment():
+        catalog = seed_catalog(args.recipes, args.ingredients, args.images, args.seed)
+        results = run(args, catalog)
+        parameters = {k: v for k, v in vars(args).items() if k != "output"}
+        path = write_results("load", parameters, results, args.output)
+    print(f"results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
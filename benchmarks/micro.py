@@ -0,0 +1,104 @@
+"""
+Micro-benchmarks for the hot helpers, each timed in isolation on a seeded catalog:
+
+  recipe_to_schema   model instances (prefetched) -> RecipeRead, per recipe
+  make_thumbnail     JPEG upload -> stored thumbnail, per image shape
+  serialization      a full recipe page through the schema path, the values()+orjson path,
+                     the stored documents, and the encoder alone
+
+    python -m benchmarks.micro [--recipes 100] [--ingredients 8] [--images 1] [--seconds 2] [--output FILE]
+"""
+import argparse
+
+from .common import benchmark_environment, measure, setup, write_results
+
+
+def bench_recipe_to_schema(request, page_size: int, seconds: float) -> dict:
+    from apiapp.endpoints.recipes import recipe_queryset, recipe_to_schema
+
+    recipes = list(recipe_queryset().order_by("id")[:page_size])
+    result = measure(lambda: [recipe_to_schema(request, r) for r in recipes], seconds)
+    # Reported per recipe rather than per page
+    result["recipes_per_second"] = round(result["per_second"] * len(recipes), 1)
+    return result
+
+
+def bench_make_thumbnail(seconds: float) -> dict:
+    from apiapp.utils.imaging import THUMBNAIL_SIZE, make_thumbnail
+
+    from .catalog import IMAGE_SHAPES, sample_jpeg
+
+    results = {}
+    for width, height in IMAGE_SHAPES:
+        data = sample_jpeg(width, height)
+        result = measure(lambda: make_thumbnail(data, THUMBNAIL_SIZE), seconds)
+        result["source_bytes"] = len(data)
+        results[f"{width}x{height}"] = result
+    return results
+
+
+def bench_serialization(request, page_size: int, seconds: float) -> dict:
+    from apiapp.models import Recipe
+    from apiapp.serializers import RECIPE_VALUES, recipe_documents
+    from apiapp.utils.renderers import dumps
+
+    from .serialization import fast_page, legacy_page, stored_page
+
+    documents = recipe_documents(request, Recipe.objects.order_by("id").values(*RECIPE_VALUES)[:page_size])
+    envelope = {"status": "success", "data": {"items": documents}}
+    return {
+        "schema_page": measure(lambda: legacy_page(request, page_size), seconds),
+        "values_page": measure(lambda: fast_page(request, page_size), seconds),
+        "stored_page": measure(lambda: stored_page(request, page_size), seconds),
+        "encode_only": {**measure(lambda: dumps(envelope), seconds), "bytes": len(dumps(envelope))},
+    }
+
+
+def run(args) -> dict:
+    from django.test import RequestFactory
+
+    request = RequestFactory().get("/api/recipes/")
+    return {
+        "recipe_to_schema": bench_recipe_to_schema(request, args.recipes, args.seconds),
+        "make_thumbnail": bench_make_thumbnail(args.seconds),
+        "serialization": bench_serialization(request, args.recipes, args.seconds),
+    }
+
+
+def add_arguments(parser) -> None:
+    parser.add_argument("--recipes", type=int, default=100, help="catalog size, and the page size measured")
+    parser.add_argument("--ingredients", type=int, default=8)
+    parser.add_argument("--images", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--seconds", type=float, default=2.0, help="time spent on each measurement")
+
+
+def print_results(results: dict, prefix: str = "") -> None:
+    for name, value in results.items():
+        if isinstance(value, dict) and "p50_ms" in value:
+            print(f"  {prefix + name:<36} {value['per_second']:>10.1f}/s   p50 {value['p50_ms']:>8.3f} ms"
+                  f"   p95 {value['p95_ms']:>8.3f} ms   p99 {value['p99_ms']:>8.3f} ms")
+        elif isinstance(value, dict):
+            print_results(value, f"{prefix}{name}.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_arguments(parser)
+    parser.add_argument("--output", help="results file (default: benchmarks/results/micro-<timestamp>.json)")
+    args = parser.parse_args()
+
+    setup()
+    from .catalog import seed_catalog
+
+    with benchmark_environment():
+        seed_catalog(args.recipes, args.ingredients, args.images, args.seed, image_data=False)
+        results = run(args)
+        parameters = {k: v for k, v in vars(args).items() if k != "output"}
+        path = write_results("micro", parameters, results, args.output)
+    print_results(results)
+    print(f"results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Serializations per second for a 100-recipe page: through the schemas, through the values() +
+orjson fast path, and spliced from the stored documents (read_model.py).
+
+    python -m benchmarks.serialization [--recipes 100] [--seconds 3]
+
+Runs against a throwaway test database created from the configured DATABASES; the same page
+is also part of `python -m benchmarks.micro`, which records the numbers.
+"""
+import argparse
+import json
+
+from .common import benchmark_environment, measure, setup
+
+
+def legacy_page(request, page_size):
+    """The previous path: model instances -> RecipeRead -> .dict() -> APISuccess -> JSONEncoder"""
+    from ninja.responses import Response
+
+    from apiapp.endpoints.recipes import recipe_prefetches, recipe_to_schema
+    from apiapp.models import Recipe
+    from apiapp.schemas.responses import APISuccess
+
+    rows = list(Recipe.objects.order_by("id").prefetch_related(*recipe_prefetches())[:page_size])
+    items = [recipe_to_schema(request, r).dict() for r in rows]
+    return Response(APISuccess(status="success", data={"items": items}), status=200).content
+
+
+def fast_page(request, page_size):
+    """The current path: .values() rows -> plain dicts -> orjson, envelope included"""
+    from apiapp.models import Recipe
+    from apiapp.serializers import RECIPE_VALUES, recipe_documents
+    from apiapp.utils.utils import success
+
+    rows = list(Recipe.objects.order_by("id").values(*RECIPE_VALUES)[:page_size])
+    return success({"items": recipe_documents(request, rows)}).content
+
+
+def stored_page(request, page_size):
+    """The stored path: rows joined to their rendered documents, spliced into the envelope"""
+    from apiapp.models import Recipe
+    from apiapp.read_model import DOCUMENT, stored_documents
+    from apiapp.utils.utils import success
+
+    rows = list(Recipe.objects.order_by("id").values("id", "updated_at", DOCUMENT)[:page_size])
+    return success({"items": stored_documents(request, rows)}).content
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--recipes", type=int, default=100)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    args = parser.parse_args()
+
+    setup()
+    from django.test import RequestFactory
+
+    from .catalog import seed_catalog
+
+    with benchmark_environment():
+        seed_catalog(args.recipes, image_data=False)
+        request = RequestFactory().get("/api/recipes/")
+        legacy, fast = legacy_page(request, args.recipes), fast_page(request, args.recipes)
+        assert json.loads(legacy) == json.loads(fast), "fast path output differs from the schema path"
+        assert stored_page(request, args.recipes) == fast, "stored documents differ from the fast path"
+
+        print(f"{args.recipes}-recipe page, {len(fast):,} bytes")
+        before = measure(lambda: legacy_page(request, args.recipes), args.seconds)
+        after = measure(lambda: fast_page(request, args.recipes), args.seconds)
+        stored = measure(lambda: stored_page(request, args.recipes), args.seconds)
+    print(f"  before (schemas + json):   {before['per_second']:8.1f} pages/s  ({before['runs']} runs)")
+    print(f"  after  (values + orjson):  {after['per_second']:8.1f} pages/s  ({after['runs']} runs)")
+    print(f"  stored documents:          {stored['per_second']:8.1f} pages/s  ({stored['runs']} runs)")
+    print(f"  speedup: {after['per_second'] / before['per_second']:.2f}x, "
+          f"stored {stored['per_second'] / before['per_second']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
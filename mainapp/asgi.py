@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mainapp.settings')
+# Async endpoints (mainapp/urls_async.py); ASYNC_API=0 runs the sync ones on the thread pool
+os.environ.setdefault('ASYNC_API', '1')
 
 application = get_asgi_application()
@@ -0,0 +1,44 @@
+"""
+Read-replica routing. Writes always go to the primary ("default"). Reads go to the replica
+chosen for the current request by apiapp.middleware.ReplicaRoutingMiddleware, which only
+picks one for GET/HEAD requests from clients that have not written recently; everything else
+(other methods, management commands, the thumbnail worker) reads from the primary.
+"""
+import contextvars
+import random
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Alias serving this request's reads; None means the primary. A context variable, so it follows
+# the request into sync_to_async threads under ASGI.
+read_alias = contextvars.ContextVar("read_alias", default=None)
+
+
+def replicas() -> list[str]:
+    return list(getattr(settings, "DATABASE_REPLICAS", ()))
+
+
+def choose_replica() -> str | None:
+    aliases = replicas()
+    return random.choice(aliases) if aliases else None
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        alias = read_alias.get()
+        # Inside a transaction on the primary, reads must see its uncommitted writes
+        if alias is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema through replication
+        return db not in replicas()
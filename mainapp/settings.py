@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 import os
+import sys
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -41,6 +42,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so its timings cover the whole middleware stack
+    'apiapp.middleware.MetricsMiddleware',
+    'apiapp.middleware.RequestIdMiddleware',
+    'apiapp.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -50,7 +55,10 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
-ROOT_URLCONF = 'mainapp.urls'
+# ASYNC_API=1 (the default in mainapp/asgi.py) serves the async handlers, so ASGI requests
+# do not each take a thread; WSGI keeps the sync ones
+ASYNC_API = os.environ.get("ASYNC_API", "0") == "1"
+ROOT_URLCONF = 'mainapp.urls_async' if ASYNC_API else 'mainapp.urls'
 
 TEMPLATES = [
     {
@@ -73,17 +81,48 @@ WSGI_APPLICATION = 'mainapp.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
+# Connections are reused instead of opened per request: DB_POOL=1 uses a psycopg pool per
+# process (psycopg[pool] required), otherwise each thread keeps its connection for
+# DB_CONN_MAX_AGE seconds. Either way a connection is health-checked before it is reused.
+DB_POOL = os.environ.get("DB_POOL", "0") == "1"
+
+
+def postgres(host='localhost', port='5432'):
+    database = {
         'ENGINE': 'django.db.backends.postgresql',
         'NAME': 'mmdb',
         'USER': 'havalo' ,
         'PASSWORD': 'admin',
-        'HOST': 'localhost',
-        'PORT': '5432',
+        'HOST': host,
+        'PORT': port,
+        'CONN_HEALTH_CHECKS': True,
     }
+    if DB_POOL:
+        database['OPTIONS'] = {'pool': {
+            'min_size': int(os.environ.get("DB_POOL_MIN_SIZE", "2")),
+            'max_size': int(os.environ.get("DB_POOL_MAX_SIZE", "10")),
+            'timeout': 10,
+        }}
+    else:
+        database['CONN_MAX_AGE'] = int(os.environ.get("DB_CONN_MAX_AGE", "60"))
+    return database
+
+
+DATABASES = {
+    'default': postgres(),
 }
 
+# Read replicas, e.g. DATABASE_REPLICAS="replica1:5432,replica2:5432". GET requests read from one
+# of them (mainapp/db_router.py); a client that writes reads from the primary for the next
+# REPLICA_PIN_SECONDS, which should cover the replication lag. Tests run replicas as mirrors.
+DATABASE_REPLICAS = []
+for i, address in enumerate(filter(None, os.environ.get("DATABASE_REPLICAS", "").split(",")), 1):
+    host, _, port = address.strip().partition(":")
+    DATABASES[f'replica_{i}'] = {**postgres(host, port or '5432'), 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(f'replica_{i}')
+DATABASE_ROUTERS = ['mainapp.db_router.ReplicaRouter']
+REPLICA_PIN_SECONDS = 10
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -126,48 +165,93 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
-# Create logs directory if missing 
-os.makedirs(BASE_DIR / "logs", exist_ok=True)
+# Image blob storage: "filesystem" (content-addressed directory keyed by SHA-256)
+# or "database" (BinaryField columns). Existing rows move with `manage.py migrate_image_blobs`.
+IMAGE_STORAGE_BACKEND = os.environ.get("IMAGE_STORAGE_BACKEND", "filesystem")
+IMAGE_STORAGE_ROOT = BASE_DIR / "media" / "blobs"
+
+# Thumbnails are rendered by `manage.py run_thumbnail_worker`; set to False to render inline
+THUMBNAIL_QUEUE_ENABLED = os.environ.get("THUMBNAIL_QUEUE_ENABLED", "1") != "0"
+
+# Uploads: the size cap is enforced while the body streams in, and anything over
+# FILE_UPLOAD_MAX_MEMORY_SIZE spools to a temp file instead of memory
+IMAGE_MAX_UPLOAD_BYTES = 2 * 1024 * 1024
+FILE_UPLOAD_MAX_MEMORY_SIZE = 256 * 1024
+FILE_UPLOAD_HANDLERS = [
+    "apiapp.utils.uploads.MaxSizeUploadHandler",
+    "django.core.files.uploadhandler.MemoryFileUploadHandler",
+    "django.core.files.uploadhandler.TemporaryFileUploadHandler",
+]
 
+# Widths served by /api/images/{id}/v/{width}.{webp|jpeg|png} and the in-process cache for hot variants
+IMAGE_VARIANT_WIDTHS = (160, 320, 640, 960, 1280)
+IMAGE_VARIANT_CACHE_BYTES = 32 * 1024 * 1024
+
+# Shared cache for response caching, version counters and cached counts. Set REDIS_URL when
+# running several processes; the local-memory default is per process.
+if os.environ.get("REDIS_URL"):
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.redis.RedisCache", "LOCATION": os.environ["REDIS_URL"]}}
+else:
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+# Recipe responses (detail and list pages) cached per version; see apiapp/response_cache.py.
+# On by default only with REDIS_URL: the version counters a write bumps must be shared by every
+# worker process, or the others keep answering from their own copies until those expire.
+RESPONSE_CACHE_ENABLED = os.environ.get("RESPONSE_CACHE_ENABLED", "1" if os.environ.get("REDIS_URL") else "0") != "0"
+RESPONSE_CACHE_SECONDS = 300
+RESPONSE_CACHE_LOCAL_BYTES = 16 * 1024 * 1024
+
+# Request/DB/thumbnail metrics, served in Prometheus format at /api/metrics. With several worker
+# processes (gunicorn, uvicorn --workers) point METRICS_MULTIPROC_DIR at a directory they share,
+# emptied on deploy; each process writes its totals there and any of them can answer a scrape.
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") != "0"
+METRICS_MULTIPROC_DIR = os.environ.get("METRICS_MULTIPROC_DIR") or None
+METRICS_FLUSH_SECONDS = 2.0
+
+# JSON log file, logs/api.log unless LOG_FILE says otherwise; `manage.py test` writes none, so
+# the suite leaves nothing behind in the tree
+TESTING = sys.argv[1:2] == ["test"]
+LOG_FILE = None if TESTING else os.environ.get("LOG_FILE") or os.path.join(BASE_DIR, "logs", "api.log")
+
+# Create logs directory if missing
+if LOG_FILE:
+    os.makedirs(os.path.dirname(LOG_FILE), exist_ok=True)
+
+# Request threads only enqueue log records; a background thread writes them as JSON lines to
+# LOG_FILE (rotated by size) and the console. Repeated warnings are rate limited per logger
+# and message, and every record logged during a request carries its X-Request-ID.
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
-    "formatters": {
-        "verbose": {
-            "format": "[{asctime}] {levelname} {name} - {message}",
-            "style": "{",
-        },
-        "simple": {
-            "format": "{levelname} {message}",
-            "style": "{",
+    "filters": {
+        "rate_limit": {
+            "()": "apiapp.utils.log.RateLimitFilter",
+            "burst": 20,
+            "seconds": 60,
         },
     },
     "handlers": {
-        "console": {
-            "class": "logging.StreamHandler",
-            "formatter": "verbose",
-        },
-        "file": {
-            "class": "logging.FileHandler",
-            "filename": os.path.join(BASE_DIR, "logs", "api.log"),
-            "formatter": "verbose",
+        "background": {
+            "class": "apiapp.utils.log.BackgroundHandler",
+            "filename": LOG_FILE,
+            "max_bytes": 10 * 1024 * 1024,
+            "backup_count": 5,
+            "console": True,
+            "filters": ["rate_limit"],
         },
     },
     "root": {
-        "handlers": ["console", "file"],
+        "handlers": ["background"],
         "level": "INFO",
     },
     "loggers": {
         "django": {
-            "handlers": ["console", "file"],
             "level": "INFO",
-            "propagate": True,
         },
         "api": {
-            "handlers": ["console", "file"],
+            "handlers": ["background"],
             "level": "DEBUG",
             "propagate": False,
         },
     },
 }
-
@@ -0,0 +1,14 @@
+"""
+URL configuration for the ASGI deployment (see mainapp/asgi.py): the same routes as
+mainapp/urls.py, with the API answered by its async handlers.
+"""
+from django.contrib import admin
+from django.shortcuts import redirect
+from django.urls import path
+from apiapp.api import async_api
+
+urlpatterns = [
+    path('admin/', admin.site.urls),
+    path("api/", async_api.urls),
+    path("", lambda request: redirect("api/docs")),
+]